@@ -73,6 +73,7 @@ class BotDatabase:
         ''')
         try: cursor.execute('ALTER TABLE subscriptions ADD COLUMN invite_status TEXT DEFAULT "pending"')
         except: pass
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_end ON subscriptions (status, end_date)')
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS transactions (
@@ -94,9 +95,16 @@ class BotDatabase:
                 type TEXT NOT NULL,
                 schedule_time TEXT,
                 message TEXT NOT NULL,
-                last_sent TIMESTAMP
+                last_sent TIMESTAMP,
+                next_run_at TIMESTAMP,
+                is_active BOOLEAN DEFAULT 1
             )
         ''')
+        try: cursor.execute('ALTER TABLE scheduled_messages ADD COLUMN next_run_at TIMESTAMP')
+        except: pass
+        try: cursor.execute('ALTER TABLE scheduled_messages ADD COLUMN is_active BOOLEAN DEFAULT 1')
+        except: pass
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scheduled_messages_next ON scheduled_messages (is_active, next_run_at)')
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS custom_notifications (
@@ -106,9 +114,13 @@ class BotDatabase:
                 frequency TEXT NOT NULL,
                 schedule_time TEXT NOT NULL,
                 is_active BOOLEAN DEFAULT 1,
-                last_sent TIMESTAMP
+                last_sent TIMESTAMP,
+                next_run_at TIMESTAMP
             )
         ''')
+        try: cursor.execute('ALTER TABLE custom_notifications ADD COLUMN next_run_at TIMESTAMP')
+        except: pass
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_custom_notifications_next ON custom_notifications (is_active, next_run_at)')
 
         # NEW: System Settings Table (Key-Value)
         cursor.execute('''
@@ -123,6 +135,177 @@ class BotDatabase:
             VALUES ('maintenance_mode', '0')
         ''')
 
+        # Symbol universe scanned by the signal job
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS symbols (
+                symbol TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                source TEXT NOT NULL DEFAULT 'auto',
+                enabled BOOLEAN DEFAULT 1,
+                timeframe TEXT DEFAULT '15m',
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        try: cursor.execute('ALTER TABLE symbols ADD COLUMN timeframe TEXT DEFAULT "15m"')
+        except: pass
+
+        # Signal cooldown / free group throttle state (key = symbol or special key)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS signal_state (
+                key TEXT PRIMARY KEY,
+                last_sent TIMESTAMP NOT NULL
+            )
+        ''')
+
+        # Every BUY signal sent, followed up by SignalTracker until TP3 / Stop / expiry
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS signal_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT NOT NULL,
+                category TEXT,
+                timeframe TEXT,
+                source TEXT DEFAULT 'auto',
+                entry REAL NOT NULL,
+                stop REAL NOT NULL,
+                tp1 REAL NOT NULL,
+                tp2 REAL NOT NULL,
+                tp3 REAL NOT NULL,
+                opened_at TIMESTAMP NOT NULL,
+                status TEXT DEFAULT 'open', -- open, closed
+                hit_level INTEGER DEFAULT 0, -- Take profits reached (0-3)
+                outcome TEXT, -- tp3, sl, expired
+                result_r REAL,
+                closed_at TIMESTAMP,
+                chat_id INTEGER,
+                message_id INTEGER
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_signal_ledger_status ON signal_ledger (status)')
+
+        # /announce broadcasts with per-recipient progress (resumable)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message TEXT NOT NULL,
+                parse_mode TEXT,
+                created_by INTEGER,
+                status TEXT DEFAULT 'running', -- running, done, cancelled
+                total INTEGER DEFAULT 0,
+                sent INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                broadcast_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT DEFAULT 'pending', -- pending, sent, failed
+                error TEXT,
+                PRIMARY KEY (broadcast_id, user_id),
+                FOREIGN KEY (broadcast_id) REFERENCES broadcasts (id)
+            )
+        ''')
+
+        # Failed sends waiting for a retry ('pending') or given up ('dead')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT UNIQUE NOT NULL,
+                method TEXT NOT NULL DEFAULT 'send_message',
+                chat_id INTEGER,
+                payload TEXT NOT NULL, -- JSON kwargs of the Bot API call
+                priority INTEGER DEFAULT 3,
+                status TEXT DEFAULT 'pending', -- pending, sent, dead
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)')
+
+        # Who is in each premium group, kept up to date from chat_member updates
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS group_members (
+                group_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL, -- member, administrator, creator, restricted, left, kicked
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (group_id, user_id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_group_members_user ON group_members (user_id)')
+
+        # Single-use invite links created ahead of demand, claimed on payment confirmation
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS invite_links (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                link TEXT UNIQUE NOT NULL,
+                expires_at TIMESTAMP NOT NULL,
+                status TEXT DEFAULT 'available', -- available, claimed
+                claimed_by INTEGER,
+                subscription_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                claimed_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invite_links_pool ON invite_links (group_id, status, expires_at)')
+
+        # Expiry reminders already handled, one row per subscription and stage (3d, 1d, expired)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reminder_ledger (
+                subscription_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                status TEXT DEFAULT 'pending', -- pending, sent, failed (owned by the outbox from then on), skipped
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP,
+                PRIMARY KEY (subscription_id, stage)
+            )
+        ''')
+
+        # Hashes of the news links already posted (see modules/news_dedup.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS news_seen (
+                hash INTEGER PRIMARY KEY,
+                seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                category TEXT,
+                simhash INTEGER -- Story fingerprint for near-duplicate checks
+            )
+        ''')
+        try: cursor.execute('ALTER TABLE news_seen ADD COLUMN category TEXT')
+        except: pass
+        try: cursor.execute('ALTER TABLE news_seen ADD COLUMN simhash INTEGER')
+        except: pass
+
+        # News feed registry, each feed polled on its own (adaptive) cadence
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS news_feeds (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                category TEXT NOT NULL,
+                enabled BOOLEAN DEFAULT 1,
+                interval_seconds INTEGER DEFAULT 3600,
+                rate_per_hour REAL, -- Smoothed new entries per hour
+                next_poll_at TIMESTAMP,
+                last_polled_at TIMESTAMP,
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # HTTP validators of the news feeds, for conditional GET
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS feed_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         conn.commit()
         conn.close()
 
@@ -282,10 +465,11 @@ class BotDatabase:
             INSERT INTO subscriptions (user_id, package_id, start_date, end_date, status, invite_status)
             VALUES (?, ?, ?, ?, 'active', 'pending')
         ''', (user_id, package_id, start_date, end_date))
+        sub_id = cursor.lastrowid
         
         conn.commit()
         conn.close()
-        return True
+        return sub_id
 
     def get_user_subscription(self, user_id: int):
         conn = self.get_connection()
@@ -316,42 +500,84 @@ class BotDatabase:
             FROM subscriptions s
             JOIN users u ON s.user_id = u.user_id
             JOIN packages p ON s.package_id = p.id
-            WHERE s.status = 'active' AND s.invite_status = 'pending'
+            WHERE s.status = 'active' AND s.invite_status != 'joined'
         ''')
         subs = cursor.fetchall()
         conn.close()
         return subs
 
-    def check_expiring_soon(self, days=3):
+    def get_due_reminders(self, stage, days, now):
+        """
+        Active subscriptions ending in (now, now + days] without a `stage` row
+        in the reminder ledger. Subscriptions that started less than `days`
+        before their end (the stage's window opened before they were bought)
+        are left out.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        target_date = (datetime.datetime.now() + datetime.timedelta(days=days)).date()
-        
         cursor.execute('''
-            SELECT s.*, u.username 
+            SELECT s.*, u.username
             FROM subscriptions s
             JOIN users u ON s.user_id = u.user_id
-            WHERE s.status = 'active' 
-            AND date(s.end_date) = ?
-        ''', (target_date.isoformat(),))
-        
+            WHERE s.status = 'active'
+            AND s.end_date > ? AND s.end_date <= ?
+            AND julianday(s.end_date) - julianday(s.start_date) >= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM reminder_ledger r WHERE r.subscription_id = s.id AND r.stage = ?
+            )
+        ''', (now, now + datetime.timedelta(days=days), days, stage))
         results = cursor.fetchall()
         conn.close()
         return results
 
-    def check_expired(self):
+    def claim_reminders(self, items):
+        """
+        Insert (subscription_id, stage, status) ledger rows; returns the
+        (subscription_id, stage) pairs this call inserted. Rows another
+        process already holds are left out, so every reminder is sent once.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        claimed = []
+        for sub_id, stage, status in items:
+            cursor.execute(
+                'INSERT OR IGNORE INTO reminder_ledger (subscription_id, stage, status) VALUES (?, ?, ?)',
+                (sub_id, stage, status)
+            )
+            if cursor.rowcount:
+                claimed.append((sub_id, stage))
+        conn.commit()
+        conn.close()
+        return claimed
+
+    def set_reminder_status(self, items):
+        """
+        items: (status, subscription_id, stage); sent_at is only set for 'sent'.
+        A 'failed' row is not picked up again: the send was handed to the
+        outbox under the same key, which retries it or dead-letters it.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         now = datetime.datetime.now()
-        
+        cursor.executemany(
+            'UPDATE reminder_ledger SET status = ?, sent_at = ? WHERE subscription_id = ? AND stage = ?',
+            [(status, now if status == 'sent' else None, sub_id, stage) for status, sub_id, stage in items]
+        )
+        conn.commit()
+        conn.close()
+
+    def get_expired_between(self, since, until):
+        """Active subscriptions with `since < end_date <= until` and their package assets (end_date index)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
         cursor.execute('''
-            SELECT s.*, u.username 
+            SELECT s.*, u.username, p.assets
             FROM subscriptions s
             JOIN users u ON s.user_id = u.user_id
-            WHERE s.status = 'active' 
-            AND s.end_date < ?
-        ''', (now,))
-        
+            LEFT JOIN packages p ON s.package_id = p.id
+            WHERE s.status = 'active'
+            AND s.end_date > ? AND s.end_date <= ?
+        ''', (since, until))
         results = cursor.fetchall()
         conn.close()
         return results
@@ -363,6 +589,34 @@ class BotDatabase:
         conn.commit()
         conn.close()
 
+    def expire_subscriptions(self, sub_ids):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE subscriptions SET status = "expired" WHERE id = ?', [(i,) for i in sub_ids])
+        conn.commit()
+        conn.close()
+
+    def get_active_assets(self, user_ids):
+        """{user_id: [package assets]} of subscriptions that are active and not past their end date."""
+        user_ids = list(set(user_ids))
+        now = datetime.datetime.now()
+        result = {}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            cursor.execute(f'''
+                SELECT s.user_id, p.assets
+                FROM subscriptions s
+                JOIN packages p ON s.package_id = p.id
+                WHERE s.status = 'active' AND s.end_date >= ?
+                AND s.user_id IN ({",".join("?" * len(chunk))})
+            ''', (now, *chunk))
+            for r in cursor.fetchall():
+                result.setdefault(r['user_id'], []).append(r['assets'])
+        conn.close()
+        return result
+
     # --- Role Management ---
     def create_role(self, name: str):
         try:
@@ -395,30 +649,91 @@ class BotDatabase:
         return True
 
     # --- Scheduled Messages ---
-    def add_scheduled_message(self, msg_type, time_str, message):
+    def add_scheduled_message(self, msg_type, time_str, message, next_run_at=None):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO scheduled_messages (type, schedule_time, message) VALUES (?, ?, ?)',
-                       (msg_type, time_str, message))
+        cursor.execute('INSERT INTO scheduled_messages (type, schedule_time, message, next_run_at) VALUES (?, ?, ?, ?)',
+                       (msg_type, time_str, message, next_run_at))
+        message_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        return message_id
+
+    def get_due_scheduled_messages(self, now, limit: int = 100):
+        """Active messages whose next run is due, oldest first (index range scan)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM scheduled_messages
+            WHERE is_active = 1 AND next_run_at <= ?
+            ORDER BY next_run_at LIMIT ?
+        ''', (now, limit))
+        msgs = cursor.fetchall()
+        conn.close()
+        return msgs
 
-    def get_due_scheduled_messages(self):
+    def get_unplanned_scheduled_messages(self):
+        """Active rows without next_run_at (created before it existed)."""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM scheduled_messages')
+        cursor.execute('SELECT * FROM scheduled_messages WHERE is_active = 1 AND next_run_at IS NULL')
         msgs = cursor.fetchall()
         conn.close()
         return msgs
 
+    def get_scheduled_messages(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM scheduled_messages WHERE is_active = 1 ORDER BY next_run_at')
+        msgs = cursor.fetchall()
+        conn.close()
+        return msgs
+
+    def set_scheduled_next_runs(self, items):
+        """items: (next_run_at, id); None deactivates the message."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            UPDATE scheduled_messages SET next_run_at = ?1, is_active = (?1 IS NOT NULL) WHERE id = ?2
+        ''', items)
+        conn.commit()
+        conn.close()
+
+    def delete_scheduled_message(self, message_id: int):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM scheduled_messages WHERE id = ?', (message_id,))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def claim_scheduled_run(self, message_id: int, run_at, next_run_at, text: str, parse_mode: str = None):
+        """
+        Advance a scheduled message from `run_at` to `next_run_at` and create its
+        broadcast in the same transaction. Returns the broadcast id, or None when
+        another process already claimed this run.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE scheduled_messages SET next_run_at = ?1, last_sent = ?2, is_active = (?1 IS NOT NULL)
+            WHERE id = ?3 AND next_run_at = ?4 AND is_active = 1
+        ''', (next_run_at, datetime.datetime.now(), message_id, run_at))
+        broadcast_id = None
+        if cursor.rowcount:
+            broadcast_id = self._insert_broadcast(cursor, text, None, parse_mode)
+        conn.commit()
+        conn.close()
+        return broadcast_id
+
     # --- Custom Notifications ---
-    def add_custom_notification(self, message, target_groups, frequency, schedule_time):
+    def add_custom_notification(self, message, target_groups, frequency, schedule_time, next_run_at=None):
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO custom_notifications (message, target_groups, frequency, schedule_time) 
-            VALUES (?, ?, ?, ?)
-        ''', (message, target_groups, frequency, schedule_time))
+            INSERT INTO custom_notifications (message, target_groups, frequency, schedule_time, next_run_at) 
+            VALUES (?, ?, ?, ?, ?)
+        ''', (message, target_groups, frequency, schedule_time, next_run_at))
         conn.commit()
         conn.close()
 
@@ -446,6 +761,31 @@ class BotDatabase:
         conn.commit()
         conn.close()
 
+    def set_notification_next_runs(self, items):
+        """items: (next_run_at, id); next_run_at None deactivates (one-off done, no future run)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            UPDATE custom_notifications SET next_run_at = ?1, is_active = (?1 IS NOT NULL) WHERE id = ?2
+        ''', items)
+        conn.commit()
+        conn.close()
+
+    def claim_notification_run(self, notif_id, run_at, next_run_at):
+        """
+        Advance a notification from `run_at` to `next_run_at` and stamp last_sent.
+        Only one caller wins for a given run (False = already fired or changed).
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE custom_notifications SET next_run_at = ?1, last_sent = ?2, is_active = (?1 IS NOT NULL)
+            WHERE id = ?3 AND next_run_at = ?4 AND is_active = 1
+        ''', (next_run_at, datetime.datetime.now(), notif_id, run_at))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
     # --- System Settings (NEW) ---
     def get_setting(self, key: str, default: str = None):
         conn = self.get_connection()
@@ -464,3 +804,544 @@ class BotDatabase:
         ''', (key, value))
         conn.commit()
         conn.close()
+
+    # --- Symbol Universe ---
+    def seed_symbols(self, items):
+        """items: list of (symbol, category, source). Only applied to an empty table."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) AS n FROM symbols')
+        if cursor.fetchone()['n'] == 0:
+            cursor.executemany('INSERT OR IGNORE INTO symbols (symbol, category, source) VALUES (?, ?, ?)', items)
+            conn.commit()
+        conn.close()
+
+    def add_symbol(self, symbol: str, category: str, source: str = 'auto', timeframe: str = '15m'):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('INSERT INTO symbols (symbol, category, source, timeframe) VALUES (?, ?, ?, ?)',
+                           (symbol, category, source, timeframe))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            conn.close()
+
+    def delete_symbol(self, symbol: str):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM symbols WHERE symbol = ?', (symbol,))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def set_symbol_enabled(self, symbol: str, enabled: bool):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('UPDATE symbols SET enabled = ? WHERE symbol = ?', (1 if enabled else 0, symbol))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def get_symbol(self, symbol: str):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM symbols WHERE symbol = ?', (symbol,))
+        row = cursor.fetchone()
+        conn.close()
+        return row
+
+    def get_symbols(self, enabled_only: bool = False):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        if enabled_only:
+            cursor.execute('SELECT * FROM symbols WHERE enabled = 1 ORDER BY category, symbol')
+        else:
+            cursor.execute('SELECT * FROM symbols ORDER BY category, symbol')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    # --- Signal State ---
+    def get_signal_state(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT key, last_sent FROM signal_state')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def save_signal_state(self, items):
+        """items: list of (key, last_sent datetime)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO signal_state (key, last_sent) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET last_sent = excluded.last_sent
+        ''', items)
+        conn.commit()
+        conn.close()
+
+    # --- Signal Ledger ---
+    def add_signal(self, symbol: str, category: str, timeframe: str, source: str, levels: dict, opened_at):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO signal_ledger (symbol, category, timeframe, source, entry, stop, tp1, tp2, tp3, opened_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (symbol, category, timeframe, source, levels['entry'], levels['stop'],
+              levels['tp1'], levels['tp2'], levels['tp3'], opened_at))
+        signal_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return signal_id
+
+    def set_signal_message(self, signal_id: int, chat_id: int, message_id: int):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('UPDATE signal_ledger SET chat_id = ?, message_id = ? WHERE id = ?', (chat_id, message_id, signal_id))
+        conn.commit()
+        conn.close()
+
+    def get_open_signals(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM signal_ledger WHERE status = 'open' ORDER BY id")
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def update_signals(self, items):
+        """items: list of (hit_level, status, outcome, result_r, closed_at, signal_id)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            UPDATE signal_ledger SET hit_level = ?, status = ?, outcome = ?, result_r = ?, closed_at = ?
+            WHERE id = ?
+        ''', items)
+        conn.commit()
+        conn.close()
+
+    def get_signal_stats(self, since=None):
+        """Per category outcome counts and R of signals opened after `since`."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT category,
+                   COUNT(*) AS total,
+                   SUM(status = 'open') AS open,
+                   SUM(status = 'closed') AS closed,
+                   SUM(hit_level >= 1) AS tp1,
+                   SUM(hit_level >= 2) AS tp2,
+                   SUM(hit_level >= 3) AS tp3,
+                   SUM(outcome = 'sl') AS sl,
+                   SUM(outcome = 'expired') AS expired,
+                   SUM(status = 'closed' AND result_r > 0) AS wins,
+                   COALESCE(SUM(result_r), 0) AS total_r
+            FROM signal_ledger
+            WHERE opened_at >= ?
+            GROUP BY category
+            ORDER BY category
+        ''', (since or datetime.datetime(1970, 1, 1),))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    # --- Broadcasts ---
+    def create_broadcast(self, message: str, created_by: int, parse_mode: str = None):
+        """Create a broadcast addressed to every user (recipient list is snapshotted now)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        broadcast_id = self._insert_broadcast(cursor, message, created_by, parse_mode)
+        conn.commit()
+        conn.close()
+        return broadcast_id
+
+    @staticmethod
+    def _insert_broadcast(cursor, message, created_by, parse_mode):
+        cursor.execute('INSERT INTO broadcasts (message, parse_mode, created_by) VALUES (?, ?, ?)',
+                       (message, parse_mode, created_by))
+        broadcast_id = cursor.lastrowid
+        cursor.execute('''
+            INSERT INTO broadcast_recipients (broadcast_id, user_id)
+            SELECT ?, user_id FROM users
+        ''', (broadcast_id,))
+        cursor.execute('UPDATE broadcasts SET total = ? WHERE id = ?', (cursor.rowcount, broadcast_id))
+        return broadcast_id
+
+    def get_broadcast(self, broadcast_id: int):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return row
+
+    def get_broadcasts(self, limit: int = 10):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?', (limit,))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def get_running_broadcasts(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id")
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def get_pending_recipients(self, broadcast_id: int, after: int = 0, limit: int = 500):
+        """Next page of recipients still to send, in user_id order (keyset pagination)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id FROM broadcast_recipients
+            WHERE broadcast_id = ? AND status = 'pending' AND user_id > ?
+            ORDER BY user_id LIMIT ?
+        ''', (broadcast_id, after, limit))
+        rows = [r['user_id'] for r in cursor.fetchall()]
+        conn.close()
+        return rows
+
+    def mark_broadcast_recipients(self, broadcast_id: int, items):
+        """items: list of (status, error, user_id). Updates the broadcast counters too."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            UPDATE broadcast_recipients SET status = ?, error = ?
+            WHERE broadcast_id = ? AND user_id = ?
+        ''', [(status, error, broadcast_id, user_id) for status, error, user_id in items])
+        sent = sum(1 for status, _, _ in items if status == 'sent')
+        cursor.execute('UPDATE broadcasts SET sent = sent + ?, failed = failed + ? WHERE id = ?',
+                       (sent, len(items) - sent, broadcast_id))
+        conn.commit()
+        conn.close()
+
+    def finish_broadcast(self, broadcast_id: int, status: str = 'done'):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                       (status, datetime.datetime.now(), broadcast_id))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    # --- Outbox ---
+    def add_outbox(self, key: str, method: str, chat_id: int, payload: str, priority: int,
+                   status: str, attempts: int, next_attempt_at, last_error: str):
+        """Returns False when `key` is already in the outbox (idempotency)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO outbox
+                (idempotency_key, method, chat_id, payload, priority, status, attempts, next_attempt_at, last_error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (key, method, chat_id, payload, priority, status, attempts, next_attempt_at, last_error))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def get_due_outbox(self, now, limit: int = 100):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY priority, next_attempt_at LIMIT ?
+        ''', (now, limit))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def update_outbox(self, items):
+        """items: list of (status, attempts, next_attempt_at, last_error, sent_at, id)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, sent_at = ?
+            WHERE id = ?
+        ''', items)
+        conn.commit()
+        conn.close()
+
+    def get_dead_letters(self, limit: int = 20):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM outbox WHERE status = 'dead' ORDER BY id DESC LIMIT ?", (limit,))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def get_outbox_counts(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) AS n FROM outbox GROUP BY status')
+        counts = {r['status']: r['n'] for r in cursor.fetchall()}
+        conn.close()
+        return counts
+
+    def retry_dead_letters(self, outbox_id: int = None):
+        """Move one (or every) dead letter back to the retry queue."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        now = datetime.datetime.now()
+        if outbox_id is None:
+            cursor.execute("UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE status = 'dead'", (now,))
+        else:
+            cursor.execute("UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ? WHERE id = ? AND status = 'dead'", (now, outbox_id))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+
+    def purge_outbox(self, before):
+        """Delete delivered rows older than `before`."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?", (before,))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+
+    # --- Group Membership ---
+    def set_member_status(self, group_id: int, user_id: int, status: str):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO group_members (group_id, user_id, status, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(group_id, user_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at
+        ''', (group_id, user_id, status, datetime.datetime.now()))
+        conn.commit()
+        conn.close()
+
+    def get_member_statuses(self, user_ids):
+        """{(group_id, user_id): status} of the given users (missing = never seen)."""
+        user_ids = list(set(user_ids))
+        result = {}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            cursor.execute(f'''
+                SELECT group_id, user_id, status FROM group_members
+                WHERE user_id IN ({",".join("?" * len(chunk))})
+            ''', chunk)
+            for r in cursor.fetchall():
+                result[(r['group_id'], r['user_id'])] = r['status']
+        conn.close()
+        return result
+
+    def get_group_member_ids(self, group_id: int, include_admins: bool = False):
+        statuses = ('member', 'restricted', 'administrator', 'creator') if include_admins else ('member', 'restricted')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT user_id FROM group_members
+            WHERE group_id = ? AND status IN ({",".join("?" * len(statuses))})
+        ''', (group_id, *statuses))
+        ids = {r['user_id'] for r in cursor.fetchall()}
+        conn.close()
+        return ids
+
+    def get_active_subscribers(self):
+        """(user_id, assets) of every active, unexpired subscription."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.user_id, p.assets
+            FROM subscriptions s
+            JOIN packages p ON s.package_id = p.id
+            WHERE s.status = 'active' AND s.end_date >= ?
+        ''', (datetime.datetime.now(),))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def mark_joined(self, user_id: int):
+        """A subscriber showed up in a premium group: their pending invite worked."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE subscriptions SET invite_status = 'joined'
+            WHERE user_id = ? AND status = 'active' AND invite_status != 'joined'
+        ''', (user_id,))
+        conn.commit()
+        conn.close()
+
+    # --- Invite Link Pool ---
+    def add_invite_links(self, items):
+        """items: (group_id, link, expires_at)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('INSERT OR IGNORE INTO invite_links (group_id, link, expires_at) VALUES (?, ?, ?)', items)
+        conn.commit()
+        conn.close()
+
+    def count_invite_links(self, valid_until):
+        """{group_id: available links still valid at `valid_until`}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT group_id, COUNT(*) as n FROM invite_links
+            WHERE status = 'available' AND expires_at > ?
+            GROUP BY group_id
+        ''', (valid_until,))
+        counts = {r['group_id']: r['n'] for r in cursor.fetchall()}
+        conn.close()
+        return counts
+
+    def claim_invite_link(self, group_id: int, user_id: int, sub_id: int, valid_until):
+        """Atomically take the available link of `group_id` that expires last; returns it or None."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE invite_links SET status = 'claimed', claimed_by = ?, subscription_id = ?, claimed_at = ?
+            WHERE id = (
+                SELECT id FROM invite_links
+                WHERE group_id = ? AND status = 'available' AND expires_at > ?
+                ORDER BY expires_at DESC LIMIT 1
+            )
+        ''', (user_id, sub_id, datetime.datetime.now(), group_id, valid_until))
+        link = None
+        if cursor.rowcount:
+            cursor.execute('''
+                SELECT link FROM invite_links WHERE group_id = ? AND subscription_id = ? AND status = 'claimed'
+                ORDER BY claimed_at DESC LIMIT 1
+            ''', (group_id, sub_id))
+            link = cursor.fetchone()['link']
+        conn.commit()
+        conn.close()
+        return link
+
+    def purge_invite_links(self, now):
+        """Drop expired links; claimed ones are kept 30 days for reference."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM invite_links
+            WHERE (status = 'available' AND expires_at <= ?) OR (status = 'claimed' AND claimed_at < ?)
+        ''', (now, now - datetime.timedelta(days=30)))
+        conn.commit()
+        conn.close()
+
+    # --- News Feeds ---
+    def seed_feeds(self, items):
+        """items: list of (url, category). Only applied to an empty table."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) AS n FROM news_feeds')
+        if cursor.fetchone()['n'] == 0:
+            cursor.executemany('INSERT OR IGNORE INTO news_feeds (url, category) VALUES (?, ?)', items)
+            conn.commit()
+        conn.close()
+
+    def add_feed(self, url: str, category: str, interval_seconds: int = 3600):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('INSERT INTO news_feeds (url, category, interval_seconds) VALUES (?, ?, ?)',
+                           (url, category, interval_seconds))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            conn.close()
+
+    def delete_feed(self, feed_id: int):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM news_feeds WHERE id = ?', (feed_id,))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def get_feeds(self, enabled_only: bool = False):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        if enabled_only:
+            cursor.execute('SELECT * FROM news_feeds WHERE enabled = 1 ORDER BY category, id')
+        else:
+            cursor.execute('SELECT * FROM news_feeds ORDER BY category, id')
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def update_feed_schedule(self, items):
+        """items: (interval_seconds, rate_per_hour, next_poll_at, last_polled_at, id)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            UPDATE news_feeds SET interval_seconds = ?, rate_per_hour = ?, next_poll_at = ?, last_polled_at = ?
+            WHERE id = ?
+        ''', items)
+        conn.commit()
+        conn.close()
+
+    def get_feed_validators(self):
+        """{url: (etag, last_modified)}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT url, etag, last_modified FROM feed_cache')
+        validators = {r['url']: (r['etag'], r['last_modified']) for r in cursor.fetchall()}
+        conn.close()
+        return validators
+
+    def set_feed_validators(self, items):
+        """items: (url, etag, last_modified)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO feed_cache (url, etag, last_modified, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', items)
+        conn.commit()
+        conn.close()
+
+    def add_news_hash(self, h: int, category: str = None, simhash: int = None):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO news_seen (hash, seen_at, category, simhash) VALUES (?, ?, ?, ?)
+        ''', (h, datetime.datetime.now(), category, simhash))
+        conn.commit()
+        conn.close()
+
+    def has_news_hash(self, h: int):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM news_seen WHERE hash = ?', (h,))
+        found = cursor.fetchone() is not None
+        conn.close()
+        return found
+
+    def get_news_hashes(self, since):
+        """Hashes seen since `since`, oldest first."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT hash FROM news_seen WHERE seen_at >= ? ORDER BY seen_at', (since,))
+        hashes = [r['hash'] for r in cursor.fetchall()]
+        conn.close()
+        return hashes
+
+    def get_news_fingerprints(self, since):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT category, simhash, seen_at FROM news_seen
+            WHERE seen_at >= ? AND simhash IS NOT NULL ORDER BY seen_at
+        ''', (since,))
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def purge_news_seen(self, before):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM news_seen WHERE seen_at < ?', (before,))
+        conn.commit()
+        conn.close()
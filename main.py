@@ -1,7 +1,7 @@
 import os
 import logging
 from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, TypeHandler
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, TypeHandler, ChatMemberHandler
 from telegram import Update # Required for TypeHandler
 
 from modules.user_handlers import start, help_command, my_profile
@@ -9,16 +9,31 @@ from modules.admin_handlers import (
     create_role, list_roles, 
     create_package, list_packages, delete_package,
     add_payment_method, list_payment_methods, delete_payment_method,
-    add_member, announce, schedule_message,
-    bot_status, force_check, check_uninvited
+    add_member, announce, list_broadcasts, cancel_broadcast, schedule_message, list_scheduled, delete_scheduled,
+    dead_letters, retry_dead,
+    bot_status, force_check, check_uninvited, group_stats,
+    add_symbol, delete_symbol, toggle_symbol, list_symbols,
+    signal_stats, add_feed, delete_feed, list_feeds
 )
 from modules.payment_handlers import sub_conv_handler, admin_tx_callback
-from modules.notification_handlers import notif_conv_handler, list_notifs, del_notif, notification_scheduler
+from modules.notification_handlers import notif_conv_handler, list_notifs, del_notif, NotificationScheduler
 # NEW: Settings Handlers
 from modules.settings_handlers import settings_menu, settings_callback, maintenance_check
+from modules.membership import track_group_member
 
 from modules.market_data import MarketData
 from modules.signals import SignalGenerator
+from modules.compute import ComputeBackend
+from modules.signal_state import SignalStateStore
+from modules.signal_tracker import SignalTracker
+from modules.dispatcher import MessageDispatcher
+from modules.broadcast import BroadcastEngine
+from modules.outbox import Outbox
+from modules.invite_pool import InvitePool
+from modules.scheduled_messages import ScheduledMessages
+from modules.lifecycle import SubscriptionLifecycle
+from modules.snapshot import Snapshotter
+from database import BotDatabase
 from modules.news import NewsAggregator
 
 # Load environment variables
@@ -30,6 +45,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def post_stop(application: Application):
+    """Interrupt broadcasts, drain outbound messages and persist pending state while the bot can still send."""
+    broadcast_engine = application.bot_data.get('broadcast_engine')
+    if broadcast_engine:
+        await broadcast_engine.stop() # Before the dispatcher, so their progress reports still go out
+    dispatcher = application.bot_data.get('dispatcher')
+    if dispatcher:
+        await dispatcher.stop()
+    signal_gen = application.bot_data.get('signal_gen')
+    if signal_gen:
+        signal_gen.state.flush()
+
+async def post_shutdown(application: Application):
+    """Stop background worker processes and close the HTTP clients."""
+    compute = application.bot_data.get('compute')
+    if compute:
+        compute.shutdown()
+    news_agg = application.bot_data.get('news_agg')
+    if news_agg:
+        await news_agg.fetcher.close()
+
 def main():
     """Start the bot."""
     token = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -52,7 +88,16 @@ def main():
         return
 
     # Create the Application
-    application = Application.builder().token(token).build()
+    application = Application.builder().token(token).post_stop(post_stop).post_shutdown(post_shutdown).build()
+
+    # Every outbound message goes through one rate limited, prioritized queue
+    # Failed keyed sends are persisted in the outbox and retried with backoff
+    outbox = Outbox(BotDatabase())
+    application.bot_data['dispatcher'] = MessageDispatcher(application.bot, outbox=outbox)
+    broadcast_engine = BroadcastEngine(BotDatabase())
+    application.bot_data['broadcast_engine'] = broadcast_engine
+    invite_pool = InvitePool(BotDatabase())
+    application.bot_data['invite_pool'] = invite_pool
 
     # --- MIDDLEWARE (Maintenance Check) ---
     # Register this FIRST so it runs before other handlers
@@ -84,12 +129,34 @@ def main():
     
     application.add_handler(CommandHandler("addmember", add_member))
     application.add_handler(CommandHandler("announce", announce))
+    application.add_handler(CommandHandler("broadcasts", list_broadcasts))
+    application.add_handler(CommandHandler("cancelbroadcast", cancel_broadcast))
+    application.add_handler(CommandHandler("deadletters", dead_letters))
+    application.add_handler(CommandHandler("retrydead", retry_dead))
     application.add_handler(CommandHandler("schedule", schedule_message))
+    application.add_handler(CommandHandler("listschedule", list_scheduled))
+    application.add_handler(CommandHandler("delschedule", delete_scheduled))
     
     # Control Handlers
     application.add_handler(CommandHandler("status", bot_status))
     application.add_handler(CommandHandler("forcecheck", force_check))
     application.add_handler(CommandHandler("checkuninvited", check_uninvited))
+    application.add_handler(CommandHandler("groupstats", group_stats))
+
+    # Premium group membership index
+    application.add_handler(ChatMemberHandler(track_group_member, ChatMemberHandler.CHAT_MEMBER))
+
+    # Symbol Universe
+    application.add_handler(CommandHandler("addsymbol", add_symbol))
+    application.add_handler(CommandHandler("delsymbol", delete_symbol))
+    application.add_handler(CommandHandler("togglesymbol", toggle_symbol))
+    application.add_handler(CommandHandler("listsymbols", list_symbols))
+    application.add_handler(CommandHandler("signalstats", signal_stats))
+
+    # News Feed Registry
+    application.add_handler(CommandHandler("addfeed", add_feed))
+    application.add_handler(CommandHandler("delfeed", delete_feed))
+    application.add_handler(CommandHandler("listfeeds", list_feeds))
 
     # Notification Handlers
     application.add_handler(notif_conv_handler)
@@ -103,6 +170,32 @@ def main():
     # --- Schedulers ---
     job_queue = application.job_queue
 
+    # Broadcasts interrupted by a restart continue where they stopped
+    job_queue.run_once(broadcast_engine.resume, when=5, name="broadcast_resume")
+
+    # /schedule messages: due rows are claimed and sent as broadcasts
+    scheduled = ScheduledMessages(BotDatabase())
+    job_queue.run_repeating(scheduled.run, interval=ScheduledMessages.CHECK_SECONDS, first=20, name="scheduled_messages")
+
+    # Outbox: retry failed sends in batches, forget delivered rows after a week
+    job_queue.run_repeating(outbox.drain, interval=30, first=15, name="outbox_drain")
+    job_queue.run_repeating(outbox.purge, interval=86400, first=600, name="outbox_purge")
+
+    # Invite links are created ahead of payment confirmations
+    job_queue.run_repeating(invite_pool.refill, interval=InvitePool.REFILL_SECONDS, first=10, name="invite_pool")
+
+    # Expiry reminders and expirations: each run handles only the end dates passed since the last one
+    lifecycle = SubscriptionLifecycle(BotDatabase())
+    job_queue.run_repeating(lifecycle.reminders_job, interval=SubscriptionLifecycle.CHECK_SECONDS, first=30, name="sub_reminders")
+    job_queue.run_repeating(lifecycle.expirations_job, interval=SubscriptionLifecycle.CHECK_SECONDS, first=45, name="sub_expirations")
+
+    # Off-box persistence: incremental compressed snapshots of the database
+    snapshot_dir = os.getenv("SNAPSHOT_DIR")
+    if snapshot_dir:
+        snapshotter = Snapshotter(BotDatabase().db_file, snapshot_dir)
+        interval = float(os.getenv("SNAPSHOT_MINUTES", 60)) * 60
+        job_queue.run_repeating(snapshotter.run, interval=interval, first=120, name="db_snapshot")
+
     # Config Logging
     if groups:
         logger.info(f"Configured Premium Groups: {groups}")
@@ -110,43 +203,61 @@ def main():
         logger.info(f"Configured Free Group: {free_group_id}")
 
     if groups or free_group_id:
-        # 1. Signals Job (Every 15 mins)
+        # 1. Signals Job (On candle close)
         market_data = MarketData()
-        signal_gen = SignalGenerator(market_data)
+        compute = ComputeBackend() # SIGNAL_COMPUTE=process runs indicators in warm worker processes
+        compute.start()
+        application.bot_data['compute'] = compute
+        bot_db = BotDatabase()
+        signal_state = SignalStateStore(bot_db) # Cooldowns survive restarts
+        signal_tracker = SignalTracker(market_data, bot_db) # Follows sent signals up to TP3 / Stop
+        signal_gen = SignalGenerator(market_data, compute=compute, state=signal_state, db=bot_db, tracker=signal_tracker)
+        application.bot_data['signal_gen'] = signal_gen # Shared with /status and /forcecheck
         
-        job_queue.run_repeating(
-            signal_gen.check_and_send_signals, 
-            interval=900, 
-            first=10, 
-            data={
-                'groups': groups, 
-                'free_group': free_group_id
-            },
-            name="signal_check"
-        )
-        
-        # 2. News Job (Every 1 hour = 3600s)
-        news_agg = NewsAggregator()
+        # The universe is split into SIGNAL_SHARDS jobs that run concurrently.
+        # Jobs tick on the candle clock (every 5 min, aligned to bar closes + settle delay)
+        # and each run only evaluates symbols whose timeframe just closed a bar.
+        shards = max(1, int(os.getenv("SIGNAL_SHARDS", 1)))
+        for shard in range(shards):
+            job_queue.run_repeating(
+                signal_gen.check_and_send_signals, 
+                interval=SignalGenerator.CLOCK_SECONDS, 
+                first=signal_gen.next_clock_time(shard),
+                data={
+                    'groups': groups, 
+                    'free_group': free_group_id,
+                    'shard': shard,
+                    'shards': shards,
+                    'aligned': True
+                },
+                name="signal_check" if shards == 1 else f"signal_check_{shard}"
+            )
         
+        # Signal outcomes: one batched price check for every open signal
         job_queue.run_repeating(
-            news_agg.check_and_send_news,
-            interval=3600,
-            first=60, 
-            data={'groups': groups},
-            name="news_check"
+            signal_tracker.check_outcomes,
+            interval=SignalTracker.CHECK_SECONDS,
+            first=30,
+            name="signal_tracker"
         )
+
+        # 2. News: each feed of the registry on its own cadence (heap scheduled one-shot job)
+        news_agg = NewsAggregator(db=BotDatabase())
+        application.bot_data['news_agg'] = news_agg # Shared with /forcecheck and the feed commands
+        job_queue.run_repeating(news_agg.dedup.purge, interval=86400, first=3600, name="news_dedup_purge")
+        news_agg.arm(job_queue, data={
+            'groups': groups,
+            'market_hours': True, # Closed markets polled less, woken at the open
+            'digest': os.getenv("NEWS_DIGEST", "0") == "1" # One message per group per window
+        }, min_delay=60)
         
-        # 3. Custom Notification Job (Every 60s)
-        job_queue.run_repeating(
-            notification_scheduler,
-            interval=60, # Check every minute
-            first=5,
-            data={
-                'groups': groups, 
-                'free_group': free_group_id
-            },
-            name="custom_notif_check"
-        )
+        # 3. Custom Notifications: one-shot job armed at the earliest next_run_at
+        notif_scheduler = NotificationScheduler(BotDatabase())
+        application.bot_data['notif_scheduler'] = notif_scheduler # /addnotif and /delnotif re-arm it
+        notif_scheduler.arm(job_queue, data={
+            'groups': groups, 
+            'free_group': free_group_id
+        })
         
         logger.info("Schedulers active: Signal, News, CustomNotif.")
     else:
@@ -154,7 +265,8 @@ def main():
 
     # Run the bot
     logger.info("Bot started...")
-    application.run_polling()
+    # chat_member updates are only delivered when requested explicitly
+    application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
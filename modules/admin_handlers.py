@@ -1,10 +1,15 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 from database import BotDatabase
-from modules.utils import super_admin_only
+from modules.utils import super_admin_only, asset_groups, package_assets
 from modules.signals import SignalGenerator
+from modules.signal_state import SignalStateStore
+from modules.signal_tracker import utc_now
+from modules.broadcast import get_broadcast_engine
 from modules.news import NewsAggregator
-from modules.market_data import MarketData
+from modules.market_data import MarketData, timeframe_to_seconds
+from modules.membership import is_in_group
+from modules.recurrence import FREQUENCIES, next_occurrence
 import os
 import datetime
 
@@ -142,30 +147,282 @@ async def announce(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not message:
         await update.message.reply_text("Usage: /announce <message>")
         return
-    users = db.get_all_users()
-    count = 0
-    for u in users:
-        try:
-            await context.bot.send_message(chat_id=u['user_id'], text=f"📢 **Announcement:**\n\n{message}", parse_mode='Markdown')
-            count += 1
-        except Exception as e:
-            print(f"Failed to send to {u['user_id']}: {e}")
-    await update.message.reply_text(f"✅ Announcement sent to {count} users.")
+    # Persisted job: progress is tracked per recipient and survives restarts
+    broadcast_id = db.create_broadcast(f"📢 **Announcement:**\n\n{message}", update.effective_user.id, 'Markdown')
+    get_broadcast_engine(context, db).start(context, broadcast_id)
+    await update.message.reply_text(f"✅ Broadcast #{broadcast_id} started. Progress will be reported here.")
+
+@super_admin_only
+async def list_broadcasts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /broadcasts - Recent broadcasts and their progress"""
+    rows = db.get_broadcasts()
+    if not rows:
+        await update.message.reply_text("No broadcasts yet.")
+        return
+    text = "📢 **Recent Broadcasts:**\n\n"
+    for b in rows:
+        text += (
+            f"🆔 **{b['id']}** | {b['status']} | {b['created_at']}\n"
+            f"✉️ {b['sent']}/{b['total']} sent, {b['failed']} failed\n"
+            "-------------------\n"
+        )
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+@super_admin_only
+async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /cancelbroadcast <id>"""
+    try:
+        broadcast_id = int(context.args[0])
+        if get_broadcast_engine(context, db).cancel(broadcast_id):
+            await update.message.reply_text(f"✅ Broadcast #{broadcast_id} cancelled.")
+        else:
+            await update.message.reply_text("❌ Broadcast not found or already finished.")
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /cancelbroadcast <id>")
 
 @super_admin_only
 async def schedule_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Usage: /schedule <type> <time> <message>"""
+    usage = (
+        "Usage: /schedule <type> <time> <message>\n"
+        "Example: /schedule daily 09:00 Good Morning!\n"
+        "Time: hourly `30` | daily `09:00` | weekly `Monday 09:00` | monthly `1 09:00` | once `2025-01-31 09:00` or `09:00`"
+    )
     try:
         sch_type = context.args[0].lower()
-        sch_time = context.args[1]
-        message = " ".join(context.args[2:])
-        if sch_type not in ['daily', 'once', 'weekly']:
-            await update.message.reply_text("Type must be: daily, once, weekly")
+        if sch_type not in FREQUENCIES:
+            await update.message.reply_text(f"Type must be: {', '.join(FREQUENCIES)}")
             return
-        db.add_scheduled_message(sch_type, sch_time, message)
-        await update.message.reply_text(f"✅ Scheduled '{sch_type}' message at {sch_time}.")
+        # weekly/monthly and dated one-offs take two tokens
+        two_tokens = sch_type in ('weekly', 'monthly') or (sch_type == 'once' and '-' in context.args[1])
+        sch_time = " ".join(context.args[1:3]) if two_tokens else context.args[1]
+        message = " ".join(context.args[3 if two_tokens else 2:])
+        now = datetime.datetime.now()
+        if sch_type == 'once' and not two_tokens:
+            sch_time = next_occurrence('daily', sch_time, now).strftime("%Y-%m-%d %H:%M")
+        next_run = next_occurrence(sch_type, sch_time, now)
+        if not message or next_run is None:
+            raise ValueError
+        db.add_scheduled_message(sch_type, sch_time, message, next_run)
+        await update.message.reply_text(f"✅ Scheduled '{sch_type}' message at {sch_time}. Next run: {next_run:%Y-%m-%d %H:%M}.")
+    except (IndexError, ValueError):
+        await update.message.reply_text(usage, parse_mode='Markdown')
+
+@super_admin_only
+async def list_scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /listschedule - Active scheduled messages and their next run"""
+    rows = db.get_scheduled_messages()
+    if not rows:
+        await update.message.reply_text("No scheduled messages.")
+        return
+    text = "🗓 Scheduled Messages:\n\n"
+    for r in rows:
+        text += (
+            f"🆔 {r['id']} | {r['type']} @ {r['schedule_time']}\n"
+            f"⏭ Next: {str(r['next_run_at'])[:16] if r['next_run_at'] else '-'}\n"
+            f"📝 {r['message'][:30]}...\n"
+            "-------------------\n"
+        )
+    await update.message.reply_text(text)
+
+@super_admin_only
+async def delete_scheduled(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /delschedule <id>"""
+    try:
+        message_id = int(context.args[0])
+        if db.delete_scheduled_message(message_id):
+            await update.message.reply_text(f"✅ Scheduled message {message_id} deleted.")
+        else:
+            await update.message.reply_text("❌ Scheduled message not found.")
     except (IndexError, ValueError):
-        await update.message.reply_text("Usage: /schedule <type> <time> <message>\nExample: /schedule daily 09:00 Good Morning!")
+        await update.message.reply_text("Usage: /delschedule <id>")
+
+# --- Symbol Universe ---
+SYMBOL_CATEGORIES = ['crypto', 'stocks', 'forex', 'gold']
+SYMBOL_SOURCES = ['auto', 'ccxt', 'yahoo']
+
+@super_admin_only
+async def add_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /addsymbol <symbol> <category> [source] [timeframe]"""
+    try:
+        symbol = context.args[0]
+        category = context.args[1].lower()
+        source = context.args[2].lower() if len(context.args) > 2 else 'auto'
+        timeframe = context.args[3].lower() if len(context.args) > 3 else '15m'
+        if category not in SYMBOL_CATEGORIES or source not in SYMBOL_SOURCES:
+            raise ValueError
+        # Signals run on a 5 minute candle clock
+        if timeframe_to_seconds(timeframe) % SignalGenerator.CLOCK_SECONDS != 0:
+            raise ValueError
+        if db.add_symbol(symbol, category, source, timeframe):
+            await update.message.reply_text(f"✅ Symbol {symbol} added to {category} (source: {source}, timeframe: {timeframe}).")
+        else:
+            await update.message.reply_text(f"❌ Symbol {symbol} already exists.")
+    except (IndexError, ValueError, KeyError):
+        await update.message.reply_text(
+            "Usage: /addsymbol <symbol> <category> [source] [timeframe]\n"
+            f"Category: {', '.join(SYMBOL_CATEGORIES)}\nSource: {', '.join(SYMBOL_SOURCES)}\n"
+            "Timeframe: multiple of 5m (5m, 15m, 1h, 4h, 1d)\n"
+            "Example: /addsymbol XRP/USDT crypto auto 1h"
+        )
+
+@super_admin_only
+async def delete_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /delsymbol <symbol>"""
+    try:
+        symbol = context.args[0]
+        if db.delete_symbol(symbol):
+            await update.message.reply_text(f"✅ Symbol {symbol} deleted.")
+        else:
+            await update.message.reply_text(f"❌ Symbol not found.")
+    except IndexError:
+        await update.message.reply_text("Usage: /delsymbol <symbol>")
+
+@super_admin_only
+async def toggle_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /togglesymbol <symbol>"""
+    try:
+        symbol = context.args[0]
+        row = db.get_symbol(symbol)
+        if not row:
+            await update.message.reply_text(f"❌ Symbol not found.")
+            return
+        enabled = not row['enabled']
+        db.set_symbol_enabled(symbol, enabled)
+        await update.message.reply_text(f"✅ Symbol {symbol} {'enabled' if enabled else 'disabled'}.")
+    except IndexError:
+        await update.message.reply_text("Usage: /togglesymbol <symbol>")
+
+@super_admin_only
+async def list_symbols(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rows = db.get_symbols()
+    if not rows:
+        await update.message.reply_text("No symbols configured.")
+        return
+    text = f"📊 **Symbol Universe** ({len(rows)}):\n"
+    category = None
+    for r in rows:
+        if r['category'] != category:
+            category = r['category']
+            text += f"\n*{category.upper()}*\n"
+        status = "✅" if r['enabled'] else "⏸"
+        text += f"{status} `{r['symbol']}` ({r['source']}, {r['timeframe']})\n"
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+# --- News Feed Registry ---
+@super_admin_only
+async def add_feed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /addfeed <category> <url> [interval_minutes]"""
+    try:
+        category = context.args[0].lower()
+        url = context.args[1]
+        minutes = int(context.args[2]) if len(context.args) > 2 else 60
+        if category not in SYMBOL_CATEGORIES or not url.startswith(('http://', 'https://')) or minutes < 5:
+            raise ValueError
+        if db.add_feed(url, category, minutes * 60):
+            _reload_feeds(context)
+            await update.message.reply_text(f"✅ Feed added to {category} (starts at every {minutes} min, adapts to its publish rate).")
+        else:
+            await update.message.reply_text("❌ Feed already exists.")
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            "Usage: /addfeed <category> <url> [interval_minutes]\n"
+            f"Category: {', '.join(SYMBOL_CATEGORIES)}\n"
+            "Example: /addfeed crypto https://decrypt.co/feed 30"
+        )
+
+@super_admin_only
+async def delete_feed(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /delfeed <id>"""
+    try:
+        feed_id = int(context.args[0])
+        if db.delete_feed(feed_id):
+            _reload_feeds(context)
+            await update.message.reply_text(f"✅ Feed {feed_id} deleted.")
+        else:
+            await update.message.reply_text(f"❌ Feed {feed_id} not found.")
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /delfeed <id> (see /listfeeds)")
+
+@super_admin_only
+async def list_feeds(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rows = db.get_feeds()
+    if not rows:
+        await update.message.reply_text("No news feeds configured.")
+        return
+    text = f"📰 **News Feeds** ({len(rows)}):\n"
+    category = None
+    for r in rows:
+        if r['category'] != category:
+            category = r['category']
+            text += f"\n*{category.upper()}*\n"
+        rate = f"{r['rate_per_hour']:.1f}/h" if r['rate_per_hour'] is not None else "n/a"
+        next_poll = str(r['next_poll_at'])[:16] if r['next_poll_at'] else "soon"
+        text += (
+            f"`{r['id']}` `{r['url']}`\n"
+            f"    every {r['interval_seconds'] // 60} min, rate {rate}, next {next_poll}\n"
+        )
+    await update.message.reply_text(text, parse_mode='Markdown', disable_web_page_preview=True)
+
+def _reload_feeds(context):
+    news = context.bot_data.get('news_agg')
+    if news:
+        news.reload(context.job_queue)
+
+@super_admin_only
+async def signal_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /signalstats [days] - Outcome of sent signals (TP/SL hit rates, R)"""
+    try:
+        days = int(context.args[0]) if context.args else None
+    except ValueError:
+        await update.message.reply_text("Usage: /signalstats [days]")
+        return
+    since = utc_now() - datetime.timedelta(days=days) if days else None
+    rows = db.get_signal_stats(since)
+    if not rows:
+        await update.message.reply_text("No signals recorded yet.")
+        return
+    text = f"📈 **Signal Performance** ({f'last {days} days' if days else 'all time'}):\n"
+    for r in rows:
+        closed = r['closed'] or 0
+        win_rate = (r['wins'] or 0) / closed if closed else 0
+        text += (
+            f"\n*{(r['category'] or '-').upper()}* – {r['total']} signals ({r['open']} open)\n"
+            f"TP1 {r['tp1']} | TP2 {r['tp2']} | TP3 {r['tp3']} | SL {r['sl']} | Expired {r['expired']}\n"
+            f"Win rate: {win_rate:.0%} | Total: {r['total_r']:+.2f}R\n"
+        )
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+@super_admin_only
+async def dead_letters(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /deadletters - Sends that failed for good"""
+    counts = db.get_outbox_counts()
+    rows = db.get_dead_letters()
+    text = (
+        "📮 **Outbox**\n"
+        f"Pending retry: {counts.get('pending', 0)} | Dead: {counts.get('dead', 0)} | Sent: {counts.get('sent', 0)}\n\n"
+    )
+    if not rows:
+        text += "✅ No dead letters."
+    for r in rows:
+        text += (
+            f"🆔 **{r['id']}** | `{r['idempotency_key']}`\n"
+            f"💬 Chat `{r['chat_id']}` | {r['attempts']} attempts\n"
+            f"⚠️ {r['last_error']}\n"
+            "-------------------\n"
+        )
+    text += "\nRetry with /retrydead <id|all>"
+    await update.message.reply_text(text, parse_mode='Markdown')
+
+@super_admin_only
+async def retry_dead(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /retrydead <id|all>"""
+    try:
+        target = context.args[0].lower()
+        count = db.retry_dead_letters(None if target == 'all' else int(target))
+        await update.message.reply_text(f"✅ {count} dead letters queued for retry.")
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /retrydead <id|all>")
 
 # --- Bot Status & Control ---
 @super_admin_only
@@ -191,6 +448,18 @@ async def bot_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += "\n⚙️ **Active Jobs**:\n"
     for j in job_names:
         text += f"- {j}\n"
+    signal_gen = context.bot_data.get('signal_gen')
+    if signal_gen and signal_gen.last_pipeline_stats:
+        text += "\n📈 **Last Signal Cycle**:\n"
+        for shard, stats in sorted(signal_gen.last_pipeline_stats.items()):
+            text += f"- Shard {shard}: `{stats.summary()}`\n"
+    dispatcher = context.bot_data.get('dispatcher')
+    if dispatcher:
+        text += f"\n📤 **Outbound Queue**:\n`{dispatcher.summary()}`\n"
+    invite_pool = context.bot_data.get('invite_pool')
+    if invite_pool:
+        pooled = " ".join(f"{asset}={n}" for asset, n in invite_pool.summary().items())
+        text += f"\n🔗 **Invite Link Pool**: `{pooled}`\n"
     await update.message.reply_text(text, parse_mode='Markdown')
 
 @super_admin_only
@@ -212,14 +481,15 @@ async def force_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         if check_type == 'signal':
             await update.message.reply_text("⏳ Forcing Signal Check... (Check Logs)")
-            md = MarketData()
-            sig = SignalGenerator(md)
-            sig.last_signals = {} 
+            # Reuse the scheduled generator so cooldowns still apply (no duplicate signals)
+            sig = context.bot_data.get('signal_gen')
+            if not sig:
+                sig = SignalGenerator(MarketData(), state=SignalStateStore(db), db=db)
             await sig.check_and_send_signals(context)
             await update.message.reply_text("✅ Signal Check Complete.")
         elif check_type == 'news':
             await update.message.reply_text("⏳ Forcing News Check... (Check Logs)")
-            news = NewsAggregator()
+            news = context.bot_data.get('news_agg') or NewsAggregator(db=db)
             await news.check_and_send_news(context)
             await update.message.reply_text("✅ News Check Complete.")
         else:
@@ -231,20 +501,60 @@ async def force_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @super_admin_only
 async def check_uninvited(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Usage: /checkuninvited - Check for users who paid but didn't get links"""
+    groups = asset_groups()
     subs = db.get_uninvited_subscriptions()
-    
-    if not subs:
+    membership = db.get_member_statuses([s['user_id'] for s in subs])
+
+    # Pending invites of users the membership index already saw joining are settled
+    uninvited = []
+    for s in subs:
+        missing = [
+            asset for asset in package_assets(s['assets'])
+            if asset in groups and not is_in_group(membership.get((groups[asset], s['user_id'])))
+        ]
+        if missing:
+            uninvited.append((s, missing))
+        else:
+            db.mark_joined(s['user_id'])
+
+    if not uninvited:
         await update.message.reply_text("✅ All active subscribers have been invited.")
         return
-        
+
     text = "⚠️ **Uninvited Subscribers:**\n\n"
-    for s in subs:
+    for s, missing in uninvited:
         text += (
             f"👤 **{s['username']}** (ID: `{s['user_id']}`)\n"
             f"📦 Plan: {s['package_name']} ({s['assets']})\n"
             f"📅 Status: Active, Invite: {s['invite_status']}\n"
+            f"🚪 Not joined: {', '.join(missing)}\n"
             "-------------------\n"
         )
-    
+
     text += "\n💡 **Action**: Please manually DM these users with invite links."
     await update.message.reply_text(text, parse_mode='Markdown')
+
+@super_admin_only
+async def group_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Usage: /groupstats - Members vs. active subscribers of each premium group"""
+    groups = asset_groups()
+    if not groups:
+        await update.message.reply_text("No premium groups configured.")
+        return
+
+    entitled = {asset: set() for asset in groups}
+    for s in db.get_active_subscribers():
+        for asset in package_assets(s['assets']):
+            if asset in entitled:
+                entitled[asset].add(s['user_id'])
+
+    text = "👥 **Premium Groups**\n\n"
+    for asset, group_id in groups.items():
+        members = db.get_group_member_ids(group_id)
+        text += (
+            f"**{asset.title()}** (`{group_id}`)\n"
+            f"Members: {len(members)} | Subscribers: {len(entitled[asset])}\n"
+            f"Not joined: {len(entitled[asset] - members)} | Without subscription: {len(members - entitled[asset])}\n\n"
+        )
+    text += "_Counts cover users seen joining or leaving since the bot became group admin._"
+    await update.message.reply_text(text, parse_mode='Markdown')
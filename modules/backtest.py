@@ -0,0 +1,294 @@
+"""
+Vectorized backtester for the SignalGenerator strategy.
+
+Replays historical OHLCV through the same indicator/BUY rule/ATR levels as the
+live bot (TechnicalAnalysis) and the same per-symbol cooldown, then resolves
+Stop/TP1-3 fills with numpy over a fixed horizon of future bars.
+
+Usage:
+    python -m modules.backtest --since 2022-01-01 --workers 8
+    python -m modules.backtest --symbols BTC/USDT ETH/USDT --data-dir data/
+"""
+import os
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .market_data import MarketData, timeframe_to_seconds, utc_now
+from .technical_analysis import TechnicalAnalysis
+from .signals import SignalGenerator
+
+logger = logging.getLogger(__name__)
+
+# Take-profit levels; results are in R, with the initial stop distance as 1R
+LEVELS = ('tp1', 'tp2', 'tp3')
+
+
+def apply_cooldown(candidates: np.ndarray, timestamps: np.ndarray, cooldown_seconds: float) -> np.ndarray:
+    """
+    Same semantics as SignalGenerator's per-symbol cooldown: after a signal fires,
+    the symbol is muted until the cooldown has fully elapsed.
+    Only candidate bars are visited, so this stays cheap on long histories.
+    """
+    if len(candidates) == 0 or cooldown_seconds <= 0:
+        return candidates
+    cooldown = np.timedelta64(int(cooldown_seconds), 's')
+    kept = []
+    last = None
+    for i in candidates:
+        if last is None or timestamps[i] - last >= cooldown:
+            kept.append(i)
+            last = timestamps[i]
+    return np.asarray(kept, dtype=np.int64)
+
+
+def first_hit(mask: np.ndarray) -> np.ndarray:
+    """Index of the first True per row, or the row length when never hit."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), mask.shape[1])
+
+
+def simulate(df: pd.DataFrame, cooldown_minutes: float = 60, horizon_bars: int = 96, params=None) -> pd.DataFrame:
+    """
+    Run the strategy over one symbol's history.
+    Returns one row per trade with entry time, levels, fill bars and R result.
+
+    Fill model (long only):
+    - Entries at the close of the signal bar, like the live message.
+    - Stop/TP are checked on the following `horizon_bars` bars using high/low.
+    - When a bar touches both Stop and a TP we assume the Stop filled first.
+    - Position is scaled out in thirds at TP1/TP2/TP3; any third still open
+      after the horizon is closed at the last close.
+    """
+    if df.empty or len(df) < 2:
+        return pd.DataFrame()
+
+    df = TechnicalAnalysis.calculate_indicators(df.copy(), params)
+    return simulate_arrays(
+        df['timestamp'].to_numpy(dtype='datetime64[ns]'),
+        df['high'].to_numpy(dtype=float),
+        df['low'].to_numpy(dtype=float),
+        df['close'].to_numpy(dtype=float),
+        df['SMA_200'].to_numpy(dtype=float),
+        df['RSI'].to_numpy(dtype=float),
+        df['ATR'].to_numpy(dtype=float),
+        cooldown_minutes, horizon_bars, params
+    )
+
+
+def simulate_arrays(timestamps, high, low, close, sma, rsi, atr, cooldown_minutes=60, horizon_bars=96, params=None) -> pd.DataFrame:
+    """simulate() on precomputed indicator arrays (lets the optimizer reuse indicators)."""
+    signal = np.asarray(TechnicalAnalysis.is_buy_signal(close, sma, rsi, params))
+    signal &= ~np.isnan(atr)
+    signal[-1] = False # No future bars to evaluate
+    entries = apply_cooldown(np.flatnonzero(signal), timestamps, cooldown_minutes * 60)
+    if len(entries) == 0:
+        return pd.DataFrame()
+
+    levels = TechnicalAnalysis.calculate_levels(close[entries], atr[entries], params)
+    risk = levels['entry'] - levels['stop']
+
+    # (n_trades, horizon) window of future bars, padded past the end of data
+    n = len(close)
+    offsets = np.arange(1, horizon_bars + 1)
+    idx = entries[:, None] + offsets[None, :]
+    valid = idx < n
+    idx = np.minimum(idx, n - 1)
+    fut_high = np.where(valid, high[idx], -np.inf)
+    fut_low = np.where(valid, low[idx], np.inf)
+
+    sl_bar = first_hit(fut_low <= levels['stop'][:, None])
+    last_bar = valid.sum(axis=1) - 1
+    exit_price = close[idx[np.arange(len(entries)), np.maximum(last_bar, 0)]]
+
+    result = {
+        'entry_time': timestamps[entries],
+        'entry': levels['entry'],
+        'stop': levels['stop'],
+        'sl_bar': sl_bar,
+    }
+    r_total = np.zeros(len(entries))
+    for level in LEVELS:
+        tp_bar = first_hit(fut_high >= levels[level][:, None])
+        hit = tp_bar < sl_bar
+        result[level] = levels[level]
+        result[f'{level}_bar'] = tp_bar
+        result[f'{level}_hit'] = hit
+        reward = (levels[level] - levels['entry']) / risk
+        timed_out = ~hit & (sl_bar >= horizon_bars)
+        leftover = (exit_price - levels['entry']) / risk
+        r_total += np.where(hit, reward, np.where(timed_out, leftover, -1.0)) / len(LEVELS)
+
+    # Bar where the last third left the market
+    exit_bar = np.where(result['tp3_hit'], result['tp3_bar'], np.minimum(sl_bar, last_bar))
+    result['sl_hit'] = (sl_bar < horizon_bars) & ~result['tp3_hit']
+    result['bars_held'] = exit_bar + 1
+    result['r'] = r_total
+    return pd.DataFrame(result)
+
+
+def max_drawdown(r: np.ndarray) -> float:
+    """Largest peak-to-trough drop of the cumulative R curve (in R)."""
+    if len(r) == 0:
+        return 0.0
+    equity = np.concatenate([[0.0], np.cumsum(r)])
+    return float(np.max(np.maximum.accumulate(equity) - equity))
+
+
+def summarize(trades: pd.DataFrame) -> dict:
+    if trades.empty:
+        return {'trades': 0}
+    r = trades.sort_values('entry_time')['r'].to_numpy()
+    wins = r[r > 0]
+    losses = r[r <= 0]
+    return {
+        'trades': len(trades),
+        'tp1_rate': float(trades['tp1_hit'].mean()),
+        'tp2_rate': float(trades['tp2_hit'].mean()),
+        'tp3_rate': float(trades['tp3_hit'].mean()),
+        'sl_rate': float(trades['sl_hit'].mean()),
+        'win_rate': len(wins) / len(r),
+        'avg_win_r': float(wins.mean()) if len(wins) else 0.0,
+        'avg_loss_r': float(losses.mean()) if len(losses) else 0.0,
+        'expectancy_r': float(r.mean()),
+        'total_r': float(r.sum()),
+        'max_drawdown_r': max_drawdown(r),
+    }
+
+
+def load_history(symbol: str, timeframe: str, since, until, data_dir=None) -> pd.DataFrame:
+    """
+    Load candles from `data_dir` (CSV cache) or the exchange.
+    Fetched history is written back to the cache so reruns skip the network;
+    when the cache does not cover [since, until) only the missing head and
+    tail are fetched and merged into it.
+    """
+    since = pd.Timestamp(since) if since is not None else utc_now() - pd.Timedelta(days=365)
+    until = pd.Timestamp(until) if until is not None else utc_now()
+    step = pd.Timedelta(seconds=timeframe_to_seconds(timeframe))
+
+    path = None
+    cached = pd.DataFrame()
+    if data_dir:
+        name = symbol.replace('/', '_').replace('=', '_')
+        path = os.path.join(data_dir, f"{name}_{timeframe}.csv")
+        if os.path.exists(path):
+            cached = pd.read_csv(path, parse_dates=['timestamp'])
+
+    if cached.empty:
+        parts = [MarketData().fetch_history(symbol, timeframe, since=since, until=until)]
+    else:
+        first, last = cached['timestamp'].min(), cached['timestamp'].max()
+        parts = [cached]
+        if since < first - step:
+            parts.append(MarketData().fetch_history(symbol, timeframe, since=since, until=first))
+        if last + step < until - step: # The last closed bar starts one step before `until`
+            parts.append(MarketData().fetch_history(symbol, timeframe, since=last + step, until=until))
+
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame()
+    df = parts[0] if len(parts) == 1 else (
+        pd.concat(parts).drop_duplicates('timestamp', keep='last').sort_values('timestamp')
+    )
+    if path and (cached.empty or len(parts) > 1): # Something new was fetched
+        os.makedirs(data_dir, exist_ok=True)
+        df.to_csv(path, index=False)
+    df = df[(df['timestamp'] >= since) & (df['timestamp'] < until)]
+    return df.reset_index(drop=True)
+
+
+def _backtest_symbol(task):
+    """Process pool worker: load + simulate one symbol."""
+    symbol, timeframe, since, until, data_dir, cooldown_minutes, horizon_bars, params = task
+    try:
+        df = load_history(symbol, timeframe, since, until, data_dir)
+        trades = simulate(df, cooldown_minutes, horizon_bars, params)
+        if not trades.empty:
+            trades.insert(0, 'symbol', symbol)
+        return symbol, len(df), trades
+    except Exception as e:
+        logger.error(f"Backtest failed for {symbol}: {e}")
+        return symbol, 0, pd.DataFrame()
+
+
+class Backtester:
+    def __init__(self, timeframe='15m', cooldown_minutes=60, horizon_hours=24, workers=None, data_dir=None, params=None):
+        self.timeframe = timeframe
+        self.params = TechnicalAnalysis.resolve_params(params)
+        self.cooldown_minutes = cooldown_minutes
+        self.horizon_bars = max(1, int(horizon_hours * 3600 // timeframe_to_seconds(timeframe)))
+        self.workers = workers or os.cpu_count()
+        self.data_dir = data_dir
+
+    def run(self, symbols, since=None, until=None):
+        """
+        Backtest all symbols in parallel (one process per symbol task).
+        Returns (report, trades) where report maps symbol -> summary dict
+        plus an 'ALL' entry aggregated over every trade.
+        """
+        tasks = [
+            (s, self.timeframe, since, until, self.data_dir, self.cooldown_minutes, self.horizon_bars, self.params)
+            for s in symbols
+        ]
+        report = {}
+        frames = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for symbol, bars, trades in pool.map(_backtest_symbol, tasks):
+                summary = summarize(trades)
+                summary['bars'] = bars
+                report[symbol] = summary
+                if not trades.empty:
+                    frames.append(trades)
+
+        all_trades = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        report['ALL'] = summarize(all_trades)
+        report['ALL']['bars'] = sum(r['bars'] for r in report.values() if 'bars' in r)
+        return report, all_trades
+
+    @staticmethod
+    def format_report(report) -> str:
+        header = f"{'Symbol':<12}{'Bars':>9}{'Trades':>8}{'TP1':>7}{'TP2':>7}{'TP3':>7}{'SL':>7}{'Exp(R)':>9}{'Total(R)':>10}{'MaxDD(R)':>10}"
+        lines = [header, '-' * len(header)]
+        for symbol, r in report.items():
+            if not r.get('trades'):
+                lines.append(f"{symbol:<12}{r.get('bars', 0):>9}{0:>8}")
+                continue
+            lines.append(
+                f"{symbol:<12}{r['bars']:>9}{r['trades']:>8}"
+                f"{r['tp1_rate']:>7.0%}{r['tp2_rate']:>7.0%}{r['tp3_rate']:>7.0%}{r['sl_rate']:>7.0%}"
+                f"{r['expectancy_r']:>9.3f}{r['total_r']:>10.2f}{r['max_drawdown_r']:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the RSI/SMA BUY strategy with ATR Stop/TP levels.")
+    parser.add_argument('--symbols', nargs='*', help="Symbols to test (default: SignalGenerator assets)")
+    parser.add_argument('--timeframe', default='15m')
+    parser.add_argument('--since', default=None, help="Start date, e.g. 2022-01-01 (default: 1 year ago)")
+    parser.add_argument('--until', default=None, help="End date (default: now)")
+    parser.add_argument('--cooldown', type=float, default=60, help="Cooldown minutes between signals per symbol")
+    parser.add_argument('--horizon', type=float, default=24, help="Hours to wait for Stop/TP before closing")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--data-dir', default=None, help="CSV candle cache directory")
+    parser.add_argument('--trades-csv', default=None, help="Write every simulated trade to this CSV")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+    symbols = args.symbols
+    if not symbols:
+        symbols = [s for group in SignalGenerator.DEFAULT_ASSETS.values() for s in group]
+
+    bt = Backtester(args.timeframe, args.cooldown, args.horizon, args.workers, args.data_dir)
+    report, trades = bt.run(symbols, args.since, args.until)
+    print(Backtester.format_report(report))
+    if args.trades_csv and not trades.empty:
+        trades.to_csv(args.trades_csv, index=False)
+
+
+if __name__ == "__main__":
+    main()
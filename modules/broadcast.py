@@ -0,0 +1,151 @@
+import time
+import asyncio
+import logging
+
+from .dispatcher import get_dispatcher, BROADCAST, TRANSACTIONAL
+
+logger = logging.getLogger(__name__)
+
+class BroadcastEngine:
+    """
+    Runs /announce broadcasts stored in the `broadcasts` table.
+
+    The recipient list is snapshotted in `broadcast_recipients` when the
+    broadcast is created. `workers` coroutines send through the
+    MessageDispatcher (which paces at the API limit) and results are written
+    back in batches, so after a restart `resume()` continues with the
+    recipients still pending. At most one unflushed batch can be sent twice
+    after a crash. The admin gets a progress message that is edited live.
+    """
+    PAGE_SIZE = 500 # Recipients loaded per query
+    FLUSH_EVERY = 100 # Results per progress write
+    REPORT_SECONDS = 10 # Progress message refresh
+
+    def __init__(self, db, workers=20):
+        self.db = db
+        self.workers = workers # Sends in flight per broadcast
+        self.running = {} # broadcast_id -> asyncio.Task
+
+    def start(self, context, broadcast_id):
+        """Run (or continue) a broadcast in the background."""
+        if broadcast_id in self.running:
+            return
+        # Not application.create_task: Application.stop() would wait for the whole broadcast
+        task = asyncio.create_task(self.run(get_dispatcher(context), broadcast_id))
+        self.running[broadcast_id] = task
+        task.add_done_callback(lambda _: self.running.pop(broadcast_id, None))
+
+    async def stop(self):
+        """Interrupt running broadcasts (results flushed, still 'running', resumed on the next start)."""
+        tasks = list(self.running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def resume(self, context):
+        """Job: continue broadcasts interrupted by a restart."""
+        for b in self.db.get_running_broadcasts():
+            logger.info(f"Resuming broadcast {b['id']} ({b['sent'] + b['failed']}/{b['total']} done)")
+            self.start(context, b['id'])
+
+    def cancel(self, broadcast_id):
+        if not self.db.finish_broadcast(broadcast_id, 'cancelled'):
+            return False
+        task = self.running.get(broadcast_id)
+        if task:
+            task.cancel()
+        return True
+
+    async def run(self, dispatcher, broadcast_id):
+        b = self.db.get_broadcast(broadcast_id)
+        if not b or b['status'] != 'running':
+            return
+        progress = {'sent': b['sent'], 'failed': b['failed']}
+        results = [] # (status, error, user_id) not yet written
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+
+        def flush():
+            if results:
+                self.db.mark_broadcast_recipients(broadcast_id, results[:])
+                results.clear()
+
+        async def worker():
+            while True:
+                user_id = await queue.get()
+                if user_id is None:
+                    return
+                try:
+                    await dispatcher.send_message(
+                        user_id, b['message'], priority=BROADCAST, parse_mode=b['parse_mode'],
+                        outbox_key=f"broadcast:{broadcast_id}:{user_id}"
+                    )
+                    results.append(('sent', None, user_id))
+                    progress['sent'] += 1
+                except Exception as e:
+                    results.append(('failed', str(e)[:200], user_id))
+                    progress['failed'] += 1
+                if len(results) >= self.FLUSH_EVERY:
+                    flush()
+
+        report = await self._report(dispatcher, b, progress)
+        workers = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        last_report = time.monotonic()
+        try:
+            after = 0
+            while True:
+                page = self.db.get_pending_recipients(broadcast_id, after, self.PAGE_SIZE)
+                if not page:
+                    break
+                for user_id in page:
+                    await queue.put(user_id)
+                    if time.monotonic() - last_report >= self.REPORT_SECONDS:
+                        await self._report(dispatcher, b, progress, report)
+                        last_report = time.monotonic()
+                after = page[-1]
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        except asyncio.CancelledError:
+            for w in workers:
+                w.cancel()
+            flush()
+            # /cancelbroadcast marks it cancelled; on shutdown it stays 'running' and is resumed
+            status = self.db.get_broadcast(broadcast_id)['status']
+            await self._report(dispatcher, b, progress, report, status)
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped: {e}")
+            for w in workers:
+                w.cancel()
+            flush() # Stays 'running', resumed on the next start
+            return
+        flush()
+        self.db.finish_broadcast(broadcast_id, 'done')
+        await self._report(dispatcher, b, progress, report, 'done')
+        logger.info(f"Broadcast {broadcast_id} finished: {progress['sent']} sent, {progress['failed']} failed")
+
+    async def _report(self, dispatcher, b, progress, message=None, status='running'):
+        """Send (first call) or edit the admin's progress message; returns it."""
+        if not b['created_by']:
+            return None
+        icon = {'running': '⏳', 'done': '✅', 'cancelled': '🛑'}[status]
+        text = (
+            f"{icon} Broadcast #{b['id']} ({status})\n"
+            f"Sent: {progress['sent']} / {b['total']}\n"
+            f"Failed: {progress['failed']}"
+        )
+        try:
+            if message is None:
+                return await dispatcher.send_message(b['created_by'], text, priority=TRANSACTIONAL)
+            await dispatcher.send('edit_message_text', TRANSACTIONAL, chat_id=message.chat_id, message_id=message.message_id, text=text)
+        except Exception as e:
+            logger.warning(f"Broadcast {b['id']} progress report failed: {e}")
+        return message
+
+
+def get_broadcast_engine(context, db):
+    """The application's BroadcastEngine (created on first use)."""
+    engine = context.bot_data.get('broadcast_engine')
+    if engine is None:
+        engine = context.bot_data['broadcast_engine'] = BroadcastEngine(db)
+    return engine
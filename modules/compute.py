@@ -0,0 +1,89 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .technical_analysis import TechnicalAnalysis
+
+logger = logging.getLogger(__name__)
+
+# Latest-bar values handed back to the bot (plain floats, cheap to pickle)
+RESULT_KEYS = ('close', 'SMA_200', 'RSI', 'ATR')
+
+
+def _warm_worker():
+    """Process initializer: pay the pandas/ta import + first-call cost once per worker."""
+    close = np.linspace(1.0, 2.0, 64)
+    evaluate_arrays(close * 1.01, close * 0.99, close, {'sma_window': 20})
+
+
+def _ping(_=None):
+    return os.getpid()
+
+
+def evaluate_arrays(high, low, close, params=None):
+    """
+    Indicators + BUY rule on raw OHLC arrays.
+    Returns the latest values as a dict when the last bar is a BUY signal, else None.
+    """
+    df = pd.DataFrame({'high': high, 'low': low, 'close': close}, copy=False)
+    df = TechnicalAnalysis.calculate_indicators(df, params)
+    latest = df.iloc[-1]
+    if not TechnicalAnalysis.is_buy_signal(latest['close'], latest['SMA_200'], latest['RSI'], params):
+        return None
+    return {k: float(latest[k]) for k in RESULT_KEYS}
+
+
+def pack_candles(df):
+    """DataFrame -> contiguous float64 arrays (what crosses the process boundary)."""
+    return (
+        np.ascontiguousarray(df['high'].to_numpy(dtype=np.float64)),
+        np.ascontiguousarray(df['low'].to_numpy(dtype=np.float64)),
+        np.ascontiguousarray(df['close'].to_numpy(dtype=np.float64)),
+    )
+
+
+class ComputeBackend:
+    """
+    Where SignalGenerator runs indicator/strategy evaluation.
+
+    - 'thread' (default): the event loop's default thread pool.
+    - 'process': a persistent pool of warm worker processes, so pandas/ta
+      work doesn't hold the GIL of the bot's event loop thread.
+
+    Configure with SIGNAL_COMPUTE=thread|process and SIGNAL_COMPUTE_WORKERS.
+    """
+    def __init__(self, mode=None, workers=None):
+        self.mode = (mode or os.getenv("SIGNAL_COMPUTE", "thread")).lower()
+        self.workers = workers or int(os.getenv("SIGNAL_COMPUTE_WORKERS", 0)) or max(1, (os.cpu_count() or 2) - 1)
+        self.pool = None
+
+    def start(self):
+        """Spawn and warm the worker processes (no-op in thread mode)."""
+        if self.mode != 'process' or self.pool:
+            return
+        # 'spawn' avoids forking the bot's threads (event loop, job queue)
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_worker
+        )
+        pids = set(self.pool.map(_ping, range(self.workers * 2)))
+        logger.info(f"Compute backend: {len(pids)} warm worker processes")
+
+    async def evaluate(self, df, params=None):
+        loop = asyncio.get_running_loop()
+        high, low, close = pack_candles(df)
+        if self.mode == 'process':
+            self.start()
+            return await loop.run_in_executor(self.pool, evaluate_arrays, high, low, close, params)
+        return await loop.run_in_executor(None, evaluate_arrays, high, low, close, params)
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
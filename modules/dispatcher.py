@@ -0,0 +1,264 @@
+import time
+import asyncio
+import logging
+import datetime
+import itertools
+from collections import deque
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Send priorities, lower is sent first
+TRANSACTIONAL = 0 # DMs about the user's own payment / subscription
+SIGNAL = 1
+NEWS = 2
+BROADCAST = 3 # Announcements, scheduled and custom notifications
+PRIORITY_NAMES = {TRANSACTIONAL: 'transactional', SIGNAL: 'signal', NEWS: 'news', BROADCAST: 'broadcast'}
+
+# Telegram limits: ~30 msg/s per bot, ~1 msg/s per private chat, 20 msg/min per group
+GLOBAL_RATE = 25
+PRIVATE_RATE = 1
+GROUP_RATE = 20 / 60
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate # Tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now=None):
+        """Seconds until a token is available (0 = send now)."""
+        now = now or time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self, now=None):
+        self._refill(now or time.monotonic())
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now=None):
+        now = now or time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class Outgoing:
+    __slots__ = ('method', 'kwargs', 'priority', 'seq', 'future', 'queued_at', 'attempts', 'outbox_key')
+
+    def __init__(self, method, kwargs, priority, seq, future, outbox_key=None):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq # Keeps its place when parked or retried
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+        self.outbox_key = outbox_key
+
+
+class MessageDispatcher:
+    """
+    Single exit point for outbound Bot API calls (messages, photos, kicks).
+
+    Calls are queued by priority (transactional > signal > news > broadcast)
+    and paced with token buckets: one global, one per chat for send_* methods.
+    A chat that is out of tokens is parked and re-queued when its token is
+    due, so one busy group never blocks DMs to other chats. `RetryAfter`
+    pauses the chat and the global bucket and re-queues the call.
+    Calls sent with an `outbox_key` are handed to the Outbox when they fail.
+
+    Usage:
+        message = await dispatcher.send_message(chat_id, text, priority=SIGNAL)
+        dispatcher.submit('send_message', BROADCAST, chat_id=..., text=...)  # fire and forget
+    """
+    def __init__(self, bot, concurrency=8, max_retries=3, global_rate=GLOBAL_RATE, outbox=None):
+        self.bot = bot
+        self.outbox = outbox # Persistent retries of failed keyed calls (optional)
+        self.concurrency = concurrency # Bot API calls in flight
+        self.max_retries = max_retries # RetryAfter re-queues before giving up
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets = {}
+        self.queue = None
+        self.slots = None
+        self.runner = None
+        self.inflight = set()
+        self.parked = {} # seq -> TimerHandle of calls waiting for their chat's token
+        self.items = {} # seq -> Outgoing, every call not finished yet
+        self.counter = itertools.count() # FIFO order within a priority
+        self.pending = {p: 0 for p in PRIORITY_NAMES} # Queued or in flight, per priority
+
+        # Stats
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency = deque(maxlen=500) # Queue + send seconds of the last sends
+
+    def start(self):
+        """Start the scheduler on the running event loop (done lazily by send())."""
+        if self.runner and not self.runner.done():
+            return
+        self.queue = asyncio.PriorityQueue()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.runner = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=10):
+        """
+        Wait up to `timeout` seconds for queued calls, then stop the scheduler.
+        Calls still queued, parked or in flight fail with RuntimeError (so no
+        caller waits forever); keyed ones go to the outbox.
+        """
+        deadline = time.monotonic() + timeout
+        while sum(self.pending.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        if self.runner:
+            self.runner.cancel()
+            self.runner = None
+        for handle in self.parked.values():
+            handle.cancel()
+        self.parked.clear()
+        tasks = list(self.inflight)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for item in list(self.items.values()):
+            self._finish(item, error=RuntimeError('dispatcher stopped'))
+
+    def send(self, method, priority=BROADCAST, outbox_key=None, **kwargs):
+        """
+        Queue a Bot API call; returns a future with its result.
+        With `outbox_key` a failed call is also stored in the outbox for retry
+        (the key makes that idempotent, e.g. f"reminder:{sub_id}:{date}").
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        item = Outgoing(method, kwargs, priority, next(self.counter), future, outbox_key)
+        self.pending[priority] += 1
+        self.items[item.seq] = item
+        self._enqueue(item)
+        return future
+
+    async def send_message(self, chat_id, text, priority=BROADCAST, **kwargs):
+        return await self.send('send_message', priority, chat_id=chat_id, text=text, **kwargs)
+
+    def submit(self, method, priority=BROADCAST, **kwargs):
+        """Fire and forget: failures are logged."""
+        future = self.send(method, priority, **kwargs)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception():
+            logger.error(f"Dispatch failed: {future.exception()}")
+
+    def _enqueue(self, item):
+        self.parked.pop(item.seq, None)
+        self.queue.put_nowait((item.priority, item.seq, item))
+
+    def _chat_bucket(self, item):
+        if not item.method.startswith('send_'):
+            return None
+        chat_id = int(item.kwargs['chat_id'])
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Negative ids are groups/channels
+            bucket = TokenBucket(GROUP_RATE, 3) if chat_id < 0 else TokenBucket(PRIVATE_RATE, 1)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, item = await self.queue.get()
+            chat_bucket = self._chat_bucket(item)
+            if chat_bucket:
+                wait = chat_bucket.delay()
+                if wait > 0:
+                    # Park it, other chats keep flowing
+                    self.parked[item.seq] = loop.call_later(wait, self._enqueue, item)
+                    continue
+            wait = self.global_bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if chat_bucket:
+                chat_bucket.take()
+            self.global_bucket.take()
+            await self.slots.acquire()
+            task = asyncio.create_task(self._send(item, chat_bucket))
+            self.inflight.add(task)
+            task.add_done_callback(self.inflight.discard)
+
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.idle()}
+
+    async def _send(self, item, chat_bucket):
+        try:
+            result = await getattr(self.bot, item.method)(**item.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            seconds = retry_after.total_seconds() if isinstance(retry_after, datetime.timedelta) else float(retry_after)
+            self.global_bucket.pause(seconds)
+            if chat_bucket:
+                chat_bucket.pause(seconds)
+            if item.attempts < self.max_retries:
+                item.attempts += 1
+                self.retried += 1
+                logger.warning(f"Flood control on {item.method}, retrying in {seconds:.0f}s")
+                self._enqueue(item)
+                return
+            self._finish(item, error=e)
+        except Exception as e:
+            self._finish(item, error=e)
+        else:
+            self._finish(item, result=result)
+        finally:
+            self.slots.release()
+
+    def _finish(self, item, result=None, error=None):
+        if self.items.pop(item.seq, None) is None:
+            return # Already finished (stop() racing a send)
+        self.pending[item.priority] -= 1
+        if error is None:
+            self.sent += 1
+            self.latency.append(time.monotonic() - item.queued_at)
+            if not item.future.done():
+                item.future.set_result(result)
+        else:
+            self.failed += 1
+            if item.outbox_key and self.outbox:
+                self.outbox.defer(item.outbox_key, item.method, item.kwargs, item.priority, error)
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    def depth(self):
+        return {PRIORITY_NAMES[p]: n for p, n in self.pending.items()}
+
+    def summary(self):
+        queued = " ".join(f"{name}={n}" for name, n in self.depth().items())
+        text = f"queued {queued} | sent {self.sent} failed {self.failed} retried {self.retried}"
+        if self.latency:
+            samples = sorted(self.latency)
+            avg = sum(samples) / len(samples)
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            text += f" | latency avg={avg:.2f}s p95={p95:.2f}s"
+        return text
+
+
+def get_dispatcher(context):
+    """The application's MessageDispatcher (created on first use)."""
+    dispatcher = context.bot_data.get('dispatcher')
+    if dispatcher is None:
+        dispatcher = context.bot_data['dispatcher'] = MessageDispatcher(context.bot)
+    return dispatcher
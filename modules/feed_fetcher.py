@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+import httpx
+import feedparser
+
+logger = logging.getLogger(__name__)
+
+class FeedFetcher:
+    """
+    Downloads RSS feeds concurrently with conditional GET.
+
+    The ETag / Last-Modified of every feed are kept (and persisted in the
+    `feed_cache` table when a db is given) and sent back on the next request,
+    so an unchanged feed costs a 304 and no parsing. New validators stay
+    pending until the caller has handled the feed's entries and calls
+    `commit()`; `discard()` drops them, so the next request fetches the
+    body again instead of getting a 304 for entries never posted. At most `per_host`
+    requests run against one host, and every feed has its own `timeout`.
+    Parsing runs in the default executor to keep the event loop free.
+    """
+    def __init__(self, db=None, timeout=15, per_host=2):
+        self.db = db
+        self.timeout = timeout # Seconds per feed (connect + download)
+        self.per_host = per_host
+        self.validators = db.get_feed_validators() if db else {} # url -> (etag, last_modified)
+        self.pending = {} # url -> (etag, last_modified) fetched, not committed yet
+        self.host_limits = {}
+        self.client = None
+
+    def _client(self):
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=self.timeout,
+                headers={'User-Agent': 'Mozilla/5.0 (compatible; AuronisSignalBot/1.0)'}
+            )
+        return self.client
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def fetch_all(self, urls):
+        """
+        {url: parsed feed} of every url; None when the feed is unchanged since
+        the last fetch. Failed feeds are logged and left out.
+        """
+        results = await asyncio.gather(*[self.fetch(url) for url in urls], return_exceptions=True)
+        feeds = {}
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"Feed {url} failed: {result!r}")
+            else:
+                feeds[url] = result
+        return feeds
+
+    def commit(self, urls):
+        """Keep (and persist) the validators fetched for `urls`, once their entries are handled."""
+        changed = [(url, *self.pending.pop(url)) for url in urls if url in self.pending]
+        for url, etag, last_modified in changed:
+            self.validators[url] = (etag, last_modified)
+        if changed and self.db:
+            self.db.set_feed_validators(changed)
+
+    def discard(self, urls):
+        """Forget the validators fetched for `urls`; their next fetch returns the body again."""
+        for url in urls:
+            self.pending.pop(url, None)
+
+    async def fetch(self, url):
+        host = urlsplit(url).netloc
+        limit = self.host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with limit:
+            return await asyncio.wait_for(self._fetch(url), self.timeout)
+
+    async def _fetch(self, url):
+        headers = {}
+        etag, last_modified = self.validators.get(url, (None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        response = await self._client().get(url, headers=headers)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        loop = asyncio.get_running_loop()
+        feed = await loop.run_in_executor(None, feedparser.parse, response.content)
+        if response.headers.get('etag') or response.headers.get('last-modified'):
+            self.pending[url] = (response.headers.get('etag'), response.headers.get('last-modified'))
+        return feed
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import datetime
+
+from .dispatcher import get_dispatcher, TRANSACTIONAL, BROADCAST
+from .utils import asset_groups
+
+logger = logging.getLogger(__name__)
+
+class InvitePool:
+    """
+    Keeps `size` single-use invite links per premium group in the
+    `invite_links` table, so confirming a payment only claims rows instead of
+    waiting on `create_chat_invite_link` for every group.
+
+    Links live `ttl_hours`; the ones with less than `min_hours_left` are no
+    longer handed out (the user needs time to click) and are replaced by
+    `refill()`. When a group's pool is empty a link is created on the spot.
+    """
+    REFILL_SECONDS = 600
+
+    def __init__(self, db, size=5, ttl_hours=24, min_hours_left=6):
+        self.db = db
+        self.size = size # Available links kept per group
+        self.ttl = datetime.timedelta(hours=ttl_hours)
+        self.min_left = datetime.timedelta(hours=min_hours_left)
+
+    async def refill(self, context):
+        """Job: top every group up to `size` usable links."""
+        now = datetime.datetime.now()
+        self.db.purge_invite_links(now)
+        counts = self.db.count_invite_links(now + self.min_left)
+        dispatcher = get_dispatcher(context)
+        wanted = [(gid, self.size - counts.get(gid, 0)) for gid in asset_groups().values()]
+        wanted = [(gid, n) for gid, n in wanted if n > 0]
+        if not wanted:
+            return
+
+        expires_at = now + self.ttl
+        results = await asyncio.gather(*[
+            self._create(dispatcher, gid, "Pool", expires_at, BROADCAST)
+            for gid, n in wanted for _ in range(n)
+        ], return_exceptions=True)
+        links = [r for r in results if not isinstance(r, Exception)]
+        errors = [r for r in results if isinstance(r, Exception)]
+        self.db.add_invite_links(links)
+        if errors:
+            logger.warning(f"Invite pool: {len(errors)} links could not be created ({errors[0]})")
+        logger.info(f"Invite pool: {len(links)} links added")
+
+    async def claim(self, context, group_id, user_id, sub_id):
+        """Invite link for one user (from the pool, else created now); None on failure."""
+        link = self.db.claim_invite_link(group_id, user_id, sub_id, datetime.datetime.now() + self.min_left)
+        if link:
+            return link
+        try:
+            _, link, _ = await self._create(
+                get_dispatcher(context), group_id, f"Sub {user_id}",
+                datetime.datetime.now() + self.ttl, TRANSACTIONAL
+            )
+            return link
+        except Exception as e:
+            logger.error(f"Invite link for {user_id} in {group_id} failed: {e}")
+            return None
+
+    @staticmethod
+    async def _create(dispatcher, group_id, name, expires_at, priority):
+        invite = await dispatcher.send(
+            'create_chat_invite_link', priority,
+            chat_id=group_id, name=name, member_limit=1, expire_date=expires_at
+        )
+        return (group_id, invite.invite_link, expires_at)
+
+    def summary(self):
+        counts = self.db.count_invite_links(datetime.datetime.now() + self.min_left)
+        return {asset: counts.get(gid, 0) for asset, gid in asset_groups().items()}
+
+
+def get_invite_pool(context, db):
+    """The application's InvitePool (created on first use)."""
+    pool = context.bot_data.get('invite_pool')
+    if pool is None:
+        pool = context.bot_data['invite_pool'] = InvitePool(db)
+    return pool
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import datetime
+
+from .dispatcher import get_dispatcher, TRANSACTIONAL
+from .membership import is_in_group
+from .utils import asset_groups, package_assets
+
+logger = logging.getLogger(__name__)
+
+# Reminder stages: (ledger stage, days before end_date), closest first
+REMINDER_STAGES = (('1d', 1), ('3d', 3))
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+def _time_left(end_date, now):
+    left = _as_datetime(end_date) - now
+    if left >= datetime.timedelta(days=1):
+        days = round(left / datetime.timedelta(days=1))
+        return f"{days} day{'s' if days != 1 else ''}"
+    hours = max(1, round(left / datetime.timedelta(hours=1)))
+    return f"{hours} hour{'s' if hours != 1 else ''}"
+
+class SubscriptionLifecycle:
+    """
+    Expiry reminders and expirations, run as job-queue tasks inside the bot.
+
+    Reminders are driven by the `reminder_ledger` table (one row per
+    subscription and stage): every run sends the stages whose time has come
+    and that have no ledger row yet, so a missed run is caught up on the
+    next one. When several stages are due at once only the closest one is
+    sent, the others are recorded as skipped. A stage whose window opened
+    before the subscription started (e.g. 3d on a 2 day package) is never
+    sent. The 'expired' stage is the
+    notice sent by `process_expirations`. A send that fails is marked
+    'failed' and left to the outbox (key `reminder:<sub>:<stage>` or
+    `expired:<sub>`), which retries it and dead-letters it for /deadletters;
+    the ledger does not resend it, so it is never delivered twice.
+
+    Expirations keep a watermark in `system_settings` and only look at the
+    subscriptions whose `end_date` fell between the watermark and now. A
+    subscription is only expired once its kicks went through; otherwise the
+    watermark stays before it and the next run retries. Both
+    reads go through the (status, end_date) index. cron_tasks.py runs the
+    same code once.
+    """
+    CHECK_SECONDS = 300
+    EXPIRY_WATERMARK = 'expiry_watermark'
+
+    def __init__(self, db, stages=REMINDER_STAGES, concurrency=8):
+        self.db = db
+        self.stages = sorted(stages, key=lambda stage: stage[1]) # Closest first
+        self.concurrency = concurrency # Sends/kicks in flight
+
+    def _watermark(self, key, default):
+        value = self.db.get_setting(key)
+        return datetime.datetime.fromisoformat(value) if value else default
+
+    # --- Jobs ---
+    async def reminders_job(self, context):
+        await self.send_reminders(get_dispatcher(context))
+
+    async def expirations_job(self, context):
+        await self.process_expirations(get_dispatcher(context))
+
+    # --- Tasks ---
+    async def send_reminders(self, dispatcher):
+        """Send every due reminder stage that the ledger has no row for."""
+        now = datetime.datetime.now()
+        due = [] # (subscription row, stage)
+        skipped = []
+        covered = set()
+        for stage, days in self.stages: # Closest first: it wins when several are due
+            for sub in self.db.get_due_reminders(stage, days, now):
+                if sub['id'] in covered:
+                    skipped.append((sub['id'], stage, 'skipped')) # A closer stage is sent instead
+                else:
+                    covered.add(sub['id'])
+                    due.append((sub, stage))
+        if skipped:
+            self.db.claim_reminders(skipped)
+        if not due:
+            return
+
+        claimed = set(self.db.claim_reminders([(sub['id'], stage, 'pending') for sub, stage in due]))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def remind(sub, stage):
+            async with semaphore:
+                msg = (
+                    f"⚠️ **Subscription Reminder**\n"
+                    f"Hi {sub['username']}, your subscription will expire in {_time_left(sub['end_date'], now)}.\n"
+                    f"Please renew to avoid losing access."
+                )
+                try:
+                    await dispatcher.send_message(
+                        sub['user_id'], msg, priority=TRANSACTIONAL, parse_mode='Markdown',
+                        outbox_key=f"reminder:{sub['id']}:{stage}"
+                    )
+                    return ('sent', sub['id'], stage)
+                except Exception as e:
+                    logger.warning(f"Failed to send {stage} reminder to {sub['user_id']}: {e}") # Owned by the outbox from here
+                    return ('failed', sub['id'], stage)
+
+        results = await asyncio.gather(*[remind(sub, stage) for sub, stage in due if (sub['id'], stage) in claimed])
+        self.db.set_reminder_status(results)
+        if results:
+            logger.info(f"Sent {sum(r[0] == 'sent' for r in results)}/{len(results)} expiry reminders")
+
+    async def process_expirations(self, dispatcher):
+        """Expire the subscriptions that ended since the last run and remove their users from the groups."""
+        now = datetime.datetime.now()
+        since = self._watermark(self.EXPIRY_WATERMARK, datetime.datetime.min) # First run: the whole backlog
+        expired_subs = self.db.get_expired_between(since, now)
+        if not expired_subs:
+            self.db.set_setting(self.EXPIRY_WATERMARK, str(now))
+            return
+
+        # Only the groups the package paid for, minus those still covered
+        # by another active subscription of the same user. Users the membership
+        # index knows have already left are skipped; unknown ones are still kicked.
+        groups = asset_groups()
+        user_ids = [sub['user_id'] for sub in expired_subs]
+        still_active = self.db.get_active_assets(user_ids)
+        membership = self.db.get_member_statuses(user_ids)
+        kicks = {} # (group_id, user_id) -> (username, ids of the subscriptions it ends)
+        skipped = 0
+        for sub in expired_subs:
+            user_id = sub['user_id']
+            covered = {a for assets in still_active.get(user_id, []) for a in package_assets(assets)}
+            for asset in package_assets(sub['assets']):
+                if asset not in groups or asset in covered:
+                    continue
+                status = membership.get((groups[asset], user_id))
+                if status is not None and not is_in_group(status):
+                    skipped += 1
+                    continue
+                kicks.setdefault((groups[asset], user_id), (sub['username'], set()))[1].add(sub['id'])
+        if skipped:
+            logger.info(f"Skipped {skipped} kicks of users no longer in the group")
+
+        # 1. Kick (ban + unban so they can re-join later), bounded parallelism
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def kick(group_id, user_id, username):
+            async with semaphore:
+                try:
+                    await dispatcher.send('ban_chat_member', TRANSACTIONAL, chat_id=group_id, user_id=user_id)
+                    await dispatcher.send('unban_chat_member', TRANSACTIONAL, chat_id=group_id, user_id=user_id, only_if_banned=True)
+                    self.db.set_member_status(group_id, user_id, 'left')
+                    return True
+                except Exception as e:
+                    logger.error(f"Failed to kick {username} from {group_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*[kick(g, u, name) for (g, u), (name, _) in kicks.items()])
+        failed = {sub_id for ok, (_, sub_ids) in zip(results, kicks.values()) if not ok for sub_id in sub_ids}
+
+        # 2. Expire the subscriptions whose users are out. Those with a failed
+        # kick stay active and the watermark stops just before the earliest
+        # one, so the next run selects (and kicks) them again.
+        watermark = now
+        if failed:
+            watermark = min(_as_datetime(sub['end_date']) for sub in expired_subs if sub['id'] in failed) - datetime.timedelta(microseconds=1)
+            logger.warning(f"{len(failed)} expired subscriptions kept for retry, kicks failed")
+            expired_subs = [sub for sub in expired_subs if sub['id'] not in failed]
+        self.db.expire_subscriptions([sub['id'] for sub in expired_subs])
+        self.db.set_setting(self.EXPIRY_WATERMARK, str(watermark))
+
+        # 3. Notify users (once per subscription, through the reminder ledger)
+        claimed = {sub_id for sub_id, _ in self.db.claim_reminders([(sub['id'], 'expired', 'pending') for sub in expired_subs])}
+
+        async def notify(sub):
+            async with semaphore:
+                try:
+                    await dispatcher.send_message(
+                        sub['user_id'],
+                        "❌ Your subscription has expired. You have been removed from the premium groups.",
+                        priority=TRANSACTIONAL,
+                        outbox_key=f"expired:{sub['id']}"
+                    )
+                    return ('sent', sub['id'], 'expired')
+                except Exception as e:
+                    logger.warning(f"Failed to notify {sub['user_id']} of expiration: {e}")
+                    return ('failed', sub['id'], 'expired')
+
+        self.db.set_reminder_status(await asyncio.gather(*[notify(sub) for sub in expired_subs if sub['id'] in claimed]))
+        logger.info(f"Expired {len(expired_subs)} subscriptions, {len(kicks)} group removals")
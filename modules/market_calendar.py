@@ -0,0 +1,176 @@
+import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+UTC = datetime.timezone.utc
+NEW_YORK = ZoneInfo("America/New_York")
+
+def _t(hhmm):
+    h, m = hhmm.split(':')
+    return int(h) * 60 + int(m)
+
+DAY = (0, 24 * 60)
+
+# Static weekly session tables: weekday (Mon=0) -> [(open_minute, close_minute)] in local time
+SESSIONS = {
+    # 24/7
+    'crypto': {
+        'tz': UTC,
+        'week': {d: [DAY] for d in range(7)},
+    },
+    # US equities (NYSE/Nasdaq regular hours)
+    'stocks': {
+        'tz': NEW_YORK,
+        'week': {d: [(_t('09:30'), _t('16:00'))] for d in range(5)},
+        'holidays': 'nyse',
+    },
+    # Spot FX: Sunday 17:00 New York -> Friday 17:00 New York
+    'forex': {
+        'tz': NEW_YORK,
+        'week': {
+            6: [(_t('17:00'), DAY[1])],
+            0: [DAY], 1: [DAY], 2: [DAY], 3: [DAY],
+            4: [(0, _t('17:00'))],
+        },
+    },
+    # CME Globex metals (GC=F, SI=F): Sunday 18:00 -> Friday 17:00 New York, daily break 17:00-18:00
+    'gold': {
+        'tz': NEW_YORK,
+        'week': {
+            6: [(_t('18:00'), DAY[1])],
+            0: [(0, _t('17:00')), (_t('18:00'), DAY[1])],
+            1: [(0, _t('17:00')), (_t('18:00'), DAY[1])],
+            2: [(0, _t('17:00')), (_t('18:00'), DAY[1])],
+            3: [(0, _t('17:00')), (_t('18:00'), DAY[1])],
+            4: [(0, _t('17:00'))],
+        },
+    },
+}
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return datetime.date(year, month, day)
+
+def _nth_weekday(year, month, weekday, n):
+    """n-th `weekday` of the month (n=-1 for the last one)."""
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    nxt = datetime.date(year + (month == 12), month % 12 + 1, 1)
+    last = nxt - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+def _observed(day):
+    """Saturday holidays are observed on Friday, Sunday ones on Monday."""
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+@lru_cache(maxsize=16)
+def nyse_holidays(year):
+    """Full-day NYSE closures, computed from the exchange's rules (no network/data files)."""
+    days = {
+        _nth_weekday(year, 1, 0, 3),             # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),             # Washington's Birthday
+        _easter(year) - datetime.timedelta(days=2), # Good Friday
+        _nth_weekday(year, 5, 0, -1),            # Memorial Day
+        _observed(datetime.date(year, 7, 4)),    # Independence Day
+        _nth_weekday(year, 9, 0, 1),             # Labor Day
+        _nth_weekday(year, 11, 3, 4),            # Thanksgiving
+        _observed(datetime.date(year, 12, 25)),  # Christmas
+    }
+    # New Year's Day: a Saturday New Year is not observed on the Friday before
+    new_year = datetime.date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(datetime.date(year, 6, 19))) # Juneteenth
+    return frozenset(days)
+
+@lru_cache(maxsize=16)
+def nyse_early_closes(year):
+    """13:00 closes: July 3rd, day after Thanksgiving, Christmas Eve (when trading days)."""
+    days = {_nth_weekday(year, 11, 3, 4) + datetime.timedelta(days=1)}
+    for day in (datetime.date(year, 7, 3), datetime.date(year, 12, 24)):
+        if day.weekday() < 5 and day not in nyse_holidays(year):
+            days.add(day)
+    return frozenset(days)
+
+
+class MarketCalendar:
+    """
+    Offline market hours per asset class (crypto, stocks, forex, gold).
+    All datetimes in/out are UTC (aware, or naive meaning UTC).
+    """
+    def _sessions(self, category, day):
+        """[(open_utc, close_utc)] of `category` on local calendar date `day`."""
+        spec = SESSIONS.get(category)
+        if spec is None:
+            spec = SESSIONS['crypto'] # Unknown classes are treated as always open
+        intervals = spec['week'].get(day.weekday(), [])
+        if spec.get('holidays') == 'nyse':
+            if day in nyse_holidays(day.year):
+                return []
+            if day in nyse_early_closes(day.year):
+                intervals = [(o, min(c, _t('13:00'))) for o, c in intervals]
+        tz = spec['tz']
+        midnight = datetime.datetime.combine(day, datetime.time(0), tzinfo=tz)
+        result = []
+        for open_min, close_min in intervals:
+            # Wall-clock arithmetic in local time, then to UTC (handles DST switches)
+            start = (midnight + datetime.timedelta(minutes=open_min)).astimezone(UTC)
+            end = (midnight + datetime.timedelta(minutes=close_min)).astimezone(UTC)
+            result.append((start, end))
+        return result
+
+    def _local_days(self, category, when, days_before=1, days_after=0):
+        tz = SESSIONS.get(category, SESSIONS['crypto'])['tz']
+        local = when.astimezone(tz).date()
+        for offset in range(-days_before, days_after + 1):
+            yield local + datetime.timedelta(days=offset)
+
+    @staticmethod
+    def _utc(when):
+        if when is None:
+            return datetime.datetime.now(UTC)
+        return when.replace(tzinfo=UTC) if when.tzinfo is None else when.astimezone(UTC)
+
+    def is_open(self, category, when=None):
+        when = self._utc(when)
+        for day in self._local_days(category, when, days_before=1, days_after=1):
+            for start, end in self._sessions(category, day):
+                if start <= when < end:
+                    return True
+        return False
+
+    def next_open(self, category, when=None, max_days=14):
+        """Start of the next session (or `when` itself if the market is open)."""
+        when = self._utc(when)
+        if self.is_open(category, when):
+            return when
+        for day in self._local_days(category, when, days_before=0, days_after=max_days):
+            for start, _ in self._sessions(category, day):
+                if start > when:
+                    return start
+        return None
+
+    def is_open_during(self, category, start, end):
+        """True if any part of [start, end) falls inside a session."""
+        start, end = self._utc(start), self._utc(end)
+        if self.is_open(category, start):
+            return True
+        nxt = self.next_open(category, start)
+        return nxt is not None and nxt < end
@@ -5,19 +5,42 @@ import yfinance as yf
 
 logger = logging.getLogger(__name__)
 
+def timeframe_to_seconds(timeframe: str) -> int:
+    """'15m' -> 900, '1h' -> 3600, '1d' -> 86400"""
+    units = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    return int(timeframe[:-1]) * units[timeframe[-1]]
+
+def utc_now() -> pd.Timestamp:
+    """Naive UTC timestamp (the convention of every candle DataFrame here)."""
+    return pd.Timestamp.now(tz='UTC').tz_localize(None)
+
+def drop_open_candle(df: pd.DataFrame, timeframe: str, now=None) -> pd.DataFrame:
+    """Remove the last bar if it is still forming (its close time is in the future)."""
+    if df.empty:
+        return df
+    now = now if now is not None else utc_now()
+    close_time = df['timestamp'].iloc[-1] + pd.Timedelta(seconds=timeframe_to_seconds(timeframe))
+    return df.iloc[:-1] if close_time > now else df
+
 class MarketData:
     def __init__(self, exchange_id='binance'):
         self.exchange = getattr(ccxt, exchange_id)({
             'enableRateLimit': True,
         })
     
-    def fetch_ohlcv(self, symbol: str, timeframe: str = '15m', limit: int = 100) -> pd.DataFrame:
+    @staticmethod
+    def resolve_source(symbol: str, source: str = 'auto') -> str:
+        """'ccxt' or 'yahoo'. 'auto' treats pairs with '/' as crypto."""
+        if source and source != 'auto':
+            return source
+        return 'ccxt' if '/' in symbol else 'yahoo'
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = '15m', limit: int = 100, source: str = 'auto') -> pd.DataFrame:
         """
         Fetch OHLCV data from exchange (Crypto) or Yahoo Finance (Stocks/Forex/Gold).
         """
         try:
-            # Check if symbol is Crypto (contains '/')
-            if '/' in symbol:
+            if self.resolve_source(symbol, source) == 'ccxt':
                 return self._fetch_crypto(symbol, timeframe, limit)
             else:
                 return self._fetch_yahoo(symbol, timeframe, limit)
@@ -36,6 +59,7 @@ class MarketData:
         # yfinance supports: 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo
         period = "5d" # Default period
         if timeframe == '1d': period = "1y"
+        elif limit > 100: period = "1mo" # Enough bars to warm up SMA 200 on intraday data
         
         ticker = yf.Ticker(symbol)
         df = ticker.history(period=period, interval=timeframe)
@@ -60,12 +84,114 @@ class MarketData:
         # Ensure lowercase columns
         df.columns = [c.lower() for c in df.columns]
         
-        # Remove timezone if present to match CCXT
+        # Convert to naive UTC to match CCXT
         if 'timestamp' in df.columns and df['timestamp'].dt.tz is not None:
-            df['timestamp'] = df['timestamp'].dt.tz_localize(None)
+            df['timestamp'] = df['timestamp'].dt.tz_convert(None)
             
         return df.tail(limit)
 
+    def fetch_history(self, symbol: str, timeframe: str = '15m', since=None, until=None) -> pd.DataFrame:
+        """
+        Fetch a long OHLCV history (for backtests).
+        Crypto is paginated through CCXT; Yahoo only serves ~60 days of intraday bars.
+        """
+        since = pd.Timestamp(since) if since is not None else utc_now() - pd.Timedelta(days=365)
+        until = pd.Timestamp(until) if until is not None else utc_now()
+        try:
+            if '/' in symbol:
+                return self._fetch_crypto_history(symbol, timeframe, since, until)
+            else:
+                return self._fetch_yahoo_history(symbol, timeframe, since, until)
+        except Exception as e:
+            logger.error(f"Error fetching history for {symbol}: {e}")
+            return pd.DataFrame()
+
+    def _fetch_crypto_history(self, symbol, timeframe, since, until):
+        step_ms = timeframe_to_seconds(timeframe) * 1000
+        cursor = int(since.timestamp() * 1000)
+        end = int(until.timestamp() * 1000)
+        rows = []
+        while cursor < end:
+            batch = self.exchange.fetch_ohlcv(symbol, timeframe, since=cursor, limit=1000)
+            if not batch:
+                break
+            rows.extend(batch)
+            cursor = batch[-1][0] + step_ms
+        df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df = df.drop_duplicates('timestamp')
+        df = df[df['timestamp'] < end]
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df.reset_index(drop=True)
+
+    def _fetch_yahoo_history(self, symbol, timeframe, since, until):
+        df = yf.Ticker(symbol).history(start=since, end=until, interval=timeframe)
+        if df.empty:
+            return pd.DataFrame()
+        df = df.reset_index()
+        df = df.rename(columns={'Date': 'timestamp', 'Datetime': 'timestamp'})
+        df.columns = [c.lower() for c in df.columns]
+        if df['timestamp'].dt.tz is not None:
+            df['timestamp'] = df['timestamp'].dt.tz_convert(None)
+        return df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+
+    def fetch_price_ranges(self, requests: dict) -> dict:
+        """
+        Traded range of each symbol since a point in time, from 1m candles.
+        requests: {symbol: (source, since)} with `since` naive UTC.
+        Returns {symbol: (low, high, last, last_bar_time)}; symbols without data are left out.
+
+        One request per crypto pair, one batched yf.download for every Yahoo ticker.
+        """
+        ranges = {}
+        yahoo = {}
+        for symbol, (source, since) in requests.items():
+            if self.resolve_source(symbol, source) == 'ccxt':
+                try:
+                    ranges.update(self._crypto_range(symbol, since))
+                except Exception as e:
+                    logger.error(f"Error fetching price range for {symbol}: {e}")
+            else:
+                yahoo[symbol] = since
+        if yahoo:
+            try:
+                ranges.update(self._yahoo_ranges(yahoo))
+            except Exception as e:
+                logger.error(f"Error fetching Yahoo price ranges: {e}")
+        return ranges
+
+    def _crypto_range(self, symbol, since):
+        ohlcv = self.exchange.fetch_ohlcv(symbol, '1m', since=int(pd.Timestamp(since).timestamp() * 1000), limit=1000)
+        if not ohlcv:
+            return {}
+        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        last_bar = pd.to_datetime(df['timestamp'].iloc[-1], unit='ms')
+        return {symbol: (float(df['low'].min()), float(df['high'].max()), float(df['close'].iloc[-1]), last_bar)}
+
+    def _yahoo_ranges(self, requests):
+        # Yahoo only serves 1m bars for the last 7 days
+        start = max(min(requests.values()), utc_now() - pd.Timedelta(days=6))
+        df = yf.download(
+            list(requests), start=start, interval='1m',
+            group_by='ticker', progress=False, threads=True, auto_adjust=False
+        )
+        if df.empty:
+            return {}
+        if df.index.tz is not None:
+            df.index = df.index.tz_convert(None)
+        ranges = {}
+        for symbol, since in requests.items():
+            if isinstance(df.columns, pd.MultiIndex):
+                if symbol not in df.columns.get_level_values(0):
+                    continue
+                bars = df[symbol]
+            else:
+                bars = df
+            bars = bars[bars.index >= since].dropna(subset=['Low', 'High', 'Close'])
+            if bars.empty:
+                continue
+            ranges[symbol] = (float(bars['Low'].min()), float(bars['High'].max()), float(bars['Close'].iloc[-1]), bars.index[-1])
+        return ranges
+
     def get_current_price(self, symbol: str) -> float:
         try:
             if '/' in symbol:
@@ -0,0 +1,44 @@
+import logging
+
+from telegram import Update, ChatMember
+from telegram.ext import ContextTypes
+
+from database import BotDatabase
+from modules.utils import asset_groups
+
+logger = logging.getLogger(__name__)
+
+db = BotDatabase()
+
+def member_status(member: ChatMember):
+    """Status stored in `group_members`; a restricted user who left counts as 'left'."""
+    if member.status == ChatMember.RESTRICTED and not getattr(member, 'is_member', True):
+        return ChatMember.LEFT
+    return member.status
+
+def is_in_group(status):
+    return status in (ChatMember.MEMBER, ChatMember.RESTRICTED, ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+async def track_group_member(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    ChatMemberHandler: keeps the `group_members` index of the premium groups.
+
+    Telegram only sends chat_member updates to bots that are admin of the
+    group, and only when `allowed_updates` asks for them (see main.py).
+    Users are indexed from their first join/leave after the bot was added;
+    everyone else is unknown and treated as such by the callers.
+    """
+    change = update.chat_member
+    if not change:
+        return
+    group_id = change.chat.id
+    if group_id not in asset_groups().values():
+        return
+    user = change.new_chat_member.user
+    if user.is_bot:
+        return
+    status = member_status(change.new_chat_member)
+    db.set_member_status(group_id, user.id, status)
+    if is_in_group(status) and not is_in_group(member_status(change.old_chat_member)):
+        db.mark_joined(user.id)
+        logger.info(f"User {user.id} joined group {group_id}")
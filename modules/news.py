@@ -1,75 +1,323 @@
+import html
+import heapq
 import logging
 import datetime
-import feedparser
 from telegram.ext import ContextTypes
+from .market_calendar import MarketCalendar
+from .feed_fetcher import FeedFetcher
+from .news_dedup import NewsDedup, SimHashIndex
+from .dispatcher import get_dispatcher, NEWS
 
 logger = logging.getLogger(__name__)
 
+ICONS = {
+    'crypto': '₿',
+    'stocks': '📈',
+    'forex': '💱',
+    'gold': '🥇'
+}
+
+# Seeded into the `news_feeds` registry when it is empty
+DEFAULT_FEEDS = {
+    'crypto': [
+        'https://cointelegraph.com/rss',
+        'https://www.coindesk.com/arc/outboundfeeds/rss/'
+    ],
+    'stocks': [
+        'https://finance.yahoo.com/news/rssindex',
+        'https://feeds.content.dowjones.io/public/rss/mw/topstories'
+    ],
+    'forex': [
+        'https://www.dailyfx.com/feeds/market-news',
+        'https://www.investing.com/rss/news_1.rss' # General forex news
+    ],
+    'gold': [
+        'https://www.kitco.com/rss/latest/commodities',
+        'https://www.investing.com/rss/commodities_Metals.rss'
+    ]
+}
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
 class NewsAggregator:
-    def __init__(self):
-        self.last_news_links = set() # Cache to avoid duplicates
-        self.feeds = {
-            'crypto': [
-                'https://cointelegraph.com/rss',
-                'https://www.coindesk.com/arc/outboundfeeds/rss/'
-            ],
-            'stocks': [
-                'https://finance.yahoo.com/news/rssindex',
-                'https://feeds.content.dowjones.io/public/rss/mw/topstories'
-            ],
-            'forex': [
-                'https://www.dailyfx.com/feeds/market-news',
-                'https://www.investing.com/rss/news_1.rss' # General forex news
-            ],
-            'gold': [
-                'https://www.kitco.com/rss/latest/commodities',
-                'https://www.investing.com/rss/commodities_Metals.rss'
+    """
+    Polls the feeds of the `news_feeds` registry, each on its own cadence.
+
+    Feeds sit in a min-heap by `next_poll_at`; `poll_due()` runs as a
+    one-shot job at the earliest due time, polls only the due feeds and
+    re-arms itself. After each poll the feed's publish rate (new entries per
+    hour, smoothed) sets its next interval so that about `TARGET_PER_POLL`
+    new entries are waiting: busy feeds are polled often, idle ones back
+    off up to `MAX_INTERVAL`. Feeds of a closed market wait
+    `closed_poll_every` intervals, but never past the next open.
+    """
+    MIN_INTERVAL = 300
+    MAX_INTERVAL = 6 * 3600
+    DEFAULT_INTERVAL = 3600
+    TARGET_PER_POLL = 1.5
+    RATE_SMOOTHING = 0.3 # Weight of the latest observation in the publish rate
+    JOB_NAME = "news_check"
+
+    def __init__(self, db=None, near_dup_distance=None):
+        self.db = db
+        # Links already posted (survives restarts) and recent stories for near-duplicates;
+        # near_dup_distance = {category: max differing SimHash bits}
+        self.dedup = NewsDedup(db, max_distance=near_dup_distance)
+        self.fetcher = FeedFetcher(db) # Concurrent, conditional GET
+        self.calendar = MarketCalendar()
+        self.closed_poll_every = 4 # While a market is closed, feeds wait this many intervals
+        self.digest_entries_per_feed = 5 # Digest mode reads deeper, it costs one message anyway
+        self.digest_max_items = 10
+        self.digest_window = datetime.timedelta(hours=1) # Entries gathered per digest message
+        self.digests = {} # group_id -> pending digest (see _queue_digest)
+        self.feeds = {} # id -> feed dict
+        self.heap = [] # (next_poll_at, feed id); stale entries are skipped on pop
+        self.job_data = None # Data of the scheduled job, reused when re-arming
+        self.load()
+
+    def load(self):
+        """(Re)load the registry and rebuild the heap."""
+        if self.db:
+            self.db.seed_feeds([(url, category) for category, urls in DEFAULT_FEEDS.items() for url in urls])
+            rows = [dict(r) for r in self.db.get_feeds(enabled_only=True)]
+        else:
+            rows = [
+                {'id': i, 'url': url, 'category': category, 'interval_seconds': self.DEFAULT_INTERVAL,
+                 'rate_per_hour': None, 'next_poll_at': None, 'last_polled_at': None}
+                for i, (category, url) in enumerate(
+                    ((c, u) for c, urls in DEFAULT_FEEDS.items() for u in urls), start=1)
             ]
-        }
+        now = datetime.datetime.now()
+        self.feeds = {}
+        self.heap = []
+        for feed in rows:
+            feed['next_poll_at'] = _as_datetime(feed['next_poll_at']) or now
+            feed['last_polled_at'] = _as_datetime(feed['last_polled_at'])
+            self.feeds[feed['id']] = feed
+            self.heap.append((feed['next_poll_at'], feed['id']))
+        heapq.heapify(self.heap)
+
+    def feeds_of(self, categories):
+        return [f for f in self.feeds.values() if f['category'] in categories]
+
+    # --- Scheduling ---
+    def arm(self, job_queue, data=None, min_delay=1.0):
+        """(Re)schedule the one-shot poll job at the earliest due feed or digest."""
+        if data is not None:
+            self.job_data = data
+        if not job_queue or self.job_data is None:
+            return
+        due = [self.heap[0][0]] if self.heap else []
+        due += [d['flush_at'] for d in self.digests.values()]
+        if not due:
+            return
+        for job in job_queue.get_jobs_by_name(self.JOB_NAME):
+            job.schedule_removal()
+        delay = max(min_delay, (min(due) - datetime.datetime.now()).total_seconds())
+        job_queue.run_once(self.poll_due, when=delay, data=self.job_data, name=self.JOB_NAME)
 
+    def reload(self, job_queue):
+        """Registry changed (/addfeed, /delfeed): rebuild and re-arm."""
+        self.load()
+        self.arm(job_queue)
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            when, feed_id = heapq.heappop(self.heap)
+            feed = self.feeds.get(feed_id)
+            if feed and feed['next_poll_at'] == when:
+                due.append(feed)
+        return due
+
+    def _reschedule(self, feed, when):
+        feed['next_poll_at'] = when
+        heapq.heappush(self.heap, (when, feed['id']))
+
+    def _adapt(self, feed, new, saturated, now):
+        """Update the feed's publish rate from `new` entries since its last poll; returns the next interval."""
+        last = feed['last_polled_at']
+        hours = max(60.0, (now - last).total_seconds()) / 3600 if last else feed['interval_seconds'] / 3600
+        observed = new / hours
+        if saturated:
+            observed *= 2 # Every entry read was new, more were probably missed
+        rate = feed['rate_per_hour']
+        rate = observed if rate is None else self.RATE_SMOOTHING * observed + (1 - self.RATE_SMOOTHING) * rate
+        feed['rate_per_hour'] = rate
+        feed['last_polled_at'] = now
+        if rate > 0:
+            interval = 3600 * self.TARGET_PER_POLL / rate
+        else:
+            interval = feed['interval_seconds'] * 2
+        feed['interval_seconds'] = int(min(self.MAX_INTERVAL, max(self.MIN_INTERVAL, interval)))
+        return feed['interval_seconds']
+
+    async def poll_due(self, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Job: poll the feeds that are due, then re-arm at the next due time.
+        Job data: {'groups': {...}, 'market_hours': bool, 'digest': bool}
+        """
+        data = context.job.data
+        groups = data.get('groups', {})
+        now = datetime.datetime.now()
+        try:
+            due = self._pop_due(now)
+            polled = []
+            for feed in due:
+                category = feed['category']
+                interval = datetime.timedelta(seconds=feed['interval_seconds'])
+                if not groups.get(category):
+                    self._reschedule(feed, now + datetime.timedelta(seconds=self.MAX_INTERVAL))
+                elif data.get('market_hours') and not self.calendar.is_open(category):
+                    wake = now + interval * self.closed_poll_every
+                    next_open = self.calendar.next_open(category)
+                    if next_open:
+                        wake = min(wake, next_open.astimezone().replace(tzinfo=None))
+                    self._reschedule(feed, wake)
+                else:
+                    polled.append(feed)
+
+            if polled:
+                counts = await self._poll(context, polled, groups, data.get('digest', False))
+                now = datetime.datetime.now()
+                for feed in polled:
+                    if feed['url'] in counts:
+                        new, saturated = counts[feed['url']]
+                        interval = self._adapt(feed, new, saturated, now)
+                    else:
+                        interval = feed['interval_seconds'] # Failed, try again on the usual cadence
+                    self._reschedule(feed, now + datetime.timedelta(seconds=interval))
+            if due and self.db:
+                self.db.update_feed_schedule([
+                    (f['interval_seconds'], f['rate_per_hour'], f['next_poll_at'], f['last_polled_at'], f['id'])
+                    for f in due
+                ])
+            await self.flush_digests(context)
+        finally:
+            self.arm(context.job_queue, data)
+
+    # --- Polling ---
     async def check_and_send_news(self, context: ContextTypes.DEFAULT_TYPE):
         """
-        Fetch news and send to respective groups.
+        Poll every feed of the configured categories now (/forcecheck news).
         Context job data should contain group IDs:
-        {'crypto': id, 'stocks': id, 'forex': id, 'gold': id}
+        {'groups': {'crypto': id, 'stocks': id, 'forex': id, 'gold': id}}
+        Optional: 'categories' (subset to poll), 'digest' (gather into the pending digests).
         """
         groups = context.job.data.get('groups', {})
-        
-        for category, urls in self.feeds.items():
-            group_id = groups.get(category)
-            if not group_id:
-                continue
+        categories = context.job.data.get('categories') or list(DEFAULT_FEEDS)
+        feeds = [f for f in self.feeds_of(categories) if groups.get(f['category'])]
+        await self._poll(context, feeds, groups, context.job.data.get('digest', False))
+        await self.flush_digests(context)
 
-            for url in urls:
-                try:
-                    feed = feedparser.parse(url)
-                    # Check the latest 3 entries
-                    for entry in feed.entries[:3]:
-                        if entry.link in self.last_news_links:
-                            continue
-                            
-                        # Post News
+    async def _poll(self, context, feeds, groups, digest):
+        """Fetch `feeds` at once and post (or queue) their new entries; {url: (new, saturated)}."""
+        # Unchanged feeds come back as None
+        fetched = await self.fetcher.fetch_all([f['url'] for f in feeds])
+        dispatcher = get_dispatcher(context)
+        counts = {}
+        for feed in feeds:
+            url, category = feed['url'], feed['category']
+            if url not in fetched:
+                continue
+            parsed = fetched[url]
+            if parsed is None:
+                counts[url] = (0, False)
+                continue
+            group_id = groups[category]
+            entries = parsed.entries[:self.digest_entries_per_feed if digest else 3]
+            try:
+                if digest:
+                    new = self._queue_digest(group_id, category, entries)
+                    waiting = self.digests[group_id]['feeds']
+                    if new or url in waiting:
+                        waiting.add(url) # Validators committed when the digest is sent
+                    else:
+                        self.fetcher.commit([url])
+                else:
+                    new = 0
+                    for entry, fingerprint in self.new_entries(category, entries):
                         msg = self.format_news_message(entry, category)
-                        await context.bot.send_message(chat_id=group_id, text=msg, parse_mode='HTML')
-                        
-                        # Cache
-                        self.last_news_links.add(entry.link)
-                        # Keep cache small
-                        if len(self.last_news_links) > 500:
-                            self.last_news_links = set(list(self.last_news_links)[-200:])
-                            
-                except Exception as e:
-                    logger.error(f"Error fetching news for {category} from {url}: {e}")
+                        await dispatcher.send_message(group_id, msg, priority=NEWS, parse_mode='HTML')
+                        self.dedup.add(entry.link, category, fingerprint)
+                        new += 1
+                    self.fetcher.commit([url])
+                counts[url] = (new, bool(entries) and new == len(entries))
+            except Exception as e:
+                self.fetcher.discard([url]) # Refetched in full next time, posted entries are deduplicated
+                logger.error(f"Error sending news for {category} from {url}: {e}")
+        return counts
+
+    def new_entries(self, category, entries):
+        """(entry, fingerprint) of the entries not posted yet, by link or as near-duplicate story."""
+        for entry in entries:
+            if self.dedup.seen(entry.link):
+                continue
+            # Same story already posted from another feed
+            fingerprint = self.dedup.fingerprint(entry.get('title', ''), entry.get('summary', ''))
+            if self.dedup.near_duplicate(category, fingerprint):
+                logger.info(f"Skipping near-duplicate {category} story: {entry.get('title')}")
+                self.dedup.add(entry.link)
+                continue
+            yield entry, fingerprint
+
+    # --- Digest mode ---
+    def _queue_digest(self, group_id, category, entries):
+        """Add new entries to the group's pending digest; returns how many were added."""
+        digest = self.digests.get(group_id)
+        if digest is None:
+            digest = self.digests[group_id] = {
+                'items': {}, # link -> (category, entry, fingerprint)
+                'stories': {}, # category -> SimHashIndex, near-duplicates within the window
+                'flush_at': datetime.datetime.now() + self.digest_window,
+                'feeds': set(), # urls whose validators wait for this digest
+            }
+        added = 0
+        for entry, fingerprint in self.new_entries(category, entries):
+            if entry.link in digest['items']:
+                continue
+            stories = digest['stories'].setdefault(category, SimHashIndex(self.dedup.distance(category)))
+            if stories.find(fingerprint) is not None:
+                continue
+            stories.add(fingerprint)
+            digest['items'][entry.link] = (category, entry, fingerprint)
+            added += 1
+        return added
+
+    async def flush_digests(self, context):
+        """Send the digests whose window is over: one message per group."""
+        now = datetime.datetime.now()
+        dispatcher = get_dispatcher(context)
+        for group_id, digest in list(self.digests.items()):
+            if digest['flush_at'] > now:
+                continue
+            del self.digests[group_id]
+            items = list(digest['items'].values())
+            if not items:
+                self.fetcher.commit(digest['feeds'])
+                continue
+            msg, included = self.format_digest(items)
+            try:
+                await dispatcher.send_message(group_id, msg, priority=NEWS, parse_mode='HTML', disable_web_page_preview=True)
+            except Exception as e:
+                self.fetcher.discard(digest['feeds'])
+                logger.error(f"Error sending news digest to {group_id}: {e}")
+                continue
+            for category, entry, fingerprint in included:
+                self.dedup.add(entry.link, category, fingerprint)
+            # Entries cut by the length limit come back with the next full fetch
+            if len(included) == len(items):
+                self.fetcher.commit(digest['feeds'])
+            else:
+                self.fetcher.discard(digest['feeds'])
+            logger.info(f"News digest to {group_id}: {len(included)} of {len(items)} entries")
 
     def format_news_message(self, entry, category):
-        # Icons
-        icons = {
-            'crypto': '₿',
-            'stocks': '📈',
-            'forex': '💱',
-            'gold': '🥇'
-        }
-        icon = icons.get(category, '📰')
+        icon = ICONS.get(category, '📰')
         
         title = entry.title
         link = entry.link
@@ -81,3 +329,28 @@ class NewsAggregator:
             f"<a href='{link}'>Read More</a>"
         )
         return msg
+
+    def format_digest(self, items, limit=4096):
+        """
+        One HTML message of the newest entries, cut at `digest_max_items` and at
+        Telegram's `limit` characters. Returns (message, included items); the
+        entries left out stay unposted and compete in the next window.
+        """
+        def published(item):
+            parsed = item[1].get('published_parsed') or item[1].get('updated_parsed')
+            return tuple(parsed[:6]) if parsed else (0,)
+
+        ranked = sorted(items, key=published, reverse=True)[:self.digest_max_items]
+        categories = sorted({category for category, _, _ in ranked}, key=list(DEFAULT_FEEDS).index)
+        msg = f"📰 <b>{' / '.join(c.upper() for c in categories)} NEWS DIGEST</b>\n"
+        included = []
+        for category, entry, fingerprint in ranked:
+            line = (
+                f"\n{ICONS.get(category, '📰')} <b>{html.escape(entry.get('title', ''))}</b>\n"
+                f"<a href='{html.escape(entry.link)}'>Read More</a>\n"
+            )
+            if len(msg) + len(line) > limit:
+                break
+            msg += line
+            included.append((category, entry, fingerprint))
+        return msg, included
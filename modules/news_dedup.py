@@ -0,0 +1,225 @@
+import re
+import math
+import hashlib
+import logging
+import datetime
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track the click, not the article
+TRACKING_PARAMS = {'mod', 'ref', 'cmpid', 'ncid', 'yptr', 'guccounter', 'fbclid', 'gclid'}
+
+def normalize_link(link):
+    """Same article, same string: lower-case host, no www/fragment/tracking params/trailing slash."""
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    query = [(k, v) for k, v in parse_qsl(parts.query) if not (k.lower().startswith('utm_') or k.lower() in TRACKING_PARAMS)]
+    return urlunsplit(('https', host, parts.path.rstrip('/'), urlencode(sorted(query)), ''))
+
+# Max Hamming distance (of 64 bits) between two stories counted as the same, per category
+NEAR_DUP_DISTANCE = {'crypto': 6, 'stocks': 5, 'forex': 6, 'gold': 6}
+DEFAULT_NEAR_DUP_DISTANCE = 5
+
+STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'at', 'by', 'with', 'as', 'is',
+    'are', 'was', 'be', 'it', 'its', 'this', 'that', 'from', 'after', 'amid', 'over', 'says', 'new'
+}
+
+def link_hash(link):
+    """64 bit hash of the normalized link, as stored in `news_seen`."""
+    return int.from_bytes(hashlib.sha1(normalize_link(link).encode()).digest()[:8], 'big', signed=True)
+
+
+def story_features(title, summary=''):
+    """Weighted words of a story: title words count three times, html and stopwords dropped."""
+    features = {}
+    for text, weight in ((title, 3), (summary, 1)):
+        text = re.sub(r'<[^>]+>', ' ', text or '').lower()
+        for word in re.findall(r'[a-z0-9$%.]+', text):
+            word = word.strip('.')
+            if len(word) > 1 and word not in STOPWORDS:
+                features[word] = features.get(word, 0) + weight
+    return features
+
+def simhash(features):
+    """64 bit SimHash of {feature: weight}; similar texts differ in few bits."""
+    totals = [0] * 64
+    for feature, weight in features.items():
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            totals[bit] += weight if h >> bit & 1 else -weight
+    fingerprint = sum(1 << bit for bit in range(64) if totals[bit] > 0)
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint # Signed, fits SQLite INTEGER
+
+
+class SimHashIndex:
+    """
+    Recent story fingerprints with LSH banding for near-duplicate lookups.
+
+    The 64 bits are split in `max_distance + 1` bands; two fingerprints
+    within `max_distance` bits share at least one band exactly (pigeonhole),
+    so only stories in the same band buckets are compared. Fingerprints
+    older than `window` are evicted in insertion order.
+    """
+    def __init__(self, max_distance=DEFAULT_NEAR_DUP_DISTANCE, window_hours=48):
+        self.max_distance = max_distance
+        self.window = datetime.timedelta(hours=window_hours)
+        bands = max_distance + 1
+        width = 64 // bands
+        self.bands = [(i * width, 64 if i == bands - 1 else (i + 1) * width) for i in range(bands)]
+        self.buckets = [{} for _ in self.bands] # band -> {band value: [fingerprint, ...]}
+        self.history = deque() # (added_at, fingerprint)
+
+    def _keys(self, fingerprint):
+        fingerprint &= (1 << 64) - 1
+        return [fingerprint >> lo & ((1 << (hi - lo)) - 1) for lo, hi in self.bands]
+
+    def _evict(self, now):
+        while self.history and now - self.history[0][0] > self.window:
+            _, fingerprint = self.history.popleft()
+            for buckets, key in zip(self.buckets, self._keys(fingerprint)):
+                bucket = buckets.get(key)
+                if bucket:
+                    bucket.remove(fingerprint)
+                    if not bucket:
+                        del buckets[key]
+
+    def add(self, fingerprint, added_at=None):
+        added_at = added_at or datetime.datetime.now()
+        self._evict(added_at)
+        self.history.append((added_at, fingerprint))
+        for buckets, key in zip(self.buckets, self._keys(fingerprint)):
+            buckets.setdefault(key, []).append(fingerprint)
+
+    def find(self, fingerprint):
+        """A stored fingerprint within `max_distance` bits, or None."""
+        self._evict(datetime.datetime.now())
+        for buckets, key in zip(self.buckets, self._keys(fingerprint)):
+            for other in buckets.get(key, ()):
+                if ((fingerprint ^ other) & ((1 << 64) - 1)).bit_count() <= self.max_distance:
+                    return other
+        return None
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over 64 bit hashes (double hashing, no
+    dependencies). ~120 KB for 100k links at 1% false positives.
+    """
+    def __init__(self, capacity=100000, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, h):
+        h &= (1 << 64) - 1
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, h):
+        for pos in self._positions(h):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, h):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(h))
+
+
+class NewsDedup:
+    """
+    Remembers which news links were already posted, across restarts.
+
+    Three tiers, all O(1) per lookup:
+    - `recent`: insertion-ordered LRU of the last `memory_size` hashes
+    - `bloom`: every hash of the last `keep_days` days; a miss is definitive
+    - the `news_seen` table (primary key lookup) settles Bloom hits
+    Without a db the store is memory-only and the Bloom answer is final.
+    `purge()` (a daily job) drops old rows and rebuilds the filter, which
+    would otherwise fill up and turn every lookup into a query.
+
+    The same story under another link (cross-feed repost) is caught by
+    `near_duplicate()`: a SimHashIndex per category over the recent
+    stories, with the per category `max_distance`.
+    """
+    def __init__(self, db=None, memory_size=2000, bloom_capacity=100000, keep_days=30, max_distance=None):
+        self.db = db
+        self.memory_size = memory_size
+        self.bloom_capacity = bloom_capacity
+        self.keep_days = keep_days
+        self.max_distance = {**NEAR_DUP_DISTANCE, **(max_distance or {})}
+        self.recent = OrderedDict()
+        self.stories = {} # category -> SimHashIndex
+        self.load()
+
+    def load(self):
+        """(Re)build the Bloom filter and story indexes from the last `keep_days`, purging older rows."""
+        self.bloom = BloomFilter(self.bloom_capacity)
+        if not self.db:
+            for h in self.recent: # Memory-only: the LRU is all there is
+                self.bloom.add(h)
+            return
+        self.stories = {}
+        since = datetime.datetime.now() - datetime.timedelta(days=self.keep_days)
+        self.db.purge_news_seen(since)
+        hashes = self.db.get_news_hashes(since)
+        for h in hashes:
+            self.bloom.add(h)
+        for h in hashes[-self.memory_size:]:
+            self.recent[h] = None
+        stories = self.db.get_news_fingerprints(datetime.datetime.now() - datetime.timedelta(hours=48))
+        for row in stories:
+            seen_at = row['seen_at']
+            if isinstance(seen_at, str):
+                seen_at = datetime.datetime.fromisoformat(seen_at)
+            self._story_index(row['category']).add(row['simhash'], seen_at)
+        logger.info(f"News dedup: {len(hashes)} links, {len(stories)} recent stories loaded")
+
+    async def purge(self, context):
+        """Job: forget links older than `keep_days` and rebuild the Bloom filter, so it stays small and accurate."""
+        self.load()
+
+    def distance(self, category):
+        return self.max_distance.get(category, DEFAULT_NEAR_DUP_DISTANCE)
+
+    def _story_index(self, category):
+        index = self.stories.get(category)
+        if index is None:
+            index = self.stories[category] = SimHashIndex(self.distance(category))
+        return index
+
+    def fingerprint(self, title, summary=''):
+        return simhash(story_features(title, summary))
+
+    def near_duplicate(self, category, fingerprint):
+        """True if a story within the category's distance was posted recently."""
+        return self._story_index(category).find(fingerprint) is not None
+
+    def _remember(self, h):
+        self.recent[h] = None
+        self.recent.move_to_end(h)
+        if len(self.recent) > self.memory_size:
+            self.recent.popitem(last=False)
+
+    def seen(self, link):
+        h = link_hash(link)
+        if h in self.recent:
+            self.recent.move_to_end(h)
+            return True
+        if h not in self.bloom:
+            return False
+        if self.db and not self.db.has_news_hash(h):
+            return False # Bloom false positive
+        self._remember(h)
+        return True
+
+    def add(self, link, category=None, fingerprint=None):
+        h = link_hash(link)
+        self._remember(h)
+        self.bloom.add(h)
+        if category and fingerprint is not None:
+            self._story_index(category).add(fingerprint)
+        if self.db:
+            self.db.add_news_hash(h, category, fingerprint)
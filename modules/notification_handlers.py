@@ -1,8 +1,15 @@
 import os
+import heapq
+import asyncio
+import logging
 import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from database import BotDatabase
+from modules.dispatcher import get_dispatcher, BROADCAST
+from modules.recurrence import next_occurrence, validate
+
+logger = logging.getLogger(__name__)
 
 db = BotDatabase()
 
@@ -86,8 +93,12 @@ async def notif_freq(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return NOTIF_TIME
 
 async def notif_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    time_str = update.message.text
-    # Basic validation could be added here
+    time_str = update.message.text.strip()
+    try:
+        validate(context.user_data['notif_freq'], time_str)
+    except (ValueError, IndexError):
+        await update.message.reply_text("❌ Invalid time for this frequency, please try again (or /cancel).")
+        return NOTIF_TIME
     context.user_data['notif_time'] = time_str
     
     data = context.user_data
@@ -97,8 +108,10 @@ async def notif_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
         data['notif_msg'],
         data['notif_target'],
         data['notif_freq'],
-        data['notif_time']
+        data['notif_time'],
+        next_occurrence(data['notif_freq'], time_str, datetime.datetime.now())
     )
+    get_notification_scheduler(context).reload(context.job_queue)
     
     await update.message.reply_text(
         f"✅ **Notification Created!**\n\n"
@@ -135,6 +148,7 @@ async def list_notifs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for n in notifs:
         text += (
             f"🆔 **{n['id']}** | {n['frequency'].title()} @ {n['schedule_time']}\n"
+            f"⏭ Next: {str(n['next_run_at'])[:16] if n['next_run_at'] else '-'}\n"
             f"🎯 {n['target_groups']}\n"
             f"📝 {n['message'][:30]}...\n"
             "-------------------\n"
@@ -145,6 +159,7 @@ async def del_notif(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         nid = int(context.args[0])
         if db.delete_custom_notification(nid):
+            get_notification_scheduler(context).reload(context.job_queue)
             await update.message.reply_text(f"✅ Notification {nid} deleted.")
         else:
             await update.message.reply_text("❌ Notification not found.")
@@ -153,79 +168,134 @@ async def del_notif(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # --- SCHEDULER LOGIC ---
 
-async def notification_scheduler(context):
-    """Checks and sends custom notifications"""
-    notifs = db.get_custom_notifications()
-    now = datetime.datetime.now()
-    
-    # Load Groups
-    groups = context.job.data.get('groups', {})
-    free_group = context.job.data.get('free_group')
-    
-    all_groups = {}
-    if groups: all_groups.update(groups)
-    if free_group: all_groups['free'] = free_group
-    
-    for n in notifs:
-        should_send = False
-        freq = n['frequency']
-        sched = n['schedule_time']
-        
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+class NotificationScheduler:
+    """
+    Sends custom notifications at their `next_run_at`.
+
+    Active notifications sit in a min-heap by next run; `run()` is a one-shot
+    job armed at the earliest one, so an idle minute costs nothing no matter
+    how many notifications exist. A run is claimed in the DB by advancing
+    `next_run_at` from the planned time to the next occurrence before sending,
+    which makes every occurrence fire exactly once. Runs missed while the bot
+    was down are sent late if they are less than `misfire_grace` old.
+    """
+    JOB_NAME = "custom_notif_check"
+
+    def __init__(self, db, misfire_grace=3600):
+        self.db = db
+        self.misfire_grace = datetime.timedelta(seconds=misfire_grace)
+        self.notifs = {} # id -> row dict
+        self.heap = [] # (next_run_at, id); stale entries are skipped on pop
+        self.job_data = None
+        self.load()
+
+    def load(self):
+        now = datetime.datetime.now()
+        self.notifs = {}
+        self.heap = []
+        fixes = [] # Rows without (or with a stale) next_run_at
+        for row in self.db.get_custom_notifications():
+            n = dict(row)
+            n['next_run_at'] = _as_datetime(n['next_run_at'])
+            try:
+                if n['next_run_at'] is None or n['next_run_at'] < now - self.misfire_grace:
+                    n['next_run_at'] = next_occurrence(n['frequency'], n['schedule_time'], now)
+                    fixes.append((n['next_run_at'], n['id']))
+            except ValueError as e:
+                logger.error(f"Notification {n['id']} has an invalid schedule, skipped: {e}")
+                continue
+            if n['next_run_at'] is None:
+                continue
+            self.notifs[n['id']] = n
+            self.heap.append((n['next_run_at'], n['id']))
+        heapq.heapify(self.heap)
+        if fixes:
+            self.db.set_notification_next_runs(fixes)
+
+    def arm(self, job_queue, data=None):
+        """(Re)schedule the one-shot job at the earliest next run."""
+        if data is not None:
+            self.job_data = data
+        if not job_queue or self.job_data is None:
+            return
+        for job in job_queue.get_jobs_by_name(self.JOB_NAME):
+            job.schedule_removal()
+        if not self.heap:
+            return
+        delay = max(0.0, (self.heap[0][0] - datetime.datetime.now()).total_seconds())
+        job_queue.run_once(self.run, when=delay, data=self.job_data, name=self.JOB_NAME)
+
+    def reload(self, job_queue):
+        """Notifications added or deleted: rebuild the heap and re-arm."""
+        self.load()
+        self.arm(job_queue)
+
+    async def run(self, context):
+        """Job: send the notifications that are due, then re-arm."""
         try:
-            if freq == 'hourly':
-                # sched is "30" (minute)
-                if now.minute == int(sched):
-                    should_send = True
-                    
-            elif freq == 'daily':
-                # sched is "09:00"
-                if now.strftime("%H:%M") == sched:
-                    should_send = True
-                    
-            elif freq == 'weekly':
-                # sched is "Monday 09:00"
-                day, time = sched.split(' ')
-                if now.strftime("%A").lower() == day.lower() and now.strftime("%H:%M") == time:
-                    should_send = True
-                    
-            elif freq == 'monthly':
-                # sched is "1 09:00"
-                day, time = sched.split(' ')
-                if now.day == int(day) and now.strftime("%H:%M") == time:
-                    should_send = True
-            
-            # Prevent double sending in same minute if job runs multiple times?
-            # Job runs every 60s. Last sent check.
-            last_sent = n['last_sent']
-            if should_send:
-                # Basic debounce: if sent within last 65 seconds, skip
-                if last_sent:
-                    # Parse from DB string if needed, usually sqlite returns string for timestamp
-                    # Assuming db returns string "YYYY-MM-DD HH:MM:SS" or datetime obj
-                    if isinstance(last_sent, str):
-                        last_sent = datetime.datetime.fromisoformat(last_sent)
-                    
-                    if (now - last_sent).seconds < 70:
-                        continue # Already sent this minute
-                
-                # SEND
-                targets = []
-                t_str = n['target_groups']
-                if t_str == 'all':
-                    targets = list(all_groups.values())
+            now = datetime.datetime.now()
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                run_at, nid = heapq.heappop(self.heap)
+                n = self.notifs.get(nid)
+                if n and n['next_run_at'] == run_at:
+                    due.append(n)
+
+            targets = self._targets(context.job.data)
+            for n in due:
+                run_at = n['next_run_at']
+                try:
+                    # Next run after the planned one (not after now), so a late job does not shift the series
+                    next_run = next_occurrence(n['frequency'], n['schedule_time'], max(run_at, now - self.misfire_grace))
+                except ValueError:
+                    next_run = None
+                if not self.db.claim_notification_run(n['id'], run_at, next_run):
+                    continue # Fired elsewhere or edited meanwhile
+                n['next_run_at'] = next_run
+                if next_run:
+                    heapq.heappush(self.heap, (next_run, n['id']))
                 else:
-                    keys = t_str.split(',')
-                    for k in keys:
-                        gid = all_groups.get(k)
-                        if gid: targets.append(gid)
-                
-                # Dedup targets
-                targets = list(set(targets))
-                
-                for gid in targets:
-                    await context.bot.send_message(chat_id=gid, text=n['message'], parse_mode='HTML')
-                
-                db.update_last_sent(n['id'])
-                
-        except Exception as e:
-            print(f"Error processing notif {n['id']}: {e}")
+                    self.notifs.pop(n['id'], None)
+                await self.send(context, n, targets, run_at)
+        finally:
+            self.arm(context.job_queue, context.job.data)
+
+    @staticmethod
+    def _targets(data):
+        all_groups = dict(data.get('groups') or {})
+        if data.get('free_group'):
+            all_groups['free'] = data['free_group']
+        return all_groups
+
+    async def send(self, context, n, all_groups, run_at):
+        t_str = n['target_groups']
+        if t_str == 'all':
+            targets = list(all_groups.values())
+        else:
+            targets = [all_groups[k] for k in t_str.split(',') if all_groups.get(k)]
+        targets = list(set(targets))
+
+        dispatcher = get_dispatcher(context)
+        results = await asyncio.gather(*[
+            dispatcher.send_message(
+                gid, n['message'], priority=BROADCAST, parse_mode='HTML',
+                outbox_key=f"notif:{n['id']}:{gid}:{run_at:%Y%m%d%H%M}"
+            )
+            for gid in targets
+        ], return_exceptions=True)
+        for gid, result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to send notif {n['id']} to {gid}: {result}") # Retried by the outbox
+
+
+def get_notification_scheduler(context):
+    """The application's NotificationScheduler (created on first use)."""
+    scheduler = context.bot_data.get('notif_scheduler')
+    if scheduler is None:
+        scheduler = context.bot_data['notif_scheduler'] = NotificationScheduler(db)
+    return scheduler
@@ -0,0 +1,331 @@
+"""
+Grid / random-search optimizer for the strategy parameters
+(TechnicalAnalysis.DEFAULT_PARAMS + cooldown_minutes).
+
+Candles are packed once into shared memory; workers attach to it and only
+receive parameter dicts. Every evaluated combination is stored in a SQLite
+cache, so re-running the same sweep resumes where it stopped.
+
+Usage:
+    python -m modules.optimizer --data-dir data/ --since 2023-01-01
+    python -m modules.optimizer --mode random --samples 500 --seed 7
+"""
+import os
+import json
+import random
+import sqlite3
+import hashlib
+import argparse
+import itertools
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .market_data import timeframe_to_seconds
+from .technical_analysis import TechnicalAnalysis
+from .signals import SignalGenerator
+from .backtest import load_history, simulate_arrays, summarize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRID = {
+    'rsi_window': [7, 14, 21],
+    'sma_window': [100, 200],
+    'rsi_buy_threshold': [25, 30, 35],
+    'stop_atr_mult': [1.5, 2, 3],
+    'tp3_atr_mult': [4, 5, 6],
+    'cooldown_minutes': [60, 240],
+}
+
+# (low, high) per parameter; ints are sampled as ints
+DEFAULT_RANGES = {
+    'rsi_window': (5, 30),
+    'sma_window': (50, 300),
+    'atr_window': (7, 28),
+    'rsi_buy_threshold': (15, 40),
+    'stop_atr_mult': (1.0, 4.0),
+    'tp1_atr_mult': (1.0, 3.0),
+    'tp2_atr_mult': (2.0, 5.0),
+    'tp3_atr_mult': (3.0, 8.0),
+    'cooldown_minutes': (15, 480),
+}
+
+INDICATOR_KEYS = ('rsi_window', 'sma_window', 'atr_window')
+
+
+def grid_combinations(grid):
+    keys = sorted(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def random_combinations(ranges, samples, seed=0):
+    # Seeded so an interrupted random sweep draws the same combinations again
+    rng = random.Random(seed)
+    for _ in range(samples):
+        combo = {}
+        for key, (low, high) in sorted(ranges.items()):
+            if isinstance(low, int) and isinstance(high, int):
+                combo[key] = rng.randint(low, high)
+            else:
+                combo[key] = round(rng.uniform(low, high), 2)
+        yield combo
+
+
+def full_params(combo):
+    params = dict(TechnicalAnalysis.resolve_params(combo))
+    params['cooldown_minutes'] = combo.get('cooldown_minutes', 60)
+    return params
+
+
+def is_valid(params):
+    return params['tp1_atr_mult'] <= params['tp2_atr_mult'] <= params['tp3_atr_mult']
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+# --- Shared memory candles ---
+class SharedCandles:
+    """
+    Every symbol's candles concatenated into one shared-memory block per column.
+    Workers get `spec()` (names + offsets) and map the blocks without copying.
+    """
+    COLUMNS = {'timestamp': 'int64', 'high': 'float64', 'low': 'float64', 'close': 'float64'}
+
+    def __init__(self, frames):
+        self.symbols = list(frames)
+        lengths = [len(frames[s]) for s in self.symbols]
+        self.offsets = [0] + list(itertools.accumulate(lengths))
+        total = max(self.offsets[-1], 1)
+        self.blocks = {}
+        for col, dtype in self.COLUMNS.items():
+            shm = shared_memory.SharedMemory(create=True, size=total * np.dtype(dtype).itemsize)
+            arr = np.ndarray((total,), dtype=dtype, buffer=shm.buf)
+            for i, symbol in enumerate(self.symbols):
+                series = frames[symbol][col]
+                values = series.to_numpy(dtype='datetime64[ns]').view('int64') if col == 'timestamp' else series.to_numpy(dtype=float)
+                arr[self.offsets[i]:self.offsets[i + 1]] = values
+            self.blocks[col] = shm
+
+    def spec(self):
+        return {
+            'symbols': self.symbols,
+            'offsets': self.offsets,
+            'blocks': {col: shm.name for col, shm in self.blocks.items()},
+        }
+
+    def close(self):
+        for shm in self.blocks.values():
+            shm.close()
+            shm.unlink()
+
+
+# Worker process state (set by _init_worker)
+_worker = {}
+
+
+def _init_worker(spec, horizon_bars):
+    # Pool workers share the parent's resource tracker, which unlinks the blocks in SharedCandles.close()
+    handles = {col: shared_memory.SharedMemory(name=name) for col, name in spec['blocks'].items()}
+    total = spec['offsets'][-1]
+    columns = {
+        col: np.ndarray((max(total, 1),), dtype=SharedCandles.COLUMNS[col], buffer=shm.buf)
+        for col, shm in handles.items()
+    }
+    views = {}
+    for i, symbol in enumerate(spec['symbols']):
+        start, end = spec['offsets'][i], spec['offsets'][i + 1]
+        views[symbol] = {col: arr[start:end] for col, arr in columns.items()}
+    _worker.update(handles=handles, views=views, horizon_bars=horizon_bars, indicators={})
+
+
+def _indicators(symbol, params):
+    """Indicator arrays per (symbol, windows); reused by every threshold/multiplier combo."""
+    key = (symbol,) + tuple(params[k] for k in INDICATOR_KEYS)
+    cache = _worker['indicators']
+    if key not in cache:
+        if len(cache) > 64:
+            cache.clear()
+        v = _worker['views'][symbol]
+        df = pd.DataFrame({'high': v['high'], 'low': v['low'], 'close': v['close']}, copy=False)
+        df = TechnicalAnalysis.calculate_indicators(df, params)
+        cache[key] = (df['SMA_200'].to_numpy(), df['RSI'].to_numpy(), df['ATR'].to_numpy())
+    return cache[key]
+
+
+def _evaluate_batch(batch):
+    """Worker: evaluate a list of params (sharing indicator windows) over every symbol."""
+    results = []
+    for params in batch:
+        frames = []
+        for symbol, v in _worker['views'].items():
+            if len(v['close']) < 2:
+                continue
+            sma, rsi, atr = _indicators(symbol, params)
+            trades = simulate_arrays(
+                v['timestamp'].view('datetime64[ns]'), v['high'], v['low'], v['close'],
+                sma, rsi, atr, params['cooldown_minutes'], _worker['horizon_bars'], params
+            )
+            if not trades.empty:
+                frames.append(trades)
+        trades = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        results.append((params, summarize(trades)))
+    return results
+
+
+# --- Result cache ---
+class SweepCache:
+    def __init__(self, db_file="sweep_cache.db"):
+        self.db_file = db_file
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sweep_results (
+                dataset TEXT NOT NULL,
+                params TEXT NOT NULL,
+                metrics TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (dataset, params)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def load(self, dataset):
+        conn = sqlite3.connect(self.db_file)
+        rows = conn.execute('SELECT params, metrics FROM sweep_results WHERE dataset = ?', (dataset,)).fetchall()
+        conn.close()
+        return {p: json.loads(m) for p, m in rows}
+
+    def save(self, dataset, results):
+        conn = sqlite3.connect(self.db_file)
+        conn.executemany(
+            'INSERT OR REPLACE INTO sweep_results (dataset, params, metrics) VALUES (?, ?, ?)',
+            [(dataset, params_key(p), json.dumps(m)) for p, m in results]
+        )
+        conn.commit()
+        conn.close()
+
+
+def dataset_fingerprint(frames, timeframe, horizon_bars):
+    h = hashlib.sha1(f"{timeframe}|{horizon_bars}".encode())
+    for symbol in sorted(frames):
+        df = frames[symbol]
+        if df.empty:
+            h.update(f"{symbol}|0".encode())
+            continue
+        h.update(f"{symbol}|{len(df)}|{df['timestamp'].iloc[0]}|{df['timestamp'].iloc[-1]}|{df['close'].iloc[-1]}".encode())
+    return h.hexdigest()
+
+
+class ParameterSweep:
+    def __init__(self, frames, timeframe='15m', horizon_hours=24, workers=None, cache_file="sweep_cache.db", batch_size=16):
+        self.frames = {s: df.reset_index(drop=True) for s, df in frames.items() if not df.empty}
+        self.timeframe = timeframe
+        self.horizon_bars = max(1, int(horizon_hours * 3600 // timeframe_to_seconds(timeframe)))
+        self.workers = workers or os.cpu_count()
+        self.cache = SweepCache(cache_file)
+        self.batch_size = batch_size
+        self.dataset = dataset_fingerprint(self.frames, timeframe, self.horizon_bars)
+
+    def _batches(self, pending):
+        # Group by indicator windows so a worker computes RSI/SMA/ATR once per batch
+        pending = sorted(pending, key=lambda p: tuple(p[k] for k in INDICATOR_KEYS))
+        for _, group in itertools.groupby(pending, key=lambda p: tuple(p[k] for k in INDICATOR_KEYS)):
+            group = list(group)
+            for i in range(0, len(group), self.batch_size):
+                yield group[i:i + self.batch_size]
+
+    def run(self, combos):
+        """
+        Evaluate every combo (cached ones are skipped).
+        Returns a list of (params, metrics) for all combos.
+        """
+        wanted = {}
+        for combo in combos:
+            params = full_params(combo)
+            if is_valid(params):
+                wanted[params_key(params)] = params
+
+        done = self.cache.load(self.dataset)
+        pending = [p for k, p in wanted.items() if k not in done]
+        logger.info(f"Sweep: {len(wanted)} combos, {len(wanted) - len(pending)} cached, {len(pending)} to run")
+
+        if pending:
+            shared = SharedCandles(self.frames)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(shared.spec(), self.horizon_bars)
+                ) as pool:
+                    futures = [pool.submit(_evaluate_batch, b) for b in self._batches(pending)]
+                    finished = 0
+                    for future in as_completed(futures):
+                        results = future.result()
+                        self.cache.save(self.dataset, results)
+                        for params, metrics in results:
+                            done[params_key(params)] = metrics
+                        finished += len(results)
+                        logger.info(f"Sweep progress: {finished}/{len(pending)}")
+            finally:
+                shared.close()
+
+        return [(p, done[k]) for k, p in wanted.items() if k in done]
+
+    @staticmethod
+    def rank(results, metric='expectancy_r', min_trades=30):
+        eligible = [(p, m) for p, m in results if m.get('trades', 0) >= min_trades]
+        return sorted(eligible, key=lambda pm: pm[1].get(metric, float('-inf')), reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid/random search over strategy parameters.")
+    parser.add_argument('--mode', choices=['grid', 'random'], default='grid')
+    parser.add_argument('--grid', default=None, help="JSON dict of parameter -> list of values")
+    parser.add_argument('--ranges', default=None, help="JSON dict of parameter -> [low, high] (random mode)")
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--symbols', nargs='*')
+    parser.add_argument('--timeframe', default='15m')
+    parser.add_argument('--since', default=None)
+    parser.add_argument('--until', default=None)
+    parser.add_argument('--horizon', type=float, default=24, help="Hours to wait for Stop/TP before closing")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--data-dir', default=None, help="CSV candle cache directory")
+    parser.add_argument('--cache', default="sweep_cache.db", help="SQLite file holding sweep results")
+    parser.add_argument('--metric', default='expectancy_r')
+    parser.add_argument('--min-trades', type=int, default=30)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+    symbols = args.symbols or [s for group in SignalGenerator.DEFAULT_ASSETS.values() for s in group]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        loaded = pool.map(lambda s: load_history(s, args.timeframe, args.since, args.until, args.data_dir), symbols)
+        frames = dict(zip(symbols, loaded))
+
+    if args.mode == 'grid':
+        combos = grid_combinations(json.loads(args.grid) if args.grid else DEFAULT_GRID)
+    else:
+        ranges = {k: tuple(v) for k, v in json.loads(args.ranges).items()} if args.ranges else DEFAULT_RANGES
+        combos = random_combinations(ranges, args.samples, args.seed)
+
+    sweep = ParameterSweep(frames, args.timeframe, args.horizon, args.workers, args.cache)
+    ranked = ParameterSweep.rank(sweep.run(combos), args.metric, args.min_trades)
+
+    print(f"Top {args.top} by {args.metric} (min {args.min_trades} trades):")
+    for params, m in ranked[:args.top]:
+        print(
+            f"{m[args.metric]:>8.3f} | trades {m['trades']:>5} | TP1 {m['tp1_rate']:.0%} SL {m['sl_rate']:.0%} "
+            f"| MaxDD {m['max_drawdown_r']:.1f}R | {params_key(params)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
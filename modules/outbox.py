@@ -0,0 +1,80 @@
+import json
+import asyncio
+import logging
+import datetime
+
+from telegram.error import BadRequest, Forbidden, ChatMigrated, InvalidToken
+
+from .dispatcher import get_dispatcher
+
+logger = logging.getLogger(__name__)
+
+# Errors a retry cannot fix (blocked bot, unknown chat, bad markup...)
+PERMANENT_ERRORS = (BadRequest, Forbidden, ChatMigrated, InvalidToken)
+
+class Outbox:
+    """
+    Persistent retry queue for failed sends (the `outbox` table).
+
+    The MessageDispatcher hands over a call that failed when it was given an
+    `outbox_key`. Transient errors are retried by `drain()` with exponential
+    backoff; permanent errors, or `max_attempts` failures, end up as dead
+    letters for /deadletters. The idempotency key is unique, so the same
+    message is never queued (and sent) twice.
+    """
+    def __init__(self, db, max_attempts=6, base_delay=30, max_delay=3600, batch_size=100):
+        self.db = db
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay # Seconds before the first retry, doubled per attempt
+        self.max_delay = max_delay
+        self.batch_size = batch_size # Rows sent per drain run
+
+    def backoff(self, attempts):
+        return datetime.timedelta(seconds=min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+    def defer(self, key, method, kwargs, priority, error):
+        """Store a failed call for retry (or as dead letter if the error is permanent)."""
+        try:
+            payload = json.dumps(kwargs)
+        except TypeError:
+            logger.error(f"Outbox: {method} for {key} is not serializable, dropped ({error})")
+            return False
+        status = 'dead' if isinstance(error, PERMANENT_ERRORS) else 'pending'
+        now = datetime.datetime.now()
+        added = self.db.add_outbox(
+            key, method, kwargs.get('chat_id'), payload, priority,
+            status, 1, now + self.backoff(1), str(error)[:500]
+        )
+        if added:
+            logger.warning(f"Outbox: {key} {'dead-lettered' if status == 'dead' else 'queued for retry'}: {error}")
+        return added
+
+    async def drain(self, context):
+        """Job: retry due rows in one batch through the dispatcher."""
+        rows = self.db.get_due_outbox(datetime.datetime.now(), self.batch_size)
+        if not rows:
+            return
+        dispatcher = get_dispatcher(context)
+        results = await asyncio.gather(*[
+            dispatcher.send(r['method'], r['priority'], **json.loads(r['payload'])) for r in rows
+        ], return_exceptions=True)
+
+        now = datetime.datetime.now()
+        updates = []
+        sent = dead = 0
+        for row, result in zip(rows, results):
+            attempts = row['attempts'] + 1
+            if not isinstance(result, Exception):
+                updates.append(('sent', attempts, None, row['last_error'], now, row['id']))
+                sent += 1
+            elif isinstance(result, PERMANENT_ERRORS) or attempts >= self.max_attempts:
+                updates.append(('dead', attempts, None, str(result)[:500], None, row['id']))
+                dead += 1
+            else:
+                updates.append(('pending', attempts, now + self.backoff(attempts), str(result)[:500], None, row['id']))
+        self.db.update_outbox(updates)
+        logger.info(f"Outbox drained {len(rows)}: {sent} sent, {dead} dead, {len(rows) - sent - dead} rescheduled")
+
+    async def purge(self, context):
+        """Job: forget delivered rows after a week."""
+        self.db.purge_outbox(datetime.datetime.now() - datetime.timedelta(days=7))
@@ -1,8 +1,11 @@
 import os
+import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from database import BotDatabase
-import datetime
+from modules.dispatcher import get_dispatcher, TRANSACTIONAL
+from modules.invite_pool import get_invite_pool
+from modules.utils import asset_groups, package_assets
 
 db = BotDatabase()
 
@@ -147,7 +150,7 @@ async def handle_proof(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Tx ID: {tx_id}"
     )
     
-    await context.bot.send_photo(chat_id=ADMIN_ID, photo=file_id, caption=admin_msg, reply_markup=markup)
+    await get_dispatcher(context).send('send_photo', TRANSACTIONAL, chat_id=ADMIN_ID, photo=file_id, caption=admin_msg, reply_markup=markup)
     
     return ConversationHandler.END
 
@@ -155,22 +158,6 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("❌ Subscription process cancelled.")
     return ConversationHandler.END
 
-# Helper to generate Invite Link
-async def generate_invite_link(bot, group_id, user_id, duration_days):
-    try:
-        # Create a unique invite link for this user
-        expire = datetime.datetime.now() + datetime.timedelta(days=1) # Link valid for 1 day
-        link = await bot.create_chat_invite_link(
-            chat_id=group_id, 
-            name=f"Sub {user_id}",
-            member_limit=1,
-            expire_date=expire
-        )
-        return link.invite_link
-    except Exception as e:
-        print(f"Error generating invite link: {e}")
-        return None
-
 # Admin Callback for Transactions
 async def admin_tx_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -189,48 +176,33 @@ async def admin_tx_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if action == 'confirm':
         db.update_transaction_status(tx_id, 'confirmed')
-        db.add_subscription(user_id, pkg_id)
+        sub_id = db.add_subscription(user_id, pkg_id)
         
         # --- AUTO INVITE LOGIC ---
-        groups = {
-            'crypto': os.getenv("GROUP_CRYPTO"),
-            'stocks': os.getenv("GROUP_STOCKS"),
-            'forex': os.getenv("GROUP_FOREX"),
-            'gold': os.getenv("GROUP_GOLD")
-        }
-        
-        links = []
-        failed_groups = []
-        
-        target_assets = []
-        if assets == 'all':
-            target_assets = ['crypto', 'stocks', 'forex', 'gold']
-        else:
-            target_assets = [assets]
-            
-        for asset in target_assets:
-            gid = groups.get(asset)
-            if gid:
-                link = await generate_invite_link(context.bot, gid, user_id, tx['duration_days'])
-                if link:
-                    links.append(f"- {asset.upper()}: {link}")
-                else:
-                    failed_groups.append(asset)
+        # Links come from the pre-generated pool, claimed for all groups at once
+        groups = asset_groups()
+        target_assets = [a for a in package_assets(assets) if a in groups]
+        pool = get_invite_pool(context, db)
+        claimed = await asyncio.gather(*[
+            pool.claim(context, groups[asset], user_id, sub_id) for asset in target_assets
+        ])
+        links = [f"- {asset.upper()}: {link}" for asset, link in zip(target_assets, claimed) if link]
+        failed_groups = [asset for asset, link in zip(target_assets, claimed) if not link]
         
         invite_msg = ""
         if links:
             invite_msg = "\n\n🔗 **Join Links:**\n" + "\n".join(links)
-            # Update invite status in DB (Implementation detail: we should get the sub_id to update)
-            # For now, simplistic update:
-            # db.update_invite_status_by_user(user_id, 'sent') 
+        if sub_id and links and not failed_groups:
+            db.update_invite_status(sub_id, 'sent')
         
         if failed_groups:
              invite_msg += f"\n\n⚠️ Failed to generate links for: {', '.join(failed_groups)}. Admin will contact you."
         
         # Notify User
-        await context.bot.send_message(
-            chat_id=user_id, 
-            text=f"🎉 **Payment Accepted!**\nYour subscription is now active.{invite_msg}"
+        await get_dispatcher(context).send_message(
+            user_id,
+            f"🎉 **Payment Accepted!**\nYour subscription is now active.{invite_msg}",
+            priority=TRANSACTIONAL
         )
         
         # Update Admin
@@ -243,7 +215,7 @@ async def admin_tx_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif action == 'reject':
         db.update_transaction_status(tx_id, 'rejected')
         await query.edit_message_caption(f"{query.message.caption}\n\n❌ **REJECTED**")
-        await context.bot.send_message(chat_id=user_id, text="⚠️ **Payment Rejected.**\nPlease contact admin for more info.")
+        await get_dispatcher(context).send_message(user_id, "⚠️ **Payment Rejected.**\nPlease contact admin for more info.", priority=TRANSACTIONAL)
 
 # Handler Object
 sub_conv_handler = ConversationHandler(
@@ -0,0 +1,69 @@
+import calendar
+import datetime
+
+# Schedule formats of custom notifications and scheduled messages:
+#   hourly  "30"            minute of every hour
+#   daily   "09:00"
+#   weekly  "Monday 09:00"
+#   monthly "1 09:00"       day of month (months without that day are skipped)
+#   once    "2025-01-31 09:00"
+FREQUENCIES = ('hourly', 'daily', 'weekly', 'monthly', 'once')
+WEEKDAYS = [d.lower() for d in calendar.day_name]
+
+def _hhmm(text):
+    hour, minute = (int(x) for x in text.split(':'))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"Invalid time: {text}")
+    return hour, minute
+
+def validate(frequency, schedule_time):
+    """Raise ValueError if `schedule_time` does not fit `frequency`."""
+    next_occurrence(frequency, schedule_time, datetime.datetime(2000, 1, 1))
+
+def next_occurrence(frequency, schedule_time, after):
+    """First run strictly after `after` (naive local time); None once a one-off is past."""
+    after = after.replace(second=0, microsecond=0)
+    sched = schedule_time.strip()
+
+    if frequency == 'hourly':
+        minute = int(sched)
+        if not 0 <= minute < 60:
+            raise ValueError(f"Invalid minute: {sched}")
+        run = after.replace(minute=minute)
+        return run if run > after else run + datetime.timedelta(hours=1)
+
+    if frequency == 'daily':
+        hour, minute = _hhmm(sched)
+        run = after.replace(hour=hour, minute=minute)
+        return run if run > after else run + datetime.timedelta(days=1)
+
+    if frequency == 'weekly':
+        day, time = sched.split()
+        matches = [i for i, name in enumerate(WEEKDAYS) if len(day) >= 3 and name.startswith(day.lower())]
+        if not matches:
+            raise ValueError(f"Invalid day: {day}")
+        weekday = matches[0]
+        hour, minute = _hhmm(time)
+        run = after.replace(hour=hour, minute=minute) + datetime.timedelta(days=(weekday - after.weekday()) % 7)
+        return run if run > after else run + datetime.timedelta(days=7)
+
+    if frequency == 'monthly':
+        day, time = sched.split()
+        day = int(day)
+        if not 1 <= day <= 31:
+            raise ValueError(f"Invalid day: {day}")
+        hour, minute = _hhmm(time)
+        year, month = after.year, after.month
+        for _ in range(13):
+            if day <= calendar.monthrange(year, month)[1]:
+                run = datetime.datetime(year, month, day, hour, minute)
+                if run > after:
+                    return run
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return None
+
+    if frequency == 'once':
+        run = datetime.datetime.strptime(sched, "%Y-%m-%d %H:%M")
+        return run if run > after else None
+
+    raise ValueError(f"Unknown frequency: {frequency}")
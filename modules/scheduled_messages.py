@@ -0,0 +1,71 @@
+import logging
+import datetime
+
+from .broadcast import get_broadcast_engine
+from .recurrence import next_occurrence
+
+logger = logging.getLogger(__name__)
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+class ScheduledMessages:
+    """
+    Delivers the /schedule messages (`scheduled_messages` table) to every user.
+
+    `run()` is a job: it reads only the due rows through the
+    (is_active, next_run_at) index, claims each run by advancing next_run_at
+    and creating its broadcast in one transaction (so several processes
+    never send the same run twice), and hands the broadcast to the
+    BroadcastEngine, which paces and resumes it. Runs missed for longer than
+    `misfire_grace` are skipped to the next occurrence.
+    """
+    CHECK_SECONDS = 30
+
+    def __init__(self, db, batch_size=100, misfire_grace=3600):
+        self.db = db
+        self.batch_size = batch_size # Rows claimed per run
+        self.misfire_grace = datetime.timedelta(seconds=misfire_grace)
+        self.plan()
+
+    def plan(self):
+        """Give rows created before next_run_at existed their next run."""
+        now = datetime.datetime.now()
+        items = []
+        for row in self.db.get_unplanned_scheduled_messages():
+            try:
+                items.append((next_occurrence(row['type'], row['schedule_time'], now), row['id']))
+            except (ValueError, TypeError) as e:
+                logger.error(f"Scheduled message {row['id']} has an invalid schedule, disabled: {e}")
+                items.append((None, row['id']))
+        if items:
+            self.db.set_scheduled_next_runs(items)
+
+    async def run(self, context):
+        """Job: start a broadcast for every due scheduled message."""
+        now = datetime.datetime.now()
+        engine = None
+        while True:
+            rows = self.db.get_due_scheduled_messages(now, self.batch_size)
+            if not rows:
+                break
+            for row in rows:
+                run_at = _as_datetime(row['next_run_at'])
+                try:
+                    next_run = next_occurrence(row['type'], row['schedule_time'], max(run_at, now - self.misfire_grace))
+                except (ValueError, TypeError):
+                    next_run = None
+                if run_at < now - self.misfire_grace:
+                    # Missed (bot down): skip to the next occurrence instead of sending stale text
+                    self.db.set_scheduled_next_runs([(next_run, row['id'])])
+                    continue
+                broadcast_id = self.db.claim_scheduled_run(row['id'], row['next_run_at'], next_run, row['message'])
+                if broadcast_id is None:
+                    continue # Claimed by another process
+                engine = engine or get_broadcast_engine(context, self.db)
+                engine.start(context, broadcast_id)
+                logger.info(f"Scheduled message {row['id']} sent as broadcast #{broadcast_id}, next run {next_run}")
+            if len(rows) < self.batch_size:
+                break
@@ -0,0 +1,58 @@
+import logging
+import datetime
+
+logger = logging.getLogger(__name__)
+
+class SignalStateStore:
+    """
+    Durable cooldown state for SignalGenerator.
+
+    All rows of `signal_state` are loaded once at startup into a dict (O(1)
+    lookups). Updates only touch the dict and a dirty set; `flush()` writes
+    them back in one batch at the end of each signal cycle (write-behind).
+    """
+    FREE_GROUP_KEY = '__free_group__' # Last signal sent to the free group
+
+    def __init__(self, db=None):
+        self.db = db # BotDatabase, or None for a memory-only store
+        self.index = {}
+        self.dirty = set()
+        self.load()
+
+    def load(self):
+        if not self.db:
+            return
+        for row in self.db.get_signal_state():
+            last_sent = row['last_sent']
+            if isinstance(last_sent, str):
+                last_sent = datetime.datetime.fromisoformat(last_sent)
+            self.index[row['key']] = last_sent
+        logger.info(f"Loaded {len(self.index)} signal cooldown entries")
+
+    def get(self, key):
+        return self.index.get(key)
+
+    def touch(self, key, when=None):
+        self.index[key] = when or datetime.datetime.now()
+        self.dirty.add(key)
+
+    def elapsed(self, key, now=None):
+        """Seconds since `key` last fired (None if never)."""
+        last = self.index.get(key)
+        if last is None:
+            return None
+        return ((now or datetime.datetime.now()) - last).total_seconds()
+
+    def in_cooldown(self, key, seconds, now=None):
+        elapsed = self.elapsed(key, now)
+        return elapsed is not None and elapsed < seconds
+
+    def flush(self):
+        if not self.dirty or not self.db:
+            return
+        items = [(key, self.index[key]) for key in self.dirty]
+        try:
+            self.db.save_signal_state(items)
+            self.dirty.clear()
+        except Exception as e:
+            logger.error(f"Failed to persist signal state: {e}")
@@ -0,0 +1,236 @@
+import bisect
+import asyncio
+import logging
+import datetime
+import itertools
+
+from .market_data import MarketData
+from .dispatcher import get_dispatcher, SIGNAL
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('tp1', 'tp2', 'tp3')
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def realized_r(signal, outcome, exit_price=None):
+    """
+    Result in R (initial stop distance = 1R), with the position scaled out in
+    thirds at TP1/TP2/TP3 like the backtest. Thirds still open at expiry are
+    closed at `exit_price` (flat when unknown).
+    """
+    risk = signal['entry'] - signal['stop']
+    if risk <= 0:
+        return 0.0
+    hit = signal['hit_level']
+    r = sum(signal[level] - signal['entry'] for level in LEVELS[:hit]) / risk
+    remaining = len(LEVELS) - hit
+    if outcome == 'sl':
+        r -= remaining
+    elif outcome == 'expired' and exit_price is not None:
+        r += remaining * (exit_price - signal['entry']) / risk
+    return r / len(LEVELS)
+
+
+class LevelIndex:
+    """
+    Open signals of one symbol sorted by price level.
+
+    `stops` holds (stop, id) and `targets` (next untouched TP, id), both kept
+    sorted with bisect. A traded [low, high] range then resolves in
+    O(log n + hits): touched stops are a suffix, reached targets a prefix.
+    """
+    def __init__(self):
+        self.stops = []
+        self.targets = []
+
+    def __len__(self):
+        return len(self.stops)
+
+    def add(self, signal):
+        bisect.insort(self.stops, (signal['stop'], signal['id']))
+        if signal['hit_level'] < len(LEVELS):
+            bisect.insort(self.targets, (signal[LEVELS[signal['hit_level']]], signal['id']))
+
+    def remove(self, signal):
+        self._discard(self.stops, (signal['stop'], signal['id']))
+        if signal['hit_level'] < len(LEVELS):
+            self._discard(self.targets, (signal[LEVELS[signal['hit_level']]], signal['id']))
+
+    @staticmethod
+    def _discard(items, key):
+        i = bisect.bisect_left(items, key)
+        if i < len(items) and items[i] == key:
+            del items[i]
+
+    def stopped(self, low):
+        """Ids whose stop is at or above `low`."""
+        i = bisect.bisect_left(self.stops, (low,))
+        return [signal_id for _, signal_id in self.stops[i:]]
+
+    def reached(self, high):
+        """Ids whose next take profit is at or below `high`."""
+        i = bisect.bisect_right(self.targets, (high, float('inf')))
+        return [signal_id for _, signal_id in self.targets[:i]]
+
+
+class SignalTracker:
+    """
+    Follows every BUY signal (the `signal_ledger` table) until TP3, Stop or expiry.
+
+    Each check fetches the traded range of every symbol with open signals since
+    the previous check (one request per crypto pair, one Yahoo batch) and
+    resolves hits against the symbol's LevelIndex, so the cost per cycle grows
+    with the number of symbols, not of open signals. Progress is written back
+    in one batch and announced as replies to the original signal message.
+
+    Like the backtest, a range that touches both the Stop and a TP counts as
+    a Stop (the order of the fills inside the range is unknown). A range that
+    starts before a signal's entry (the window of an older signal on the same
+    symbol) is not applied to it, so pre-entry prices never count as hits.
+    """
+    CHECK_SECONDS = 120
+
+    def __init__(self, market_data: MarketData, db=None, max_open_hours=72):
+        self.market = market_data
+        self.db = db # BotDatabase, or None for a memory-only ledger
+        self.max_open_hours = max_open_hours # Signals still open after this are closed as expired
+        self.signals = {} # id -> signal dict, in opening order
+        self.index = {} # symbol -> LevelIndex
+        self.sources = {} # symbol -> data source
+        self.checked_at = {} # symbol -> start of the last bar covered (naive UTC)
+        self.last_price = {}
+        self._next_id = 1 # Ids of the memory-only ledger
+        self.load()
+
+    def load(self):
+        if not self.db:
+            return
+        for row in self.db.get_open_signals():
+            signal = dict(row)
+            if isinstance(signal['opened_at'], str):
+                signal['opened_at'] = datetime.datetime.fromisoformat(signal['opened_at'])
+            self._track(signal)
+        logger.info(f"Tracking {len(self.signals)} open signals")
+
+    def _track(self, signal):
+        symbol = signal['symbol']
+        self.signals[signal['id']] = signal
+        self.index.setdefault(symbol, LevelIndex()).add(signal)
+        self.sources[symbol] = signal.get('source') or 'auto'
+        # A symbol's first window starts at its oldest open signal
+        self.checked_at.setdefault(symbol, signal['opened_at'])
+
+    def open_signal(self, symbol, category, timeframe, source, levels, opened_at=None):
+        """Record a sent signal; returns its ledger id."""
+        opened_at = opened_at or utc_now()
+        if self.db:
+            signal_id = self.db.add_signal(symbol, category, timeframe, source, levels, opened_at)
+        else:
+            signal_id = self._next_id
+            self._next_id += 1
+        self._track({
+            'id': signal_id, 'symbol': symbol, 'category': category, 'timeframe': timeframe,
+            'source': source, 'opened_at': opened_at, 'hit_level': 0,
+            'chat_id': None, 'message_id': None,
+            **{k: levels[k] for k in ('entry', 'stop') + LEVELS}
+        })
+        return signal_id
+
+    def attach_message(self, signal_id, chat_id, message_id):
+        """Remember the premium group message, result updates are posted as replies to it."""
+        signal = self.signals.get(signal_id)
+        if signal:
+            signal['chat_id'] = chat_id
+            signal['message_id'] = message_id
+        if self.db:
+            self.db.set_signal_message(signal_id, chat_id, message_id)
+
+    async def check_outcomes(self, context):
+        """Job: resolve TP/Stop hits of all open signals since the last check."""
+        if not self.signals:
+            return
+        requests = {symbol: (self.sources[symbol], self.checked_at[symbol]) for symbol in self.index}
+        loop = asyncio.get_running_loop()
+        ranges = await loop.run_in_executor(None, self.market.fetch_price_ranges, requests)
+
+        now = utc_now()
+        changed = {}
+        events = [] # (signal, event) for the reply messages
+        for symbol, (low, high, last, bar_time) in ranges.items():
+            index = self.index[symbol]
+            since = requests[symbol][1]
+            self.checked_at[symbol] = bar_time # The last (maybe still open) bar is fetched again
+            self.last_price[symbol] = last
+
+            def covered(signal_id):
+                return self.signals[signal_id]['opened_at'] <= since
+
+            for signal_id in filter(covered, index.stopped(low)):
+                signal = self.signals[signal_id]
+                index.remove(signal)
+                self._close(signal, 'sl', None, now)
+                changed[signal_id] = signal
+                events.append((signal, 'sl'))
+
+            for signal_id in filter(covered, index.reached(high)):
+                signal = self.signals[signal_id]
+                index.remove(signal)
+                while signal['hit_level'] < len(LEVELS) and signal[LEVELS[signal['hit_level']]] <= high:
+                    signal['hit_level'] += 1
+                changed[signal_id] = signal
+                if signal['hit_level'] == len(LEVELS):
+                    self._close(signal, 'tp3', None, now)
+                    events.append((signal, 'tp3'))
+                else:
+                    index.add(signal)
+                    events.append((signal, f"tp{signal['hit_level']}"))
+
+        # Signals are kept in opening order, so the expired ones are a prefix
+        cutoff = now - datetime.timedelta(hours=self.max_open_hours)
+        expired = list(itertools.takewhile(lambda s: s['opened_at'] < cutoff, self.signals.values()))
+        for signal in expired:
+            self.index[signal['symbol']].remove(signal)
+            self._close(signal, 'expired', self.last_price.get(signal['symbol']), now)
+            changed[signal['id']] = signal
+            events.append((signal, 'expired'))
+
+        for symbol in [s for s, index in self.index.items() if not index]:
+            for table in (self.index, self.sources, self.checked_at, self.last_price):
+                table.pop(symbol, None)
+
+        if changed and self.db:
+            self.db.update_signals([
+                (s['hit_level'], s.get('status', 'open'), s.get('outcome'), s.get('result_r'), s.get('closed_at'), s['id'])
+                for s in changed.values()
+            ])
+        dispatcher = get_dispatcher(context)
+        for signal, event in events:
+            self._announce(dispatcher, signal, event)
+        if changed:
+            logger.info(f"Signal tracker: {len(changed)} signals updated, {len(self.signals)} open on {len(self.index)} symbols")
+
+    def _close(self, signal, outcome, exit_price, now):
+        signal['status'] = 'closed'
+        signal['outcome'] = outcome
+        signal['result_r'] = realized_r(signal, outcome, exit_price)
+        signal['closed_at'] = now
+        del self.signals[signal['id']]
+
+    def _announce(self, dispatcher, signal, event):
+        if not signal.get('message_id'):
+            return
+        display_symbol = signal['symbol'].replace('=X', '').replace('=F', '').replace('/', '')
+        if event == 'sl':
+            text = f"🛑 {display_symbol} Stop hit ({signal['stop']:,.2f})\nResult: {signal['result_r']:+.2f}R"
+        elif event == 'expired':
+            text = f"⌛ {display_symbol} closed after {self.max_open_hours}h\nResult: {signal['result_r']:+.2f}R"
+        elif event == 'tp3':
+            text = f"🏆 {display_symbol} TP3 reached ({signal['tp3']:,.2f})\nResult: {signal['result_r']:+.2f}R"
+        else:
+            text = f"🎯 {display_symbol} {event.upper()} reached ({signal[event]:,.2f})"
+        dispatcher.submit(
+            'send_message', SIGNAL,
+            chat_id=signal['chat_id'], text=text, reply_to_message_id=signal['message_id']
+        )
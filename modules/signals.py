@@ -1,103 +1,317 @@
+import time
+import zlib
+import asyncio
 import logging
 import datetime
-from .market_data import MarketData
+from .market_data import MarketData, timeframe_to_seconds, drop_open_candle
 from .technical_analysis import TechnicalAnalysis
+from .compute import ComputeBackend
+from .signal_state import SignalStateStore
+from .market_calendar import MarketCalendar
+from .signal_tracker import SignalTracker
+from .dispatcher import get_dispatcher, SIGNAL
 
 logger = logging.getLogger(__name__)
 
+class PipelineStats:
+    """Per-stage latency and queue backpressure of one signal cycle."""
+    STAGES = ('fetch', 'analyze', 'deliver')
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.duration = None
+        self.latency = {s: [] for s in self.STAGES}
+        self.blocked = {s: 0.0 for s in self.STAGES} # Time producers waited on a full queue
+        self.max_depth = {s: 0 for s in self.STAGES}
+        self.skipped = 0 # Symbols deferred because the cycle ran out of time
+
+    def record(self, stage, seconds):
+        self.latency[stage].append(seconds)
+
+    async def put(self, queue, item, stage):
+        start = time.monotonic()
+        await queue.put(item)
+        self.blocked[stage] += time.monotonic() - start
+        self.max_depth[stage] = max(self.max_depth[stage], queue.qsize())
+
+    def finish(self):
+        self.duration = time.monotonic() - self.started
+
+    def summary(self):
+        parts = [f"total {self.duration or 0:.1f}s"]
+        if self.skipped:
+            parts.append(f"deferred {self.skipped}")
+        for stage in self.STAGES:
+            samples = self.latency[stage]
+            if not samples:
+                parts.append(f"{stage} n=0")
+                continue
+            avg = sum(samples) / len(samples)
+            parts.append(
+                f"{stage} n={len(samples)} avg={avg:.2f}s max={max(samples):.2f}s "
+                f"wait={self.blocked[stage]:.1f}s depth={self.max_depth[stage]}"
+            )
+        return " | ".join(parts)
+
 class SignalGenerator:
-    def __init__(self, market_data: MarketData):
+    CLOCK_SECONDS = 300 # Candle clock tick; symbol timeframes must be multiples of it (5m, 15m, 1h, ...)
+
+    # Define Assets and their Category
+    DEFAULT_ASSETS = {
+        'crypto': ['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'BNB/USDT'],
+        'stocks': ['AAPL', 'NVDA', 'TSLA', 'MSFT', 'AMZN'],
+        'forex': ['EURUSD=X', 'GBPUSD=X', 'JPY=X', 'AUDUSD=X'],
+        'gold': ['GC=F', 'SI=F'] # Gold, Silver
+    }
+
+    def __init__(self, market_data: MarketData, params=None, cooldown_minutes=60, compute: ComputeBackend = None, state: SignalStateStore = None, db=None, tracker: SignalTracker = None):
         self.market = market_data
-        self.last_signals = {} # Cache to prevent duplicates: {symbol: timestamp}
-        self.cooldown_minutes = 60 # Don't send same signal for 1 hour
+        self.compute = compute or ComputeBackend() # Where indicators are evaluated (thread or process pool)
+        self.params = TechnicalAnalysis.resolve_params(params) # Strategy parameters (see TechnicalAnalysis.DEFAULT_PARAMS)
+        self.state = state or SignalStateStore() # Last signal time per symbol (+ free group), persisted when backed by the DB
+        self.calendar = MarketCalendar() # Session hours per category, closed markets are not fetched
+        self.tracker = tracker # Signal ledger + TP/SL follow-ups (optional)
+        self.cooldown_minutes = cooldown_minutes # Don't send same signal for 1 hour
+        self.history_limit = self.params['sma_window'] + 50 # Bars needed to warm up the trend SMA
         
         # Free Group Logic
-        self.last_free_signal_time = None
         self.free_group_cooldown_hours = 4 # Only 1 signal every 4 hours for free group
         
-        # Define Assets and their Category
-        self.assets = {
-            'crypto': ['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'BNB/USDT'],
-            'stocks': ['AAPL', 'NVDA', 'TSLA', 'MSFT', 'AMZN'],
-            'forex': ['EURUSD=X', 'GBPUSD=X', 'JPY=X', 'AUDUSD=X'],
-            'gold': ['GC=F', 'SI=F'] # Gold, Silver
-        }
+        # Symbol universe: the `symbols` table when a DB is given (managed by /addsymbol etc.)
+        self.db = db
+        if self.db:
+            self.db.seed_symbols([
+                (symbol, category, 'auto')
+                for category, symbols in self.DEFAULT_ASSETS.items() for symbol in symbols
+            ])
+
+        # Candle-close alignment
+        self.settle_seconds = 5 # Wait after the bar close so exchanges publish the final candle
+        self.spread_seconds = 30 # Fetch starts are spread over this window (no thundering herd)
+
+        # Pipeline tuning
+        self.fetch_concurrency = 4 # Parallel market data requests
+        self.queue_size = 8 # Bound of the analyze/deliver queues (backpressure)
+        self.cycle_budget = 240 # Seconds a cycle may spend fetching (capped below the CLOCK_SECONDS tick)
+        self.deferred = {} # (shard, shards) -> symbols the last cycle ran out of time for, evaluated first next cycle
+        self.last_pipeline_stats = {} # shard -> PipelineStats
 
     async def check_and_send_signals(self, context):
         """
         Main job function.
-        Context job data: {'groups': {'crypto': 123, ...}, 'free_group': 999}
+        Context job data: {'groups': {'crypto': 123, ...}, 'free_group': 999,
+                           'shard': 0, 'shards': 1, 'aligned': True}
+
+        With 'aligned' the job runs on the candle clock (see next_clock_time) and
+        only evaluates symbols whose timeframe just closed a bar inside market
+        hours; otherwise (e.g. /forcecheck) every enabled symbol is evaluated.
+
+        Runs as a 3 stage pipeline joined by bounded queues:
+        fetchers (concurrent, I/O) -> analyzer (executor, CPU) -> delivery (Telegram).
+        A slow send only fills the delivery queue; fetching/analysis keep going
+        until the queues are full (backpressure).
         """
         group_config = context.job.data.get('groups', {})
         free_group_id = context.job.data.get('free_group')
-        timeframe = '15m'
+        shard = context.job.data.get('shard', 0)
+        shards = context.job.data.get('shards', 1)
+        aligned = context.job.data.get('aligned', False)
 
-        # Iterate through categories (crypto, stocks, etc.)
-        for category, symbols in self.assets.items():
-            target_group_id = group_config.get(category)
-            
-            # Note: Even if target_group_id is missing, we might want to send to Free Group?
-            # But usually we need the premium group to exist to be "fair".
-            # We proceed if either exists.
-            
-            for symbol in symbols:
-                try:
-                    # 1. Fetch Data
-                    df = self.market.fetch_ohlcv(symbol, timeframe)
-                    if df.empty:
-                        continue
-
-                    # 2. Analyze
-                    df = TechnicalAnalysis.calculate_indicators(df)
-                    latest = df.iloc[-1]
-                    
-                    # 3. Check Conditions (BUY Logic)
-                    is_buy_signal = (
-                        latest['close'] > latest['SMA_200'] and 
-                        latest['RSI'] < 30
-                    )
-                    
-                    if is_buy_signal:
-                        # Check Duplicate (Global cooldown for symbol)
-                        last_time = self.last_signals.get(symbol)
-                        if last_time and (datetime.datetime.now() - last_time).seconds < self.cooldown_minutes * 60:
-                            continue
-                            
-                        # Update Cache
-                        self.last_signals[symbol] = datetime.datetime.now()
-                        logger.info(f"Signal generated for {symbol}")
-                        
-                        # --- SEND TO PREMIUM GROUP ---
-                        if target_group_id:
-                            premium_msg = self.format_signal_message(symbol, latest, timeframe, category, is_free=False)
-                            await context.bot.send_message(chat_id=target_group_id, text=premium_msg)
-                            
-                        # --- SEND TO FREE GROUP (Rate Limited) ---
-                        if free_group_id:
-                            now = datetime.datetime.now()
-                            # Check if enough time passed since last FREE signal
-                            if (self.last_free_signal_time is None) or \
-                               ((now - self.last_free_signal_time).seconds > self.free_group_cooldown_hours * 3600):
-                                
-                                free_msg = self.format_signal_message(symbol, latest, timeframe, category, is_free=True)
-                                await context.bot.send_message(chat_id=free_group_id, text=free_msg)
-                                
-                                self.last_free_signal_time = now
-                                logger.info(f"Signal sent to FREE GROUP for {symbol}")
-
-                except Exception as e:
-                    logger.error(f"Error processing signal for {symbol}: {e}")
+        # This shard's slice of the universe, only the timeframes whose bar just closed
+        # (plus the symbols the last cycle deferred: their closed bar was never evaluated)
+        cursor_key = (shard, shards)
+        deferred = self.deferred.pop(cursor_key, set())
+        universe = self.shard_universe(shard, shards)
+        if aligned:
+            due = self.due_timeframes(time.time(), {item[3] for item in universe})
+            universe = [
+                item for item in universe
+                if item[1] in deferred or (item[3] in due and self.bar_in_session(item[0], item[3]))
+            ]
+        if not universe:
+            return
+        shortest = min(timeframe_to_seconds(item[3]) for item in universe)
+        # Finish before the next clock tick: an overlapping run would be skipped (max_instances=1)
+        # and the bar closes of that tick lost
+        tick = (self.CLOCK_SECONDS - self.settle_seconds) * 0.8
+        budget = context.job.data.get('budget', min(self.cycle_budget, shortest * 0.8, tick))
+
+        stats = PipelineStats()
+        cycle_start = time.monotonic()
+        deadline = cycle_start + budget
+        symbol_q = asyncio.Queue()
+        analyze_q = asyncio.Queue(maxsize=self.queue_size)
+        deliver_q = asyncio.Queue(maxsize=self.queue_size)
+
+        # Deferred symbols first, fetch starts spread evenly over spread_seconds
+        ordered = sorted(universe, key=lambda item: item[1] not in deferred)
+        spread = min(self.spread_seconds, budget / 2)
+        for i, item in enumerate(ordered):
+            symbol_q.put_nowait((cycle_start + spread * i / len(ordered), item))
+
+        fetchers = [
+            asyncio.create_task(self._fetch_stage(symbol_q, analyze_q, stats, deadline))
+            for _ in range(self.fetch_concurrency)
+        ]
+        analyzer = asyncio.create_task(
+            self._analyze_stage(analyze_q, deliver_q, group_config, free_group_id, stats)
+        )
+        deliverer = asyncio.create_task(self._deliver_stage(get_dispatcher(context), deliver_q, stats))
+
+        await asyncio.gather(*fetchers)
+        await analyze_q.put(None) # Sentinel: no more candles
+        await analyzer
+        await deliver_q.put(None)
+        await deliverer
+
+        # Out of budget: the symbols left behind are evaluated first next cycle
+        skipped = symbol_q.qsize()
+        if skipped:
+            self.deferred[cursor_key] = {symbol_q.get_nowait()[1][1] for _ in range(skipped)}
+            logger.warning(f"Signal shard {shard}/{shards}: budget of {budget}s exhausted, {skipped} symbols deferred")
+        stats.skipped = skipped
+
+        self.state.flush() # Write-behind: persist cooldowns touched this cycle
+        stats.finish()
+        self.last_pipeline_stats[shard] = stats
+        logger.info(f"Signal cycle finished (shard {shard}/{shards}, {len(universe)} symbols): {stats.summary()}")
+
+    def load_universe(self):
+        """[(category, symbol, source, timeframe)] of enabled symbols."""
+        if not self.db:
+            return [
+                (category, symbol, 'auto', '15m')
+                for category, symbols in self.DEFAULT_ASSETS.items() for symbol in symbols
+            ]
+        return [
+            (r['category'], r['symbol'], r['source'], r['timeframe'] or '15m')
+            for r in self.db.get_symbols(enabled_only=True)
+        ]
+
+    def due_timeframes(self, now_ts, timeframes):
+        """Timeframes whose candle closed at the clock boundary this run belongs to."""
+        boundary = int((now_ts - self.settle_seconds) // self.CLOCK_SECONDS) * self.CLOCK_SECONDS
+        return {tf for tf in timeframes if boundary % timeframe_to_seconds(tf) == 0}
+
+    def bar_in_session(self, category, timeframe):
+        """Did the bar that just closed overlap the category's trading session?"""
+        bar_end = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.settle_seconds)
+        bar_start = bar_end - datetime.timedelta(seconds=timeframe_to_seconds(timeframe))
+        return self.calendar.is_open_during(category, bar_start, bar_end)
+
+    def next_clock_time(self, shard=0):
+        """First run of an aligned job: next clock boundary + settle delay (+1s per shard)."""
+        boundary = (int(time.time()) // self.CLOCK_SECONDS + 1) * self.CLOCK_SECONDS
+        return datetime.datetime.fromtimestamp(boundary + self.settle_seconds + shard, tz=datetime.timezone.utc)
+
+    def shard_universe(self, shard=0, shards=1):
+        """Stable split of the universe: a symbol always lands in the same shard."""
+        universe = self.load_universe()
+        if shards <= 1:
+            return universe
+        return [item for item in universe if zlib.crc32(item[1].encode()) % shards == shard]
+
+    async def _fetch_stage(self, symbol_q, analyze_q, stats, deadline):
+        loop = asyncio.get_running_loop()
+        while time.monotonic() < deadline:
+            try:
+                due_at, (category, symbol, source, timeframe) = symbol_q.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await asyncio.sleep(max(0, due_at - time.monotonic()))
+
+                # 1. Fetch Data (blocking HTTP client -> thread pool)
+                start = time.monotonic()
+                df = await loop.run_in_executor(None, self.market.fetch_ohlcv, symbol, timeframe, self.history_limit + 1, source)
+                stats.record('fetch', time.monotonic() - start)
+                df = drop_open_candle(df, timeframe) # Only evaluate fully closed bars
+                if df.empty:
+                    continue
+                await stats.put(analyze_q, (category, symbol, source, timeframe, df), 'analyze')
+            except Exception as e:
+                logger.error(f"Error fetching signal data for {symbol}: {e}")
+
+    async def _analyze_stage(self, analyze_q, deliver_q, group_config, free_group_id, stats):
+        while True:
+            item = await analyze_q.get()
+            if item is None:
+                return
+            category, symbol, source, timeframe, df = item
+            try:
+                # 2. Analyze (CPU bound -> compute backend, keeps the event loop free)
+                start = time.monotonic()
+                latest = await self.compute.evaluate(df, self.params)
+                stats.record('analyze', time.monotonic() - start)
+                if latest is None:
+                    continue
+
+                # 3. Check Duplicate (Global cooldown for symbol)
+                now = datetime.datetime.now()
+                if self.state.in_cooldown(symbol, self.cooldown_minutes * 60, now):
+                    continue
+
+                # Update Cache
+                self.state.touch(symbol, now)
+                logger.info(f"Signal generated for {symbol}")
+
+                # --- SEND TO PREMIUM GROUP ---
+                # Recorded in the ledger once delivered, the tracker follows it up to TP3 / Stop
+                target_group_id = group_config.get(category)
+                if target_group_id:
+                    signal = None
+                    if self.tracker:
+                        levels = TechnicalAnalysis.calculate_levels(latest['close'], latest['ATR'], self.params)
+                        signal = (category, timeframe, source, levels)
+                    premium_msg = self.format_signal_message(symbol, latest, timeframe, category, is_free=False)
+                    await stats.put(deliver_q, (target_group_id, premium_msg, symbol, signal), 'deliver')
+
+                # --- SEND TO FREE GROUP (Rate Limited) ---
+                if free_group_id:
+                    # Check if enough time passed since last FREE signal
+                    if not self.state.in_cooldown(SignalStateStore.FREE_GROUP_KEY, self.free_group_cooldown_hours * 3600, now):
+                        # Touch before awaiting: a concurrent shard must not pass the check meanwhile
+                        self.state.touch(SignalStateStore.FREE_GROUP_KEY, now)
+
+                        free_msg = self.format_signal_message(symbol, latest, timeframe, category, is_free=True)
+                        await stats.put(deliver_q, (free_group_id, free_msg, symbol, None), 'deliver')
+                        logger.info(f"Signal queued for FREE GROUP for {symbol}")
+
+            except Exception as e:
+                logger.error(f"Error processing signal for {symbol}: {e}")
+
+    async def _deliver_stage(self, dispatcher, deliver_q, stats):
+        while True:
+            item = await deliver_q.get()
+            if item is None:
+                return
+            chat_id, text, symbol, signal = item # signal: (category, timeframe, source, levels) to track
+            try:
+                start = time.monotonic()
+                message = await dispatcher.send_message(
+                    chat_id, text, priority=SIGNAL,
+                    outbox_key=f"signal:{symbol}:{chat_id}:{datetime.datetime.now():%Y%m%d%H%M}"
+                )
+                stats.record('deliver', time.monotonic() - start)
+                # Only published signals count in the ledger (/signalstats)
+                if signal is not None and self.tracker:
+                    signal_id = self.tracker.open_signal(symbol, *signal)
+                    if message is not None:
+                        self.tracker.attach_message(signal_id, chat_id, message.message_id)
+            except Exception as e:
+                logger.error(f"Error sending signal for {symbol} to {chat_id}: {e}")
 
     def format_signal_message(self, symbol, row, timeframe, category, is_free=False):
         price = row['close']
         atr = row['ATR'] if 'ATR' in row else price * 0.01
         
         # Calculate dynamic levels
-        entry = price
-        stop_loss = price - (atr * 2) 
-        tp1 = price + (atr * 2)
-        tp2 = price + (atr * 3)
-        tp3 = price + (atr * 5)
+        levels = TechnicalAnalysis.calculate_levels(price, atr, self.params)
+        entry = levels['entry']
+        stop_loss = levels['stop']
+        tp1 = levels['tp1']
+        tp2 = levels['tp2']
+        tp3 = levels['tp3']
         
         # Trend Analysis
         trend = TechnicalAnalysis.analyze_trend(row)
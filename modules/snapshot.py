@@ -0,0 +1,241 @@
+"""
+Incremental, compressed snapshots of bot_data.db to a directory.
+
+A snapshot takes a consistent copy of the database with the SQLite online
+backup API (safe while the bot is writing), hashes it page by page and
+writes only the pages that changed since the previous snapshot, zlib
+compressed. The output is proportional to the change volume, not to the
+database size, so a synced/mounted target directory (rclone, S3 mount,
+NFS) only receives the new delta file and the small manifest.
+
+Target layout:
+    manifest.json           page size, snapshot list (seq, file, page count, sha256)
+    000001.full.z           every page (base)
+    000002.delta.z          pages changed since 000001
+    ...
+
+A full base is written on the first run, every `full_every` snapshots, when
+the page size changes, or when the local page hashes (`<db>.snapshot`) do not
+match the target's last snapshot. `restore` replays the last base and the
+deltas after it (older chains are removed once a new base is written),
+checks the sha256 of the result and runs an integrity check.
+
+Usage:
+    python -m modules.snapshot snapshot /mnt/backup/bot
+    python -m modules.snapshot restore /mnt/backup/bot --out bot_data.db
+    python -m modules.snapshot list /mnt/backup/bot
+"""
+import os
+import json
+import asyncio
+import zlib
+import struct
+import sqlite3
+import hashlib
+import argparse
+import logging
+import datetime
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ASNP1'
+HEADER = struct.Struct('>5sBII') # magic, full, page_size, page_count
+PAGE_NO = struct.Struct('>I')
+
+def _page_digest(page):
+    return hashlib.blake2b(page, digest_size=16).digest()
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Snapshotter:
+    """Writes snapshots of `db_file` to `target` and restores them."""
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, db_file, target, full_every=50, level=6):
+        self.db_file = db_file
+        self.target = target
+        self.full_every = full_every # Bounds the delta chain a restore has to replay
+        self.level = level
+        self.state_file = f"{db_file}.snapshot" # Page hashes of the last snapshot, kept locally
+
+    # --- Manifest / local state ---
+    def manifest(self):
+        path = os.path.join(self.target, self.MANIFEST)
+        if not os.path.exists(path):
+            return {'snapshots': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'rb') as f:
+                seq, page_size = struct.unpack('>II', f.read(8))
+                data = f.read()
+        except (OSError, struct.error):
+            return None
+        return seq, page_size, [data[i:i + 16] for i in range(0, len(data), 16)]
+
+    def _save_state(self, seq, page_size, digests):
+        _write_atomic(self.state_file, struct.pack('>II', seq, page_size) + b''.join(digests))
+
+    # --- Snapshot ---
+    def _copy(self):
+        """Consistent copy of the live database (online backup API) in a temp file."""
+        fd, path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(self.db_file)))
+        os.close(fd)
+        src = sqlite3.connect(self.db_file)
+        dst = sqlite3.connect(path)
+        try:
+            src.backup(dst)
+            page_size = dst.execute('PRAGMA page_size').fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        return path, page_size
+
+    def snapshot(self):
+        """Write one snapshot; returns its manifest entry."""
+        os.makedirs(self.target, exist_ok=True)
+        manifest = self.manifest()
+        snapshots = manifest['snapshots']
+        last_seq = snapshots[-1]['seq'] if snapshots else 0
+        seq = last_seq + 1
+
+        copy, page_size = self._copy()
+        try:
+            with open(copy, 'rb') as f:
+                data = f.read()
+        finally:
+            os.remove(copy)
+        pages = [data[i:i + page_size] for i in range(0, len(data), page_size)]
+        digests = [_page_digest(p) for p in pages]
+
+        state = self._load_state()
+        since_full = next((i for i, s in enumerate(reversed(snapshots)) if s['full']), len(snapshots))
+        full = (
+            state is None or state[0] != last_seq or state[1] != page_size
+            or manifest.get('page_size') != page_size or since_full + 1 >= self.full_every
+        )
+        previous = [] if full else state[2]
+        changed = [i for i, d in enumerate(digests) if i >= len(previous) or previous[i] != d]
+
+        body = bytearray(HEADER.pack(MAGIC, int(full), page_size, len(pages)))
+        for i in changed:
+            body += PAGE_NO.pack(i)
+            body += pages[i]
+        name = f"{seq:06d}.{'full' if full else 'delta'}.z"
+        blob = zlib.compress(bytes(body), self.level)
+        _write_atomic(os.path.join(self.target, name), blob)
+
+        entry = {
+            'seq': seq,
+            'file': name,
+            'full': full,
+            'page_count': len(pages),
+            'pages': len(changed),
+            'bytes': len(blob),
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds')
+        }
+        manifest['page_size'] = page_size
+        manifest['snapshots'] = [entry] if full else snapshots + [entry]
+        # Manifest after the data file: a crash in between leaves an unreferenced file, never a broken chain
+        _write_atomic(os.path.join(self.target, self.MANIFEST), json.dumps(manifest, indent=1).encode())
+        self._save_state(seq, page_size, digests)
+        if full:
+            # Older chains are no longer needed once the new base is referenced
+            for old in snapshots:
+                path = os.path.join(self.target, old['file'])
+                if os.path.exists(path):
+                    os.remove(path)
+        logger.info(f"Snapshot {name}: {len(changed)}/{len(pages)} pages, {len(blob)} bytes")
+        return entry
+
+    async def run(self, context):
+        """Job: snapshot in the default executor, off the event loop."""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.snapshot)
+        except Exception as e:
+            logger.error(f"Snapshot to {self.target} failed: {e}")
+
+    # --- Restore ---
+    def restore(self, out, seq=None):
+        """Rebuild the database as of snapshot `seq` (default: latest) into `out`."""
+        manifest = self.manifest()
+        snapshots = [s for s in manifest['snapshots'] if seq is None or s['seq'] <= seq]
+        if not snapshots:
+            raise ValueError(f"No snapshot to restore in {self.target}")
+        start = max(i for i, s in enumerate(snapshots) if s['full'])
+        chain = snapshots[start:]
+
+        pages = []
+        for entry in chain:
+            with open(os.path.join(self.target, entry['file']), 'rb') as f:
+                body = zlib.decompress(f.read())
+            magic, full, page_size, page_count = HEADER.unpack_from(body)
+            if magic != MAGIC:
+                raise ValueError(f"{entry['file']} is not a snapshot file")
+            if full:
+                pages = []
+            pages.extend([b''] * (page_count - len(pages)))
+            del pages[page_count:]
+            pos = HEADER.size
+            while pos < len(body):
+                (page_no,) = PAGE_NO.unpack_from(body, pos)
+                pos += PAGE_NO.size
+                pages[page_no] = body[pos:pos + page_size]
+                pos += page_size
+
+        data = b''.join(pages)
+        target = chain[-1]
+        if hashlib.sha256(data).hexdigest() != target['sha256']:
+            raise ValueError(f"Restored data does not match snapshot {target['seq']} checksum")
+        _write_atomic(out, data)
+        conn = sqlite3.connect(out)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            conn.close()
+        if result != 'ok':
+            raise ValueError(f"Integrity check failed: {result}")
+        logger.info(f"Restored snapshot {target['seq']} ({len(chain)} files) to {out}")
+        return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental snapshots of the bot database.")
+    parser.add_argument('action', choices=('snapshot', 'restore', 'list'))
+    parser.add_argument('target', help="Snapshot directory")
+    parser.add_argument('--db', default='bot_data.db', help="Database to snapshot")
+    parser.add_argument('--out', default=None, help="Restore into this file (default: --db, must not exist)")
+    parser.add_argument('--seq', type=int, default=None, help="Restore this snapshot instead of the latest")
+    parser.add_argument('--full-every', type=int, default=50)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+
+    snap = Snapshotter(args.db, args.target, args.full_every)
+    if args.action == 'snapshot':
+        snap.snapshot()
+    elif args.action == 'restore':
+        out = args.out or args.db
+        if os.path.exists(out):
+            parser.error(f"{out} exists; move it away or pass --out")
+        snap.restore(out, args.seq)
+    else:
+        for s in snap.manifest()['snapshots']:
+            kind = 'full ' if s['full'] else 'delta'
+            print(f"{s['seq']:6d} {kind} {s['pages']:7d}/{s['page_count']} pages {s['bytes']:10d} B  {s['created_at']}")
+
+
+if __name__ == "__main__":
+    main()
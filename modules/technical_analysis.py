@@ -4,14 +4,35 @@ from ta.trend import SMAIndicator
 from ta.volatility import AverageTrueRange
 
 class TechnicalAnalysis:
+    # Strategy parameters shared by the live SignalGenerator, the backtester and the optimizer
+    DEFAULT_PARAMS = {
+        'rsi_window': 14,
+        'sma_window': 200,
+        'atr_window': 14,
+        'rsi_buy_threshold': 30,
+        'stop_atr_mult': 2,
+        'tp1_atr_mult': 2,
+        'tp2_atr_mult': 3,
+        'tp3_atr_mult': 5,
+    }
+
+    @staticmethod
+    def resolve_params(params=None):
+        """Fill missing keys of `params` with DEFAULT_PARAMS (always a new dict)."""
+        if not params:
+            return dict(TechnicalAnalysis.DEFAULT_PARAMS)
+        return {**TechnicalAnalysis.DEFAULT_PARAMS, **params}
+
     @staticmethod
-    def calculate_indicators(df: pd.DataFrame):
+    def calculate_indicators(df: pd.DataFrame, params=None):
         """
         Calculate RSI and MA indicators using 'ta' library.
         Adds 'RSI', 'SMA_200', 'ATR' columns to the DataFrame.
+        ('SMA_200' is the trend SMA, its window comes from params['sma_window'])
         """
         if df.empty:
             return df
+        p = TechnicalAnalysis.resolve_params(params)
         
         # Ensure Close is float
         close_prices = df['close'].astype(float)
@@ -19,19 +40,43 @@ class TechnicalAnalysis:
         low_prices = df['low'].astype(float)
 
         # Calculate RSI (14)
-        rsi_indicator = RSIIndicator(close=close_prices, window=14)
+        rsi_indicator = RSIIndicator(close=close_prices, window=p['rsi_window'])
         df['RSI'] = rsi_indicator.rsi()
         
         # Calculate SMA (200) for trend
-        sma_indicator = SMAIndicator(close=close_prices, window=200)
+        sma_indicator = SMAIndicator(close=close_prices, window=p['sma_window'])
         df['SMA_200'] = sma_indicator.sma_indicator()
         
         # Calculate ATR (14) for volatility/stops
-        atr_indicator = AverageTrueRange(high=high_prices, low=low_prices, close=close_prices, window=14)
+        atr_indicator = AverageTrueRange(high=high_prices, low=low_prices, close=close_prices, window=p['atr_window'])
         df['ATR'] = atr_indicator.average_true_range()
         
         return df
 
+    @staticmethod
+    def is_buy_signal(close, sma, rsi, params=None):
+        """
+        BUY rule: price above the long SMA and RSI oversold (pullback in uptrend).
+        Works on scalars (latest row) as well as Series/arrays (backtests).
+        """
+        p = TechnicalAnalysis.resolve_params(params)
+        return (close > sma) & (rsi < p['rsi_buy_threshold'])
+
+    @staticmethod
+    def calculate_levels(price, atr, params=None):
+        """
+        ATR based Stop/TP levels used in the signal message.
+        Works on scalars as well as arrays.
+        """
+        p = TechnicalAnalysis.resolve_params(params)
+        return {
+            'entry': price,
+            'stop': price - (atr * p['stop_atr_mult']),
+            'tp1': price + (atr * p['tp1_atr_mult']),
+            'tp2': price + (atr * p['tp2_atr_mult']),
+            'tp3': price + (atr * p['tp3_atr_mult']),
+        }
+
     @staticmethod
     def analyze_trend(row):
         if pd.isna(row['SMA_200']):
@@ -27,8 +27,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🛠 **Admin (Super Admin only):**\n"
         "/createrole, /listroles\n"
         "/createpackage, /listpackages\n"
-        "/addmember, /announce\n"
-        "/schedule"
+        "/addmember, /announce, /broadcasts, /cancelbroadcast\n"
+        "/deadletters, /retrydead\n"
+        "/schedule, /listschedule, /delschedule\n"
+        "/addsymbol, /delsymbol, /togglesymbol, /listsymbols\n"
+        "/addfeed, /delfeed, /listfeeds\n"
+        "/signalstats, /checkuninvited, /groupstats"
     )
     await update.message.reply_text(text, parse_mode='Markdown')
 
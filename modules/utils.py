@@ -10,6 +10,19 @@ load_dotenv()
 ADMIN_ID = int(os.getenv("ADMIN_USER_ID", 0))
 db = BotDatabase()
 
+ASSET_CLASSES = ['crypto', 'stocks', 'forex', 'gold']
+
+def asset_groups():
+    """{asset: premium group id} of the groups configured in .env"""
+    groups = {asset: os.getenv(f"GROUP_{asset.upper()}") for asset in ASSET_CLASSES}
+    return {asset: int(gid) for asset, gid in groups.items() if gid}
+
+def package_assets(assets):
+    """Package `assets` value ('all', 'crypto' or 'crypto,gold') -> list of asset classes."""
+    if not assets or assets == 'all':
+        return list(ASSET_CLASSES)
+    return [a.strip() for a in assets.split(',') if a.strip() in ASSET_CLASSES]
+
 def get_user_role(user_id: int):
     if user_id == ADMIN_ID:
         return "Super Admin"
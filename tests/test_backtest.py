@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from modules.backtest import apply_cooldown, simulate_arrays, max_drawdown
+
+# Default params: stop = entry - 2 ATR, TP1/2/3 = entry + 2/3/5 ATR.
+# With ATR = 1 and entry 100: stop 98, TP1 102, TP2 103, TP3 105, 1R = 2.
+
+
+def minutes(n):
+    return np.datetime64('2024-01-01T00:00') + np.arange(n) * np.timedelta64(1, 'm')
+
+
+def run(highs, lows, closes, horizon_bars=10):
+    """One BUY signal on bar 0 (close 100), then the given future bars."""
+    high = np.array([100.0, *highs])
+    low = np.array([100.0, *lows])
+    close = np.array([100.0, *closes])
+    n = len(close)
+    sma = np.full(n, 50.0) # Uptrend everywhere
+    rsi = np.full(n, 50.0)
+    rsi[0] = 20.0 # Oversold on the entry bar only
+    atr = np.ones(n)
+    return simulate_arrays(minutes(n), high, low, close, sma, rsi, atr, cooldown_minutes=0, horizon_bars=horizon_bars)
+
+
+class TestApplyCooldown:
+    def test_mutes_until_cooldown_fully_elapsed(self):
+        kept = apply_cooldown(np.array([0, 1, 2, 5]), minutes(6), 120)
+        assert kept.tolist() == [0, 2, 5]
+
+    def test_no_cooldown_keeps_everything(self):
+        candidates = np.array([0, 1, 2])
+        assert apply_cooldown(candidates, minutes(3), 0).tolist() == [0, 1, 2]
+
+    def test_empty(self):
+        assert len(apply_cooldown(np.array([], dtype=np.int64), minutes(3), 60)) == 0
+
+
+class TestSimulateArrays:
+    def test_all_targets(self):
+        trades = run(highs=[103, 106], lows=[99, 99], closes=[102, 104])
+        trade = trades.iloc[0]
+        assert trade['tp1_bar'] == 0 and trade['tp2_bar'] == 0 and trade['tp3_bar'] == 1
+        assert trade['tp3_hit'] and not trade['sl_hit']
+        assert trade['r'] == pytest.approx((1 + 1.5 + 2.5) / 3)
+        assert trade['bars_held'] == 2
+
+    def test_stop_wins_a_bar_touching_stop_and_target(self):
+        trades = run(highs=[102.5], lows=[97.5], closes=[100])
+        trade = trades.iloc[0]
+        assert trade['sl_hit'] and not trade['tp1_hit']
+        assert trade['r'] == pytest.approx(-1.0)
+
+    def test_partial_then_stop(self):
+        trades = run(highs=[102.5, 100], lows=[99, 97], closes=[101, 97])
+        trade = trades.iloc[0]
+        assert trade['tp1_hit'] and not trade['tp2_hit'] and trade['sl_hit']
+        assert trade['r'] == pytest.approx((1 - 1 - 1) / 3)
+
+    def test_open_thirds_closed_at_horizon(self):
+        trades = run(highs=[101, 101, 101], lows=[99, 99, 99], closes=[101, 101, 101], horizon_bars=2)
+        trade = trades.iloc[0]
+        assert not trade['sl_hit'] and not trade['tp1_hit']
+        assert trade['r'] == pytest.approx(0.5) # (101 - 100) / 2R on every third
+
+    def test_no_signal_on_last_bar(self):
+        assert run(highs=[], lows=[], closes=[]).empty
+
+
+def test_max_drawdown():
+    assert max_drawdown(np.array([1.0, -0.5, -1.0, 2.0, -0.5])) == pytest.approx(1.5)
+    assert max_drawdown(np.array([])) == 0.0
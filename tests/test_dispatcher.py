@@ -0,0 +1,114 @@
+import time
+import asyncio
+
+import pytest
+
+from modules import dispatcher as dispatcher_module
+from modules.dispatcher import TokenBucket, MessageDispatcher, TRANSACTIONAL, BROADCAST
+
+
+class TestTokenBucket:
+    def test_refill(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket.updated
+        assert bucket.delay(now) == 0
+        bucket.take(now)
+        bucket.take(now)
+        assert bucket.delay(now) == pytest.approx(0.5)
+        assert bucket.delay(now + 0.25) == pytest.approx(0.25)
+        assert bucket.delay(now + 0.5) == 0
+
+    def test_capped_at_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        now = bucket.updated
+        assert bucket.idle(now + 100)
+        assert bucket.tokens == 3
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        bucket.pause(5)
+        assert bucket.delay() > 4.9
+        assert not bucket.idle()
+
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def send_message(self, chat_id, text):
+        if self.fail:
+            raise RuntimeError('boom')
+        self.calls.append((chat_id, text))
+        return text
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.deferred = []
+
+    def defer(self, key, method, kwargs, priority, error):
+        self.deferred.append(key)
+
+
+def test_busy_chat_is_parked_while_others_flow(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, 'PRIVATE_RATE', 10) # Next token after 0.1s
+
+    async def scenario():
+        bot = FakeBot()
+        dispatcher = MessageDispatcher(bot)
+        first = [dispatcher.send_message(1, 'a1'), dispatcher.send_message(1, 'a2'), dispatcher.send_message(2, 'b1')]
+        results = await asyncio.gather(*first)
+        await dispatcher.stop()
+        return bot.calls, results
+
+    calls, results = asyncio.run(scenario())
+    assert results == ['a1', 'a2', 'b1']
+    assert calls == [(1, 'a1'), (2, 'b1'), (1, 'a2')] # a2 waited for chat 1's token, b1 did not
+
+
+def test_priority_order():
+    async def scenario():
+        bot = FakeBot()
+        dispatcher = MessageDispatcher(bot)
+        futures = [dispatcher.send_message(i, 'news', priority=BROADCAST) for i in (1, 2)]
+        futures.append(dispatcher.send_message(3, 'dm', priority=TRANSACTIONAL))
+        await asyncio.gather(*futures)
+        await dispatcher.stop()
+        return bot.calls
+
+    assert asyncio.run(scenario())[0] == (3, 'dm')
+
+
+def test_stop_fails_parked_calls_and_defers_keyed_ones():
+    async def scenario():
+        outbox = FakeOutbox()
+        dispatcher = MessageDispatcher(FakeBot(), outbox=outbox)
+        sent = dispatcher.send('send_message', chat_id=1, text='now')
+        parked = dispatcher.send('send_message', chat_id=1, text='later', outbox_key='reminder:1:1d') # Chat 1 waits ~1s
+        assert await sent == 'now'
+        await asyncio.sleep(0.05)
+        assert dispatcher.parked
+        await dispatcher.stop(timeout=0)
+        with pytest.raises(RuntimeError):
+            await parked
+        return dispatcher, outbox
+
+    dispatcher, outbox = asyncio.run(scenario())
+    assert outbox.deferred == ['reminder:1:1d']
+    assert not dispatcher.items and not dispatcher.parked
+    assert dispatcher.depth()['transactional'] == 0 and sum(dispatcher.pending.values()) == 0
+
+
+def test_failed_keyed_call_goes_to_outbox():
+    async def scenario():
+        outbox = FakeOutbox()
+        dispatcher = MessageDispatcher(FakeBot(fail=True), outbox=outbox)
+        with pytest.raises(RuntimeError):
+            await dispatcher.send_message(1, 'x', outbox_key='expired:7')
+        await dispatcher.stop()
+        return dispatcher, outbox
+
+    dispatcher, outbox = asyncio.run(scenario())
+    assert outbox.deferred == ['expired:7']
+    assert dispatcher.failed == 1
@@ -0,0 +1,85 @@
+import random
+import datetime
+
+from modules.news_dedup import SimHashIndex, BloomFilter, NewsDedup, simhash, story_features, link_hash
+
+
+def signed(value):
+    value &= (1 << 64) - 1
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def flip(fingerprint, bits):
+    for bit in bits:
+        fingerprint ^= 1 << bit
+    return signed(fingerprint)
+
+
+FP = signed(0xF0E1D2C3B4A59687)
+
+
+class TestSimHashIndex:
+    def test_bands(self):
+        index = SimHashIndex(max_distance=5)
+        assert len(index.bands) == 6
+        assert index.bands[0] == (0, 10) and index.bands[-1] == (50, 64)
+
+    def test_within_distance_found(self):
+        index = SimHashIndex(max_distance=5)
+        index.add(FP)
+        assert index.find(FP) == FP
+        assert index.find(flip(FP, [0, 12, 25, 38, 63])) == FP # 5 bits, 5 bands differ, one still matches
+
+    def test_one_bit_in_every_band_misses(self):
+        index = SimHashIndex(max_distance=5)
+        index.add(FP)
+        assert index.find(flip(FP, [0, 10, 20, 30, 40, 50])) is None
+
+    def test_shared_band_but_too_far(self):
+        index = SimHashIndex(max_distance=5)
+        index.add(FP)
+        assert index.find(flip(FP, range(6))) is None # Same bucket in 5 bands, distance 6
+
+    def test_eviction(self):
+        index = SimHashIndex(max_distance=3, window_hours=48)
+        now = datetime.datetime.now()
+        old, fresh = FP, flip(FP, range(20, 40))
+        index.add(old, now - datetime.timedelta(hours=49))
+        index.add(fresh, now - datetime.timedelta(hours=1))
+        assert index.find(old) is None
+        assert index.find(fresh) == fresh
+        assert len(index.history) == 1
+        assert all(old not in bucket for buckets in index.buckets for bucket in buckets.values())
+
+
+class TestBloomFilter:
+    def test_membership(self):
+        rng = random.Random(1)
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        added = [signed(rng.getrandbits(64)) for _ in range(1000)]
+        for h in added:
+            bloom.add(h)
+        assert all(h in bloom for h in added)
+        others = [signed(rng.getrandbits(64)) for _ in range(10000)]
+        false_positives = sum(h in bloom for h in others)
+        assert false_positives < 300 # ~1% expected
+
+    def test_empty(self):
+        assert link_hash('https://example.com/a') not in BloomFilter(capacity=10)
+
+
+def test_similar_stories_are_close():
+    a = simhash(story_features("Bitcoin surges past $70,000 as ETF inflows hit record"))
+    b = simhash(story_features("Bitcoin surges past $70,000 as ETF inflows hit a record high"))
+    c = simhash(story_features("Gold slips as dollar strengthens ahead of Fed minutes"))
+    distance = lambda x, y: ((x ^ y) & ((1 << 64) - 1)).bit_count()
+    assert distance(a, b) < distance(a, c)
+
+
+def test_memory_only_purge_keeps_recent_links():
+    dedup = NewsDedup(memory_size=10)
+    for i in range(20):
+        dedup.add(f"https://example.com/{i}")
+    dedup.load()
+    assert dedup.seen("https://example.com/19")
+    assert not dedup.seen("https://example.com/0") # Out of the LRU, dropped by the rebuilt filter
@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+
+from modules.recurrence import next_occurrence, validate
+
+dt = datetime.datetime
+
+
+class TestMonthEnd:
+    def test_31st_skips_short_months(self):
+        assert next_occurrence('monthly', '31 09:00', dt(2026, 1, 31, 10, 0)) == dt(2026, 3, 31, 9, 0)
+        assert next_occurrence('monthly', '31 09:00', dt(2026, 3, 31, 10, 0)) == dt(2026, 5, 31, 9, 0)
+
+    def test_29th_of_february(self):
+        assert next_occurrence('monthly', '29 09:00', dt(2027, 1, 29, 10, 0)) == dt(2027, 3, 29, 9, 0)
+        assert next_occurrence('monthly', '29 09:00', dt(2028, 1, 29, 10, 0)) == dt(2028, 2, 29, 9, 0) # Leap year
+
+    def test_year_rollover(self):
+        assert next_occurrence('monthly', '1 00:00', dt(2026, 12, 15)) == dt(2027, 1, 1)
+
+    def test_same_day_later(self):
+        assert next_occurrence('monthly', '15 18:30', dt(2026, 4, 15, 9, 0)) == dt(2026, 4, 15, 18, 30)
+
+
+class TestDst:
+    # Schedules are naive local wall-clock times: a DST change never shifts
+    # the hour a message goes out at.
+    @pytest.mark.parametrize('change', [dt(2026, 3, 8), dt(2026, 3, 29), dt(2026, 10, 25), dt(2026, 11, 1)])
+    def test_daily_keeps_wall_clock(self, change):
+        before = change - datetime.timedelta(days=1)
+        first = next_occurrence('daily', '09:00', before.replace(hour=9))
+        assert first == change.replace(hour=9)
+        assert next_occurrence('daily', '09:00', first) == change.replace(hour=9) + datetime.timedelta(days=1)
+
+    def test_time_in_spring_forward_gap(self):
+        assert next_occurrence('daily', '02:30', dt(2026, 3, 28, 3, 0)) == dt(2026, 3, 29, 2, 30)
+
+    def test_weekly_across_change(self):
+        assert next_occurrence('weekly', 'Sunday 02:30', dt(2026, 3, 22, 2, 30)) == dt(2026, 3, 29, 2, 30)
+
+    def test_hourly_through_fall_back(self):
+        assert next_occurrence('hourly', '30', dt(2026, 10, 25, 2, 45)) == dt(2026, 10, 25, 3, 30)
+
+
+class TestBasics:
+    def test_strictly_after(self):
+        assert next_occurrence('daily', '09:00', dt(2026, 5, 1, 9, 0, 30)) == dt(2026, 5, 2, 9, 0)
+
+    def test_once(self):
+        assert next_occurrence('once', '2026-05-01 09:00', dt(2026, 4, 30)) == dt(2026, 5, 1, 9, 0)
+        assert next_occurrence('once', '2026-05-01 09:00', dt(2026, 5, 1, 9, 0)) is None
+
+    def test_weekly_prefix(self):
+        assert next_occurrence('weekly', 'mon 08:00', dt(2026, 10, 19, 8, 0)) == dt(2026, 10, 26, 8, 0) # A Monday
+
+    @pytest.mark.parametrize('frequency, schedule', [
+        ('hourly', '60'), ('daily', '24:00'), ('weekly', 'Mo 09:00'), ('monthly', '32 09:00'), ('yearly', '09:00'),
+    ])
+    def test_invalid(self, frequency, schedule):
+        with pytest.raises(ValueError):
+            validate(frequency, schedule)
@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+
+import pytest
+
+from database import BotDatabase
+
+DAY = datetime.timedelta(days=1)
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A file per test: BotDatabase opens a connection per call, so ':memory:' would not persist
+    db = BotDatabase(str(tmp_path / 'bot.db'))
+    db.add_user(1, 'alice')
+    db.create_package('Monthly', 10, 30)
+    return db
+
+
+def add_sub(db, start, end, status='active'):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO subscriptions (user_id, package_id, start_date, end_date, status, invite_status) VALUES (1, 1, ?, ?, ?, 'joined')",
+        (start, end, status)
+    )
+    conn.commit()
+    sub_id = cursor.lastrowid
+    conn.close()
+    return sub_id
+
+
+def ledger(db):
+    conn = db.get_connection()
+    rows = conn.execute('SELECT subscription_id, stage, status, sent_at FROM reminder_ledger ORDER BY subscription_id, stage').fetchall()
+    conn.close()
+    return [tuple(row) for row in rows]
+
+
+def due(db, stage, days, now):
+    return sorted(sub['id'] for sub in db.get_due_reminders(stage, days, now))
+
+
+class TestDueReminders:
+    def test_windows(self, db):
+        now = datetime.datetime.now()
+        in_12h = add_sub(db, now - 30 * DAY, now + 12 * datetime.timedelta(hours=1))
+        in_2d = add_sub(db, now - 30 * DAY, now + 2 * DAY)
+        in_4d = add_sub(db, now - 30 * DAY, now + 4 * DAY)
+        add_sub(db, now - 30 * DAY, now - DAY) # Already ended
+        add_sub(db, now - 30 * DAY, now + DAY, status='expired')
+        assert due(db, '1d', 1, now) == [in_12h]
+        assert due(db, '3d', 3, now) == [in_12h, in_2d]
+        assert in_4d not in due(db, '3d', 3, now)
+
+    def test_window_opened_before_the_subscription_started(self, db):
+        now = datetime.datetime.now()
+        two_day_package = add_sub(db, now, now + 2 * DAY)
+        assert due(db, '3d', 3, now) == []
+        assert due(db, '1d', 1, now + 1.5 * DAY) == [two_day_package]
+
+    def test_claimed_stage_is_no_longer_due(self, db):
+        now = datetime.datetime.now()
+        sub = add_sub(db, now - 30 * DAY, now + 2 * DAY)
+        db.claim_reminders([(sub, '3d', 'pending')])
+        assert due(db, '3d', 3, now) == []
+        assert due(db, '1d', 1, now + 1.5 * DAY) == [sub] # Other stages are independent
+
+
+class TestClaimReminders:
+    def test_claims_once(self, db):
+        now = datetime.datetime.now()
+        a = add_sub(db, now - 30 * DAY, now + 2 * DAY)
+        b = add_sub(db, now - 30 * DAY, now + 2 * DAY)
+        assert db.claim_reminders([(a, '3d', 'pending')]) == [(a, '3d')]
+        assert db.claim_reminders([(a, '3d', 'pending'), (b, '3d', 'pending')]) == [(b, '3d')]
+        assert db.claim_reminders([(a, '3d', 'pending'), (b, '3d', 'pending')]) == []
+
+    def test_status(self, db):
+        now = datetime.datetime.now()
+        a = add_sub(db, now - 30 * DAY, now + 2 * DAY)
+        b = add_sub(db, now - 30 * DAY, now + 2 * DAY)
+        db.claim_reminders([(a, '3d', 'pending'), (b, '3d', 'pending')])
+        db.set_reminder_status([('sent', a, '3d'), ('failed', b, '3d')])
+        rows = {(sub_id, stage): (status, sent_at) for sub_id, stage, status, sent_at in ledger(db)}
+        assert rows[(a, '3d')][0] == 'sent' and rows[(a, '3d')][1] is not None
+        assert rows[(b, '3d')] == ('failed', None)
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, priority=None, outbox_key=None, **kwargs):
+        self.sent.append(outbox_key)
+
+
+def test_send_reminders_sends_the_closest_stage_once(db, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # The handler modules lifecycle imports open ./bot_data.db
+    from modules.lifecycle import SubscriptionLifecycle
+    now = datetime.datetime.now()
+    sub = add_sub(db, now - 30 * DAY, now + 12 * datetime.timedelta(hours=1)) # 1d and 3d both due
+    lifecycle = SubscriptionLifecycle(db)
+    dispatcher = FakeDispatcher()
+    asyncio.run(lifecycle.send_reminders(dispatcher))
+    asyncio.run(lifecycle.send_reminders(dispatcher))
+    assert dispatcher.sent == [f"reminder:{sub}:1d"]
+    assert [(stage, status) for _, stage, status, _ in ledger(db)] == [('1d', 'sent'), ('3d', 'skipped')]
@@ -0,0 +1,108 @@
+import os
+import json
+import sqlite3
+
+import pytest
+
+from modules.snapshot import Snapshotter
+
+
+def make_db(path, rows=2000):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, body TEXT)')
+    conn.executemany('INSERT INTO items (body) VALUES (?)', [(f"row {i} " * 10,) for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def update(path, sql, *params):
+    conn = sqlite3.connect(path)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT id, body FROM items ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'bot.db')
+    make_db(path)
+    return path
+
+
+def test_full_delta_restore_round_trip(db, tmp_path):
+    target = str(tmp_path / 'snap')
+    snap = Snapshotter(db, target)
+    first = snap.snapshot()
+    assert first['full'] and first['pages'] == first['page_count']
+    expected_first = rows(db)
+
+    update(db, 'UPDATE items SET body = ? WHERE id = 5', 'changed')
+    second = snap.snapshot()
+    assert not second['full']
+    assert 0 < second['pages'] < second['page_count']
+    assert second['bytes'] < first['bytes']
+
+    update(db, 'INSERT INTO items (body) VALUES (?)', 'x' * 5000) # Grows the file
+    third = snap.snapshot()
+    assert not third['full'] and third['page_count'] > second['page_count']
+
+    out = str(tmp_path / 'latest.db')
+    assert snap.restore(out)['seq'] == 3
+    assert rows(out) == rows(db)
+
+    out = str(tmp_path / 'first.db')
+    assert snap.restore(out, seq=1)['seq'] == 1
+    assert rows(out) == expected_first
+
+
+def test_unchanged_database_writes_empty_delta(db, tmp_path):
+    snap = Snapshotter(db, str(tmp_path / 'snap'))
+    snap.snapshot()
+    assert snap.snapshot()['pages'] == 0
+
+
+def test_full_every_starts_a_new_chain(db, tmp_path):
+    target = str(tmp_path / 'snap')
+    snap = Snapshotter(db, target, full_every=3)
+    for i in range(4):
+        update(db, 'UPDATE items SET body = ? WHERE id = 1', f"v{i}")
+        snap.snapshot()
+    snapshots = snap.manifest()['snapshots']
+    assert [(s['seq'], s['full']) for s in snapshots] == [(4, True)]
+    assert sorted(os.listdir(target)) == ['000004.full.z', 'manifest.json']
+    out = str(tmp_path / 'out.db')
+    snap.restore(out)
+    assert rows(out) == rows(db)
+
+
+def test_missing_local_state_forces_full(db, tmp_path):
+    snap = Snapshotter(db, str(tmp_path / 'snap'))
+    snap.snapshot()
+    os.remove(snap.state_file)
+    assert snap.snapshot()['full']
+
+
+def test_checksum_mismatch(db, tmp_path):
+    target = str(tmp_path / 'snap')
+    snap = Snapshotter(db, target)
+    snap.snapshot()
+    manifest = snap.manifest()
+    manifest['snapshots'][0]['sha256'] = '0' * 64
+    with open(os.path.join(target, Snapshotter.MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError, match='checksum'):
+        snap.restore(str(tmp_path / 'out.db'))
+    assert not os.path.exists(str(tmp_path / 'out.db'))
+
+
+def test_nothing_to_restore(tmp_path):
+    with pytest.raises(ValueError):
+        Snapshotter(str(tmp_path / 'bot.db'), str(tmp_path / 'empty')).restore(str(tmp_path / 'out.db'))